@@ -8,6 +8,11 @@ from a4s_eval.service.api_client import (
     mark_completed,
     mark_failed,
 )
+from a4s_eval.service.evaluation_context import (
+    context_path,
+    remove_evaluation_context,
+    save_evaluation_context,
+)
 from a4s_eval.tasks.data_metric_tasks import dataset_evaluation_task
 from a4s_eval.tasks.prediction_metric_tasks import (
     model_evaluation_task,
@@ -34,13 +39,17 @@ def poll_and_run_evaluation() -> None:
             return
 
         logger.debug(f"5. Creating groups for {len(eval_ids)} evaluations...")
+        # The context is fetched once, then read by both evaluation tasks
         groups = [
-            group(
+            prepare_evaluation.si(eval_id).on_error(handle_error.s(eval_id))
+            | group(
                 [
-                    dataset_evaluation_task.s(eval_id).on_error(
+                    dataset_evaluation_task.si(eval_id, context_path(eval_id)).on_error(
+                        handle_error.s(eval_id)
+                    ),
+                    model_evaluation_task.si(eval_id, context_path(eval_id)).on_error(
                         handle_error.s(eval_id)
                     ),
-                    model_evaluation_task.s(eval_id).on_error(handle_error.s(eval_id)),
                 ]
             )
             for eval_id in eval_ids
@@ -73,9 +82,16 @@ def poll_and_run_evaluation() -> None:
         logger.debug("=== POLL_AND_RUN_EVALUATION END ===")
 
 
+@celery_app.task
+def prepare_evaluation(evaluation_id: uuid.UUID) -> str:
+    logger.debug(f"Preparing evaluation {evaluation_id}")
+    return save_evaluation_context(evaluation_id)
+
+
 @celery_app.task
 def finalize_evaluation(evaluation_id: uuid.UUID) -> None:
     logger.debug(f"Finalizing evaluation {evaluation_id}")
+    remove_evaluation_context(evaluation_id)
     try:
         response = mark_completed(evaluation_id)
         logger.debug(
@@ -95,5 +111,7 @@ def handle_error(
 ) -> None:
     logger.error(f"Error in evaluation {evaluation_id}:")
     logger.error(f"--\n\n{request} {exc} {traceback}")
+    # Tasks still running fetch the context again if they need it
+    remove_evaluation_context(evaluation_id)
     mark_failed(evaluation_id)
     logger.error(f"Evaluation {evaluation_id} marked as failed due to error.")
@@ -59,11 +59,35 @@ class DataShape(BaseModel):
     target: Feature | None = None
     date: Feature | None = None
 
+    def column_names(self) -> list[str]:
+        """Names of the dataset columns described by this datashape.
+
+        Returns:
+            list[str]: Feature columns followed by the target and date columns,
+                without duplicates.
+        """
+        columns = [f.name for f in self.features]
+        for extra in (self.target, self.date):
+            if extra is not None:
+                columns.append(extra.name)
+        return list(dict.fromkeys(columns))
+
 
 class Dataset(BaseModel):
     pid: uuid.UUID
     shape: DataShape
     data: pd.DataFrame | None = None
+    # Version of the content of the data (HTTP validators of the download), set
+    # when loaded through the dataset cache. It identifies the content in the
+    # caches derived from the data without hashing it.
+    version: str | None = None
+    # Running statistics of the current window (a4s_eval.utils.window_stats.
+    # WindowStats), set by the evaluation tasks. Metrics may read them instead of
+    # scanning the data.
+    stats: Any | None = None
+    # Arrays of the current window shared by the metrics (a4s_eval.utils.
+    # window_context.WindowContext), set by the evaluation tasks.
+    context: Any | None = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -5,18 +5,30 @@ and includes all router modules. It provides the main entry point for the A4S Ev
 """
 
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from fastapi import APIRouter, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from a4s_eval.routers import datashape, evaluation
+from a4s_eval.service.async_api_client import aclose_async_client
 from a4s_eval.utils.logging import get_logger
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Release the pooled connections to the A4S API on shutdown."""
+    yield
+    await aclose_async_client()
+
+
 # Initialize the FastAPI application
 app = FastAPI(
     title="A4S Evaluation",
     description="AI Audit as a Service API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS middleware to allow requests from the frontend
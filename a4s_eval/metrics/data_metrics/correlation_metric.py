@@ -0,0 +1,119 @@
+"""Drift of the correlations between the numerical features.
+
+The correlation matrix of a window is read from the sums of the products of
+the features kept by the window statistics (``WindowStats`` and the bucket
+summaries), so it costs O(features^2) per window instead of a
+``DataFrame.corr`` of its rows. The correlation matrix of the reference is
+computed once per reference.
+
+A window gets the Frobenius norm of the difference between its correlation
+matrix and the one of the reference ("correlation_drift"), and each numerical
+feature the largest change of its correlation with another feature
+("correlation_change"), so the most changed pairs are the features with the
+largest changes.
+"""
+
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.reference_profile import reference_profile
+from a4s_eval.utils.window_context import window_context
+from a4s_eval.utils.window_stats import correlation_matrix, cross_products
+
+logger = get_logger()
+
+
+def frame_correlation(values: np.ndarray) -> np.ndarray:
+    """Correlation matrix of the columns of some rows.
+
+    Args:
+        values: Rows of shape (n, columns), NaN if missing
+
+    Returns:
+        np.ndarray: The correlation matrix, as ``WindowStats.correlation``
+    """
+    present = ~np.isnan(values)
+    count = np.count_nonzero(present, axis=0)
+    shift = np.nansum(values, axis=0) / np.maximum(count, 1)
+    cross, pairs_count = cross_products(values, shift)
+    total = np.nansum(values - shift, axis=0)
+    return correlation_matrix(count, total, cross, pairs_count)
+
+
+_references: dict[tuple[int, str], tuple[weakref.ref, np.ndarray]] = {}
+
+
+def reference_correlation(datashape: DataShape, reference: Dataset) -> np.ndarray:
+    """Correlation matrix of the numerical features of a reference, computed once."""
+    profile = reference_profile(datashape, reference)
+    data = reference.data
+    key = (id(data), profile.content_hash)
+    cached = _references.get(key)
+    if cached is not None and cached[0]() is data:
+        return cached[1]
+    values = np.empty((len(data), len(profile.numerical)))
+    for j, name in enumerate(profile.numerical):
+        values[:, j] = pd.to_numeric(data[name], errors="coerce")
+    correlation = frame_correlation(values)
+    _references[key] = (weakref.ref(data), correlation)
+    weakref.finalize(data, _references.pop, key, None)
+    return correlation
+
+
+@data_metric(name="Correlation drift")
+def correlation_metric(
+    datashape: DataShape, reference: Dataset, evaluated: Dataset
+) -> list[Measure]:
+    """Calculate the drift of the correlations between the numerical features.
+
+    Args:
+        datashape: The datashape of the project
+        reference: The reference dataset (model dataset)
+        evaluated: The evaluated dataset (current time window)
+
+    Returns:
+        list[Measure]: The norm of the change of the correlation matrix
+            ("correlation_drift") and the largest change of the correlations of
+            each numerical feature ("correlation_change"). Changes are only
+            measured on pairs with a correlation on both sides.
+    """
+    context = window_context(datashape, evaluated)
+    names = [feature.name for feature in context.numerical_features]
+    if len(names) < 2 or len(evaluated.data) == 0:
+        return []
+
+    if evaluated.stats is not None:
+        correlation = evaluated.stats.correlation()
+    else:
+        correlation = frame_correlation(context.numerical_matrix)
+    change = np.abs(correlation - reference_correlation(datashape, reference))
+    np.fill_diagonal(change, np.nan)
+    measured = ~np.isnan(change)
+    if not measured.any():
+        return []
+
+    measures = [
+        Measure(
+            name="correlation_drift",
+            score=float(np.sqrt(np.sum(change[measured] ** 2))),
+            time=context.time,
+        )
+    ]
+    largest = np.max(np.where(measured, change, -np.inf), axis=1)
+    for name, score in zip(names, largest.tolist()):
+        if np.isfinite(score):
+            measures.append(
+                Measure(
+                    name="correlation_change",
+                    score=score,
+                    time=context.time,
+                    feature_pid=context.feature_pids.get(name, None),
+                )
+            )
+    return measures
@@ -1,3 +1,6 @@
+from functools import partial
+
+import numpy as np
 import pandas as pd
 from scipy.spatial.distance import jensenshannon
 from scipy.stats import wasserstein_distance
@@ -5,7 +8,21 @@ from scipy.stats import wasserstein_distance
 from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
 from a4s_eval.data_model.measure import Measure
 from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.env import DRIFT_PERMUTATIONS
 from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.permutation import categorical_p_value, numerical_p_value
+from a4s_eval.utils.reference_profile import (
+    ReferenceProfile,
+    category_counts,
+    reference_profile,
+)
+from a4s_eval.utils.sketches import (
+    CategorySketch,
+    FrameSketch,
+    KLLSketch,
+    aligned_counts,
+)
+from a4s_eval.utils.window_context import window_context
 
 logger = get_logger()
 
@@ -28,6 +45,75 @@ def numerical_drift_test(x_ref: "pd.Series[float]", x_new: "pd.Series[float]") -
     return distance
 
 
+def numerical_drift_tests(reference: ReferenceProfile, x_new: np.ndarray) -> np.ndarray:
+    """Wasserstein distances between the columns of two samples.
+
+    Vectorized version of ``numerical_drift_test`` over several features. The
+    distance is the area between the two empirical CDFs. Between two consecutive
+    window values, the window CDF is a constant ``c`` and the reference CDF
+    crosses ``c`` at a known reference value, so the area only needs the
+    integral of the reference CDF at these three points.
+
+    Args:
+        reference: Profile of the reference, whose numerical features are compared
+        x_new: New values of the numerical features, of shape (n, features)
+
+    Returns:
+        np.ndarray: Distance of each feature, NaN for the features with missing
+            values, as with ``numerical_drift_test``
+
+    Raises:
+        ValueError: If one of the samples is empty
+    """
+    ref_values = reference.sorted_values
+    m, n = len(ref_values), len(x_new)
+    if m == 0 or n == 0:
+        raise ValueError("Distribution can't be empty.")
+
+    x_new = np.sort(x_new, axis=0)
+    missing = reference.missing | np.isnan(x_new).any(axis=0)
+
+    # Interval i goes from the i-th window value to the next one, and starts
+    # and ends with the values only in the reference
+    low = np.minimum(ref_values[0], x_new[0])
+    high = np.maximum(ref_values[-1], x_new[-1])
+    starts = np.concatenate([low[None], x_new])
+    ends = np.concatenate([x_new, high[None]])
+    x_integrals = reference.cdf_integrals(x_new)
+    start_integrals = np.concatenate([np.zeros((1, len(low))), x_integrals])
+    end_integrals = np.concatenate(
+        [
+            x_integrals,
+            (reference.integrals[-1] + high - ref_values[-1])[None],
+        ]
+    )
+
+    # Window CDF on each interval, and number of reference values from which
+    # the reference CDF is at least as high
+    i = np.arange(n + 1)
+    window_cdf = (i / n)[:, None]
+    crossing = -(-i * m // n)
+    crossing_values = ref_values[np.maximum(crossing - 1, 0)]
+    crossing_values = np.where((crossing > 0)[:, None], crossing_values, starts)
+    crossing_integrals = reference.integrals[np.maximum(crossing - 1, 0)]
+    below = crossing_values <= starts
+    above = crossing_values >= ends
+    crossing_values = np.clip(crossing_values, starts, ends)
+    crossing_integrals = np.where(
+        below, start_integrals, np.where(above, end_integrals, crossing_integrals)
+    )
+
+    areas = (
+        window_cdf * (crossing_values - starts)
+        - (crossing_integrals - start_integrals)
+        + (end_integrals - crossing_integrals)
+        - window_cdf * (ends - crossing_values)
+    )
+    distances = areas.sum(axis=0)
+    distances[missing] = np.nan
+    return distances
+
+
 def categorical_drift_test(x_ref: "pd.Series[int]", x_new: "pd.Series[int]") -> float:
     """Calculate drift between two categorical distributions using Jensen-Shannon distance.
 
@@ -42,23 +128,122 @@ def categorical_drift_test(x_ref: "pd.Series[int]", x_new: "pd.Series[int]") ->
         f"Computing categorical drift test - Reference shape: {x_ref.shape}, New shape: {x_new.shape}"
     )
 
-    # Get all unique values from both series
-    all_categories = pd.Index(x_ref.unique()).union(pd.Index(x_new.unique()))
-    logger.debug(f"Total unique categories: {len(all_categories)}")
-
-    # Compute normalized value counts for both distributions
-    ref_counts = x_ref.value_counts(normalize=True)
-    new_counts = x_new.value_counts(normalize=True)
+    ref_counts, new_counts = category_counts(x_ref, x_new)
+    logger.debug(f"Total unique categories: {len(ref_counts)}")
 
-    # Reindex to ensure both have the same categories (fill missing with 0)
-    ref_dist = ref_counts.reindex(all_categories, fill_value=0.0)
-    new_dist = new_counts.reindex(all_categories, fill_value=0.0)
-
-    distance = jensenshannon(ref_dist.to_numpy(), new_dist.to_numpy())
+    distance = jensenshannon(ref_counts, new_counts)
     logger.debug(f"Jensen-Shannon distance computed: {distance}")
     return distance
 
 
+def categorical_drift_from_counts(
+    ref_counts: np.ndarray, new_counts: np.ndarray
+) -> float:
+    """Calculate the Jensen-Shannon distance between two vectors of category counts.
+
+    Gives the same distance as ``categorical_drift_test`` on the underlying values,
+    when both vectors count the same categories.
+
+    Args:
+        ref_counts: Counts of the categories in the reference distribution
+        new_counts: Counts of the same categories in the new distribution
+
+    Returns:
+        float: Jensen-Shannon distance between the distributions
+    """
+    return jensenshannon(ref_counts, new_counts)
+
+
+def numerical_drift_from_sketches(ref: KLLSketch, new: KLLSketch) -> float:
+    """Approximate the Wasserstein distance between two distributions from sketches.
+
+    The distance is computed between the weighted samples kept by the sketches.
+    It is exact when both sketches hold at most ``k`` values. Otherwise, with
+    rank errors ``eps_ref`` and ``eps_new`` (about ``2 / k`` each), the error is
+    at most ``(eps_ref + eps_new)`` times the range of the values.
+
+    Args:
+        ref: Sketch of the reference distribution
+        new: Sketch of the new distribution
+
+    Returns:
+        float: Approximate Wasserstein distance, NaN if a sketch is empty
+    """
+    if ref.n == 0 or new.n == 0:
+        return np.nan
+    ref_items, ref_weights = ref.weighted_items()
+    new_items, new_weights = new.weighted_items()
+    return wasserstein_distance(ref_items, new_items, ref_weights, new_weights)
+
+
+def categorical_drift_from_tables(ref: CategorySketch, new: CategorySketch) -> float:
+    """Calculate the Jensen-Shannon distance between two sketches of category counts.
+
+    Exact when both sketches count their values exactly. Otherwise the values out
+    of the heavy hitters of both sketches are counted in one category.
+
+    Args:
+        ref: Counts of the categories in the reference distribution
+        new: Counts of the categories in the new distribution
+
+    Returns:
+        float: Jensen-Shannon distance between the distributions, NaN if a
+            sketch is empty
+    """
+    ref_counts, new_counts = aligned_counts(ref, new)
+    if ref_counts.sum() == 0 or new_counts.sum() == 0:
+        return np.nan
+    return categorical_drift_from_counts(ref_counts, new_counts)
+
+
+def sketch_drift_metric(
+    datashape: DataShape,
+    shape: DataShape,
+    reference: FrameSketch,
+    window: FrameSketch,
+    date: pd.Timestamp,
+) -> list[Measure]:
+    """Approximate the drift of all features from summaries of the datasets.
+
+    Counterpart of ``data_drift_metric`` for datasets that are streamed rather
+    than loaded. The measures have the same names. Missing values are left out.
+
+    Args:
+        datashape: Datashape of the project
+        shape: Datashape of the evaluated dataset, which gives the feature pids
+        reference: Summary of the reference dataset
+        window: Summary of the rows of the window
+        date: Last date of the rows of the window
+
+    Returns:
+        list[Measure]: Drift measures of the numerical and categorical features
+    """
+    feature_pids = {feature.name: feature.pid for feature in shape.features}
+    metrics = []
+    for feature in datashape.features:
+        if feature.name in window.sketches:
+            metric = Measure(
+                name="wasserstein_distance",
+                score=numerical_drift_from_sketches(
+                    reference.sketches[feature.name], window.sketches[feature.name]
+                ),
+                time=date.to_pydatetime(),
+            )
+        elif feature.name in window.counts:
+            metric = Measure(
+                name="jensenshannon",
+                score=categorical_drift_from_tables(
+                    reference.counts[feature.name], window.counts[feature.name]
+                ),
+                time=date.to_pydatetime(),
+            )
+        else:
+            continue
+        metric.feature_pid = feature_pids.get(feature.name, None)
+        metrics.append(metric)
+    return metrics
+
+
 def feature_drift_test(
     x_ref: "pd.Series[float]",
     x_new: "pd.Series[float]",
@@ -129,17 +314,25 @@ def data_drift_metric(
     )
 
     # Get the current date from the evaluated dataset
-    date_feature = datashape.date.name
-    date = pd.to_datetime(evaluated.data[date_feature]).max()
+    context = window_context(datashape, evaluated)
+    date = context.date
     logger.debug(f"Evaluation date: {date}")
 
     metrics = []
     logger.debug(f"Processing {len(reference.shape.features)} features")
 
-    # Get feature name / feature pid mapping from test dataset
-    test_feature_name_pid_mapping = {
-        _feature.name: _feature.pid for _feature in evaluated.shape.features
-    }
+    # The reference is only read through its profile, shared by the windows.
+    # Distances of all the numerical features are computed at once.
+    profile = reference_profile(datashape, reference)
+    numerical_scores = {}
+    if profile.numerical:
+        distances = numerical_drift_tests(profile, context.numerical_matrix)
+        numerical_scores = dict(zip(profile.numerical, distances.tolist()))
+
+    # Without window statistics, the window is encoded on the first
+    # categorical feature
+    encoded = None
+    counts = None
 
     # Loop through all features in the project expected datashape
     for feature in datashape.features:
@@ -147,17 +340,68 @@ def data_drift_metric(
             f"Processing feature: {feature.name} (type: {feature.feature_type})"
         )
         feature_type = feature.feature_type
-        x_ref_feature = reference.data[feature.name]
-        x_new_feature = evaluated.data[feature.name]
-
-        metric = feature_drift_test(x_ref_feature, x_new_feature, feature_type, date)
+        stats = evaluated.stats
+        if stats is not None and feature.name in stats.categories:
+            # Counts of the window are kept up to date by the window statistics,
+            # without the missing values (last count)
+            ref_counts = stats.reference_counts[feature.name][:-1]
+            new_counts = stats.category_counts(feature.name)[:-1]
+            score = categorical_drift_from_counts(ref_counts, new_counts)
+            test = partial(categorical_p_value, ref_counts, new_counts)
+            metric = Measure(
+                name="jensenshannon", score=score, time=date.to_pydatetime()
+            )
+        elif feature.name in profile.categories:
+            if encoded is None:
+                # All the categorical features of the window are counted at once
+                encoded = profile.encode_frame(evaluated.data)
+                counts = encoded.counts()
+            ref_counts = encoded.reference_counts[feature.name][:-1]
+            new_counts = counts[encoded.slices[feature.name]][:-1]
+            score = categorical_drift_from_counts(ref_counts, new_counts)
+            test = partial(categorical_p_value, ref_counts, new_counts)
+            metric = Measure(
+                name="jensenshannon", score=score, time=date.to_pydatetime()
+            )
+        elif feature.name in numerical_scores:
+            metric = Measure(
+                name="wasserstein_distance",
+                score=numerical_scores[feature.name],
+                time=date.to_pydatetime(),
+            )
+            test = partial(
+                numerical_p_value,
+                profile.values(feature.name),
+                context.column(feature.name),
+            )
+        elif feature_type == FeatureType.TEXT:
+            # Measured by the "Text drift" metric
+            continue
+        else:
+            test = None
+            x_ref_feature = reference.data[feature.name]
+            x_new_feature = evaluated.data[feature.name]
+            metric = feature_drift_test(
+                x_ref_feature, x_new_feature, feature_type, date
+            )
 
         # Set correct feature pid (from test dataset)
-        metric.feature_pid = test_feature_name_pid_mapping.get(feature.name, None)
+        metric.feature_pid = context.feature_pids.get(feature.name, None)
         metrics.append(metric)
         logger.debug(
             f"Added metric for feature {feature.name}: {metric.name} = {metric.score}"
         )
 
+        # Significance of the distance, from random splits of the two samples
+        if DRIFT_PERMUTATIONS and test is not None and np.isfinite(metric.score):
+            metrics.append(
+                Measure(
+                    name="p_value",
+                    score=test(DRIFT_PERMUTATIONS),
+                    time=date.to_pydatetime(),
+                    feature_pid=metric.feature_pid,
+                )
+            )
+
     logger.debug(f"Data drift evaluation completed - Generated {len(metrics)} metrics")
     return metrics
@@ -1,97 +1,341 @@
-#importing the necessary libraries
+"""KL divergence and related divergences between the reference and a window.
+
+Numerical features are counted on histogram bins fixed on the range of the
+reference (the bins of its profile), plus one bin for the window values below
+and one for the values above that range. Categorical features are compared on
+the counts of their categories. Missing values are left out.
+
+The counts of a window come from the window statistics kept by the evaluation
+tasks, so the rows are not read again, and every divergence of every feature is
+computed at once on the matrix of the counts. Counts are smoothed by ``EPS`` so
+the divergences stay finite when a bin is empty on one side.
+
+``kl_numeric``, ``kl_categorical`` and ``compute_kl_for_column`` compare two
+samples directly, column by column.
+"""
+
 import os
+from typing import Mapping
+
 import numpy as np
 import pandas as pd
 from scipy.stats import entropy
 
-# Create a folder named "results", if it does not already exist
-os.makedirs("results", exist_ok=True)
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.counts import EPS, stack_counts
+from a4s_eval.utils.env import WINDOW_STATS_BINS
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.reference_profile import category_counts, reference_profile
+from a4s_eval.utils.sketches import FrameSketch, aligned_counts
+from a4s_eval.utils.window_context import window_context
+from a4s_eval.utils.window_stats import WindowStats
+
+logger = get_logger()
+
+# Names of the measures, in the order they are returned for each feature
+DIVERGENCES = (
+    "kl_divergence",
+    "symmetric_kl_divergence",
+    "js_divergence",
+    "hellinger_distance",
+)
 
 
-def _to_probs(counts, eps=1e-10):
+def _to_probs(counts, eps=EPS):
     # Turn counts into probabilities safely, even if all counts are zero
     arr = np.array(counts, dtype=float) + eps
     s = arr.sum()
     if s == 0:
-        
         # If all counts were zero, return equal probabilities,otherwise, normalize counts to sum to 1
         return np.ones_like(arr) / len(arr)
     return arr / s
 
 
+def divergences(
+    p_counts: np.ndarray, q_counts: np.ndarray, mask: np.ndarray | None = None
+) -> dict[str, np.ndarray]:
+    """Divergences between the rows of two matrices of counts.
+
+    Args:
+        p_counts: Counts of the reference, one row per feature
+        q_counts: Counts of the window on the same bins
+        mask: Whether each bin exists, when rows of different lengths are
+            padded to the same length. All the bins exist if None.
+
+    Returns:
+        dict[str, np.ndarray]: Each divergence of ``DIVERGENCES`` for each row,
+            NaN for the rows without counts on one side
+    """
+    p_counts = np.asarray(p_counts, dtype=float)
+    q_counts = np.asarray(q_counts, dtype=float)
+    if mask is None:
+        mask = np.ones(p_counts.shape, dtype=bool)
+    empty = (np.where(mask, p_counts, 0.0).sum(axis=1) == 0) | (
+        np.where(mask, q_counts, 0.0).sum(axis=1) == 0
+    )
+
+    p = np.where(mask, p_counts + EPS, 0.0)
+    q = np.where(mask, q_counts + EPS, 0.0)
+    p /= np.maximum(p.sum(axis=1, keepdims=True), EPS)
+    q /= np.maximum(q.sum(axis=1, keepdims=True), EPS)
+    # Padded bins have no mass, their log is never used
+    log_p = np.log(np.where(mask, p, 1.0))
+    log_q = np.log(np.where(mask, q, 1.0))
+    log_m = np.log(np.where(mask, (p + q) / 2, 1.0))
+
+    kl_pq = (p * (log_p - log_q)).sum(axis=1)
+    kl_qp = (q * (log_q - log_p)).sum(axis=1)
+    results = {
+        "kl_divergence": kl_pq,
+        "symmetric_kl_divergence": kl_pq + kl_qp,
+        "js_divergence": 0.5 * ((p * (log_p - log_m)).sum(axis=1))
+        + 0.5 * ((q * (log_q - log_m)).sum(axis=1)),
+        "hellinger_distance": np.sqrt(
+            np.maximum(1.0 - np.sqrt(p * q).sum(axis=1), 0.0)
+        ),
+    }
+    for values in results.values():
+        values[empty] = np.nan
+    return results
+
+
+def histogram_counts(
+    values: np.ndarray, edges: np.ndarray, weights: np.ndarray | None = None
+) -> np.ndarray:
+    """Count values on histogram bins, as ``WindowStats`` without missing values.
+
+    Args:
+        values: Values to count, without missing values
+        edges: Edges of the bins
+        weights: Weight of each value, 1 if None
+
+    Returns:
+        np.ndarray: Counts of the values below the first edge, in each bin and
+            above the last edge
+    """
+    n_bins = len(edges) - 1
+    bins = np.searchsorted(edges, values, side="right")
+    # The last bin includes its upper edge, as in np.histogram
+    bins[values == edges[-1]] = n_bins
+    return np.bincount(bins, weights=weights, minlength=n_bins + 2)
+
+
+def _divergence_measures(
+    datashape: DataShape,
+    scores: dict[str, dict[str, float]],
+    feature_pids: Mapping,
+    date: pd.Timestamp,
+) -> list[Measure]:
+    metrics = []
+    for feature in datashape.features:
+        if feature.name not in scores:
+            continue
+        for name in DIVERGENCES:
+            metrics.append(
+                Measure(
+                    name=name,
+                    score=scores[feature.name][name],
+                    time=date.to_pydatetime(),
+                    feature_pid=feature_pids.get(feature.name, None),
+                )
+            )
+    return metrics
+
+
+def _feature_scores(
+    names: list[str], p_counts: np.ndarray, q_counts: np.ndarray, mask=None
+) -> dict[str, dict[str, float]]:
+    if not names:
+        return {}
+    results = divergences(p_counts, q_counts, mask)
+    return {
+        feature: {name: float(results[name][i]) for name in DIVERGENCES}
+        for i, feature in enumerate(names)
+    }
+
+
+@data_metric(name="Divergences")
+def divergence_metric(
+    datashape: DataShape, reference: Dataset, evaluated: Dataset
+) -> list[Measure]:
+    """Calculate the divergences of all features between the reference and the window.
+
+    Args:
+        datashape: The datashape of the project
+        reference: The reference dataset (model dataset)
+        evaluated: The evaluated dataset (current time window)
+
+    Returns:
+        list[Measure]: The measures of ``DIVERGENCES`` for each numerical and
+            categorical feature
+    """
+    context = window_context(datashape, evaluated)
+    profile = reference_profile(datashape, reference)
+
+    # The histograms of the window statistics must be on the bins of the profile
+    stats = evaluated.stats
+    if stats is None or any(
+        len(stats.bin_edges[name]) != profile.n_bins + 1 for name in profile.numerical
+    ):
+        stats = WindowStats(
+            datashape, evaluated.data, n_bins=profile.n_bins, profile=profile
+        ).move(0, len(evaluated.data))
+
+    # Missing values (last count) are left out
+    scores = _feature_scores(
+        profile.numerical,
+        np.array([profile.histogram(name)[:-1] for name in profile.numerical]),
+        np.array([stats.histogram(name)[:-1] for name in profile.numerical]),
+    )
+    scores.update(
+        _feature_scores(
+            profile.categorical,
+            *stack_counts(
+                [
+                    (
+                        stats.reference_counts[name][:-1],
+                        stats.category_counts(name)[:-1],
+                    )
+                    for name in profile.categorical
+                ]
+            ),
+        )
+    )
+    return _divergence_measures(datashape, scores, context.feature_pids, context.date)
+
+
+def sketch_divergence_metric(
+    datashape: DataShape,
+    shape: DataShape,
+    reference: FrameSketch,
+    window: FrameSketch,
+    date: pd.Timestamp,
+    n_bins: int | None = None,
+) -> list[Measure]:
+    """Approximate the divergences of all features from summaries of the datasets.
+
+    Counterpart of ``divergence_metric`` for the sketch drift mode. The
+    histograms of numerical features are counted on the weighted samples of the
+    sketches, on bins fixed on the range of the reference sketch.
+
+    Args:
+        datashape: Datashape of the project
+        shape: Datashape of the evaluated dataset, which gives the feature pids
+        reference: Summary of the reference dataset
+        window: Summary of the rows of the window
+        date: Last date of the rows of the window
+        n_bins: Number of histogram bins, WINDOW_STATS_BINS by default
+
+    Returns:
+        list[Measure]: The measures of ``DIVERGENCES`` for each numerical and
+            categorical feature
+    """
+    n_bins = n_bins or WINDOW_STATS_BINS
+    numerical = list(window.sketches)
+    p_counts = np.zeros((len(numerical), n_bins + 2))
+    q_counts = np.zeros((len(numerical), n_bins + 2))
+    for i, name in enumerate(numerical):
+        ref_items, ref_weights = reference.sketches[name].weighted_items()
+        items, weights = window.sketches[name].weighted_items()
+        if len(ref_items) == 0:
+            continue
+        edges = np.histogram_bin_edges(ref_items, bins=n_bins)
+        p_counts[i] = histogram_counts(ref_items, edges, ref_weights)
+        q_counts[i] = histogram_counts(items, edges, weights)
+    scores = _feature_scores(numerical, p_counts, q_counts)
+
+    categorical = list(window.counts)
+    tables = [
+        aligned_counts(reference.counts[name], window.counts[name])
+        for name in categorical
+    ]
+    scores.update(_feature_scores(categorical, *stack_counts(tables)))
+
+    feature_pids = {feature.name: feature.pid for feature in shape.features}
+    return _divergence_measures(datashape, scores, feature_pids, date)
+
+
 def kl_numeric(ref_col, cur_col, bins=30):
-    # Clean numeric data, create histograms for reference and current columns
+    """KL divergence between two numerical samples, on histograms of ``bins`` bins.
 
+    Args:
+        ref_col: Reference sample
+        cur_col: Current sample
+        bins: Number of bins, fixed on the range of the reference
+
+    Returns:
+        float: The divergence, NaN if a sample is empty
+    """
     r = ref_col.dropna().astype(float)
     c = cur_col.dropna().astype(float)
     if len(r) == 0 or len(c) == 0:
-        return float("nan") # Return nan ,if the result cannot be calculated
-    
-# Create histograms for reference and current data using the same bins to count values in each bin
+        return float("nan")
+
+    # Count the values of both samples on the same bins
     counts_r, bin_edges = np.histogram(r, bins=bins)
     counts_c, _ = np.histogram(c, bins=bin_edges)
 
     p = _to_probs(counts_r)
     q = _to_probs(counts_c)
+    return float(entropy(p, q))
 
 
-#This block tries to KL divergence,if anything goes wrong, it safely report the error and return Nan
-    try:
-        return float(entropy(p, q))
-    except Exception as e:
-        print(f"[kl_numeric] error: {e}")
-        return float("nan")
+def kl_categorical(ref_col, cur_col):
+    """KL divergence between two categorical samples.
 
+    Args:
+        ref_col: Reference sample
+        cur_col: Current sample
 
-def kl_categorical(ref_col, cur_col):
-    
-    # Clean categorical data, count how often each category appears, match categories in both sets
-    r = ref_col.dropna().astype(str)
-    c = cur_col.dropna().astype(str)
+    Returns:
+        float: The divergence, NaN if a sample is empty
+    """
+    # Count how often each category appears in both sets, with one shared
+    # dictionary of categories. Missing values are not counted, and values are
+    # compared as strings, so 1 and "1" are the same category.
+    p_counts, q_counts = category_counts(
+        ref_col.dropna().astype(str), cur_col.dropna().astype(str)
+    )
 
-    if len(r) == 0 or len(c) == 0:
+    if p_counts.sum() == 0 or q_counts.sum() == 0:
         return float("nan")
 
-    p_counts = r.value_counts(normalize=True)
-    q_counts = c.value_counts(normalize=True)
-
-    all_vals = p_counts.index.union(q_counts.index)
-    p = p_counts.reindex(all_vals, fill_value=0).values
-    q = q_counts.reindex(all_vals, fill_value=0).values
-
-    p = _to_probs(p)
-    q = _to_probs(q)
-    
-    #This block tries to KL divergence,if anything goes wrong, it safely report the error and return Nan
-    try:
-        return float(entropy(p, q))
-    except Exception as e:
-        print(f"[kl_categorical] error: {e}")
-        return float("nan")
+    p = _to_probs(p_counts / p_counts.sum())
+    q = _to_probs(q_counts / q_counts.sum())
+    return float(entropy(p, q))
+
 
+def _kl_series(ref_col, cur_col, bins=30):
+    if pd.api.types.is_numeric_dtype(ref_col):
+        return kl_numeric(ref_col, cur_col, bins=bins)
+    return kl_categorical(ref_col, cur_col)
 
 
 def compute_kl_df(ref_df, cur_df, bins=30):
-   # Compute KL divergence for each column and store the results in a list
-    rows = [] # creating an empty list
-    
-    #check the column type(numeric or categorical), compute the KLdivergence using appropriate function
+    """KL divergence of each column of two frames.
+
+    Args:
+        ref_df: Reference frame
+        cur_df: Current frame, with the columns of the reference
+        bins: Number of bins of the numerical columns
+
+    Returns:
+        pd.DataFrame: Column, type and divergence of each column, sorted by
+            decreasing divergence
+    """
+    rows = []
     for col in ref_df.columns:
+        col_type = (
+            "numeric" if pd.api.types.is_numeric_dtype(ref_df[col]) else "categorical"
+        )
         try:
-            if pd.api.types.is_numeric_dtype(ref_df[col]):
-                kl_val = kl_numeric(ref_df[col], cur_df[col], bins=bins)
-                col_type = "numeric"
-            else:
-                kl_val = kl_categorical(ref_df[col], cur_df[col])
-                col_type = "categorical"
-                
-                #If the KL calculation fail,print error and mark it as Nan
+            kl_val = _kl_series(ref_df[col], cur_df[col], bins=bins)
         except Exception as e:
-            print(f"[compute_kl_df] failed for {col}: {e}")
+            logger.warning(f"KL divergence failed for column {col}: {e}")
             kl_val = float("nan")
             col_type = "error"
-            
-# Save each column's KL result in a DataFrame and sort by KL value from highest to lowest
         rows.append({"column": col, "type": col_type, "kl_ref_to_cur": kl_val})
 
     df = pd.DataFrame(rows)
@@ -99,50 +343,59 @@ def compute_kl_df(ref_df, cur_df, bins=30):
 
 
 def save_kl_results(ref_df, cur_df, out_path="results/titanic_kl_results.csv", bins=30):
-    #compute the KL divergence, save the result to csv file and return the dataframe
+    """Compute the KL divergence of each column and save it to a CSV file.
+
+    Args:
+        ref_df: Reference frame
+        cur_df: Current frame
+        out_path: Path of the CSV file, whose directory is created if needed
+        bins: Number of bins of the numerical columns
+
+    Returns:
+        pd.DataFrame: The divergences, as ``compute_kl_df``
+    """
     df = compute_kl_df(ref_df, cur_df, bins=bins)
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     df.to_csv(out_path, index=False)
-    print(f"[kl_metric] KL results saved to {out_path}")
+    logger.info(f"KL results saved to {out_path}")
     return df
 
 
 def compute_kl_for_column(a, b, bins=30):
-   
-    #Compute KL divergence for two Series, return NaN if an error occurs
+    """KL divergence of a column.
+
+    Args:
+        a: Reference sample (Series), or a frame whose column ``b`` is split in
+            a reference (70% of the rows) and a current sample
+        b: Current sample (Series), or the name of a column of ``a``
+        bins: Number of bins of numerical columns
 
+    Returns:
+        float: The divergence, NaN if it cannot be computed
+    """
     if isinstance(a, pd.Series) and isinstance(b, pd.Series):
         try:
-            if pd.api.types.is_numeric_dtype(a):
-                return kl_numeric(a, b, bins=bins)
-            else:
-                return kl_categorical(a, b)
+            return _kl_series(a, b, bins=bins)
         except Exception as e:
-            print(f"[compute_kl_for_column] error (series): {e}")
+            logger.warning(f"KL divergence failed: {e}")
             return float("nan")
 
-    # check if the given column exist in dataframe , return nan if it not exists
     if isinstance(a, pd.DataFrame) and isinstance(b, str):
         df = a
         col = b
         if col not in df.columns:
-            print(f"[compute_kl_for_column] error: column '{col}' not in DataFrame")
+            logger.warning(f"KL divergence failed: column '{col}' not in DataFrame")
             return float("nan")
-        
-        
-        # Split the column into two parts and calculate KL divergence, return nan if something goes wrong
+
         try:
             ref = df.sample(frac=0.7, random_state=1).reset_index(drop=True)
             cur = df.drop(ref.index).reset_index(drop=True)
-            ref_series = ref[col]
-            cur_series = cur[col]
-            if pd.api.types.is_numeric_dtype(ref_series):
-                return kl_numeric(ref_series, cur_series, bins=bins)
-            else:
-                return kl_categorical(ref_series, cur_series)
+            return _kl_series(ref[col], cur[col], bins=bins)
         except Exception as e:
-            print(f"[compute_kl_for_column] error (df split): {e}")
+            logger.warning(f"KL divergence failed: {e}")
             return float("nan")
 
-    # handling the invalid input type by printing a message and return nan
-    print("[compute_kl_for_column] unsupported input types")
+    logger.warning("KL divergence failed: unsupported input types")
     return float("nan")
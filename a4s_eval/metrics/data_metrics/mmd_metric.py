@@ -0,0 +1,84 @@
+"""Multivariate drift of the numerical features, by maximum mean discrepancy.
+
+The per-feature drift metrics miss shifts of the joint distribution, such as a
+changed correlation between features with unchanged marginals. The maximum mean
+discrepancy (MMD) with a Gaussian kernel compares the whole distributions of
+the rows, approximated with random Fourier features (see
+``a4s_eval.utils.mmd``).
+
+The features are standardized with the means and variances of the reference
+profile, and missing values are replaced by the reference mean. The reference
+features are computed once per reference. The significance of the distance is a
+permutation test of the mapped rows (``MMD_PERMUTATIONS`` random splits).
+"""
+
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.env import MMD_PERMUTATIONS
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.mmd import ReferenceFeatures
+from a4s_eval.utils.reference_profile import ReferenceProfile, reference_profile
+from a4s_eval.utils.window_context import window_context
+
+logger = get_logger()
+
+_references: dict[tuple[int, str], tuple[weakref.ref, ReferenceFeatures]] = {}
+
+
+def reference_features(
+    profile: ReferenceProfile, reference: Dataset
+) -> ReferenceFeatures:
+    """Random features of a reference, computed once per reference data."""
+    data = reference.data
+    key = (id(data), profile.content_hash)
+    cached = _references.get(key)
+    if cached is not None and cached[0]() is data:
+        return cached[1]
+    names = profile.numerical
+    values = np.empty((len(data), len(names)))
+    for j, name in enumerate(names):
+        values[:, j] = pd.to_numeric(data[name], errors="coerce")
+    features = ReferenceFeatures(
+        values,
+        np.array([profile.mean(name) for name in names]),
+        np.sqrt([profile.variance(name) for name in names]),
+    )
+    _references[key] = (weakref.ref(data), features)
+    weakref.finalize(data, _references.pop, key, None)
+    return features
+
+
+@data_metric(name="Multivariate drift")
+def mmd_metric(
+    datashape: DataShape, reference: Dataset, evaluated: Dataset
+) -> list[Measure]:
+    """Calculate the multivariate drift of the numerical features of the window.
+
+    Args:
+        datashape: The datashape of the project
+        reference: The reference dataset (model dataset)
+        evaluated: The evaluated dataset (current time window)
+
+    Returns:
+        list[Measure]: The squared MMD ("mmd") and, with MMD_PERMUTATIONS, its
+            permutation p-value ("mmd_p_value"). None without numerical
+            features or rows.
+    """
+    context = window_context(datashape, evaluated)
+    profile = reference_profile(datashape, reference)
+    if not profile.numerical or len(evaluated.data) == 0 or profile.n_rows == 0:
+        return []
+
+    ref = reference_features(profile, reference)
+    mmd, p_value = ref.mmd(context.numerical_matrix, MMD_PERMUTATIONS)
+
+    measures = [Measure(name="mmd", score=mmd, time=context.time)]
+    if MMD_PERMUTATIONS:
+        measures.append(Measure(name="mmd_p_value", score=p_value, time=context.time))
+    return measures
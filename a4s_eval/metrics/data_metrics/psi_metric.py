@@ -0,0 +1,138 @@
+"""Population stability index between the reference and a window.
+
+Numerical features are binned on ``PSI_BINS`` quantiles of the reference, so each
+bin holds the same share of the reference values. The edges and the reference
+counts are computed once per reference profile. Categorical features are binned
+on their categories. Missing values have their own bin on both sides.
+
+The values of all the numerical features of a window are assigned to their bins
+in one vectorized comparison with the edges, and the index of every feature is
+computed at once on the matrix of the counts.
+"""
+
+import numpy as np
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.counts import EPS, stack_counts
+from a4s_eval.utils.env import PSI_BINS
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.reference_profile import reference_profile
+from a4s_eval.utils.window_context import window_context
+
+logger = get_logger()
+
+# Maximum number of comparisons of values with edges at once
+MAX_CHUNK_CELLS = 2**24
+
+
+def quantile_bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Count the values of several features on their bins.
+
+    Args:
+        values: Values of shape (rows, features), NaN if missing
+        edges: Inner edges of the bins of each feature, of shape (features,
+            bins - 1), as ``ReferenceProfile.quantile_bins``
+
+    Returns:
+        np.ndarray: Counts of shape (features, bins + 1), the last count being
+            of missing values
+    """
+    n_rows, n_features = values.shape
+    n_bins = edges.shape[1] + 1
+    size = n_bins + 1
+    offsets = np.arange(n_features) * size
+    counts = np.zeros(n_features * size, dtype=np.int64)
+    step = max(1, MAX_CHUNK_CELLS // max(n_features * edges.shape[1], 1))
+    for lo in range(0, n_rows, step):
+        chunk = values[lo : lo + step]
+        bins = (chunk[:, :, None] >= edges[None]).sum(axis=2)
+        bins[np.isnan(chunk)] = n_bins
+        counts += np.bincount((bins + offsets).ravel(), minlength=counts.size)
+    return counts.reshape(n_features, size)
+
+
+def population_stability_index(
+    ref_counts: np.ndarray, new_counts: np.ndarray, mask: np.ndarray | None = None
+) -> np.ndarray:
+    """Population stability index between the rows of two matrices of counts.
+
+    Args:
+        ref_counts: Counts of the reference, one row per feature
+        new_counts: Counts of the window on the same bins
+        mask: Whether each bin exists, when rows of different lengths are
+            padded to the same length. All the bins exist if None.
+
+    Returns:
+        np.ndarray: The index of each row, NaN for the rows without counts on
+            one side
+    """
+    ref_counts = np.asarray(ref_counts, dtype=float)
+    new_counts = np.asarray(new_counts, dtype=float)
+    if mask is None:
+        mask = np.ones(ref_counts.shape, dtype=bool)
+    empty = (np.where(mask, ref_counts, 0.0).sum(axis=1) == 0) | (
+        np.where(mask, new_counts, 0.0).sum(axis=1) == 0
+    )
+    p = np.where(mask, ref_counts + EPS, 1.0)
+    q = np.where(mask, new_counts + EPS, 1.0)
+    p /= np.where(mask, p, 0.0).sum(axis=1, keepdims=True)
+    q /= np.where(mask, q, 0.0).sum(axis=1, keepdims=True)
+    psi = np.where(mask, (q - p) * np.log(q / p), 0.0).sum(axis=1)
+    psi[empty] = np.nan
+    return psi
+
+
+@data_metric(name="Population stability index")
+def psi_metric(
+    datashape: DataShape, reference: Dataset, evaluated: Dataset
+) -> list[Measure]:
+    """Calculate the population stability index of all features for the window.
+
+    Args:
+        datashape: The datashape of the project
+        reference: The reference dataset (model dataset)
+        evaluated: The evaluated dataset (current time window)
+
+    Returns:
+        list[Measure]: A "psi" measure for each numerical and categorical feature
+    """
+    context = window_context(datashape, evaluated)
+    profile = reference_profile(datashape, reference)
+    scores: dict[str, float] = {}
+
+    if profile.numerical:
+        edges, ref_counts = profile.quantile_bins(PSI_BINS)
+        new_counts = quantile_bin_counts(context.numerical_matrix, edges)
+        psi = population_stability_index(ref_counts, new_counts)
+        scores.update(zip(profile.numerical, psi.tolist()))
+
+    if profile.categorical:
+        # Missing values (last count) have their own bin
+        stats = evaluated.stats
+        if stats is not None:
+            pairs = [
+                (stats.reference_counts[name], stats.category_counts(name))
+                for name in profile.categorical
+            ]
+        else:
+            encoded = profile.encode_frame(evaluated.data)
+            counts = encoded.counts()
+            pairs = [
+                (encoded.reference_counts[name], counts[encoded.slices[name]])
+                for name in profile.categorical
+            ]
+        psi = population_stability_index(*stack_counts(pairs))
+        scores.update(zip(profile.categorical, psi.tolist()))
+
+    return [
+        Measure(
+            name="psi",
+            score=scores[feature.name],
+            time=context.time,
+            feature_pid=context.feature_pids.get(feature.name, None),
+        )
+        for feature in datashape.features
+        if feature.name in scores
+    ]
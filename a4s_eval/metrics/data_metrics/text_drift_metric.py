@@ -0,0 +1,88 @@
+"""Drift of the text features.
+
+Texts are embedded with hashed character n-grams and a random projection (see
+``a4s_eval.utils.text_embedding``), and the reference and window embeddings are
+compared by maximum mean discrepancy with random Fourier features (see
+``a4s_eval.utils.mmd``), as the numerical features by the multivariate drift
+metric. The texts of a window are embedded once, in its context, and the
+embeddings and random features of the reference once per reference.
+"""
+
+import weakref
+
+import numpy as np
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric
+from a4s_eval.utils.env import MMD_PERMUTATIONS
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.mmd import ReferenceFeatures
+from a4s_eval.utils.text_embedding import embed_text
+from a4s_eval.utils.window_context import window_context
+
+logger = get_logger()
+
+_references: dict[tuple[int, str], tuple[weakref.ref, ReferenceFeatures]] = {}
+
+
+def reference_text_features(reference: Dataset, feature: str) -> ReferenceFeatures:
+    """Random features of the embedded texts of a reference, computed once."""
+    data = reference.data
+    key = (id(data), feature)
+    cached = _references.get(key)
+    if cached is not None and cached[0]() is data:
+        return cached[1]
+    embeddings = embed_text(data[feature])
+    features = ReferenceFeatures(
+        embeddings, embeddings.mean(axis=0), embeddings.std(axis=0)
+    )
+    _references[key] = (weakref.ref(data), features)
+    weakref.finalize(data, _references.pop, key, None)
+    return features
+
+
+@data_metric(name="Text drift")
+def text_drift_metric(
+    datashape: DataShape, reference: Dataset, evaluated: Dataset
+) -> list[Measure]:
+    """Calculate the drift of each text feature for the window.
+
+    Args:
+        datashape: The datashape of the project
+        reference: The reference dataset (model dataset)
+        evaluated: The evaluated dataset (current time window)
+
+    Returns:
+        list[Measure]: The squared MMD of the embeddings of each text feature
+            ("text_mmd") and, with MMD_PERMUTATIONS, its permutation p-value
+            ("text_mmd_p_value")
+    """
+    texts = [f for f in datashape.features if f.feature_type == FeatureType.TEXT]
+    if not texts or len(evaluated.data) == 0 or len(reference.data) == 0:
+        return []
+
+    context = window_context(datashape, evaluated)
+    measures = []
+    for feature in texts:
+        ref = reference_text_features(reference, feature.name)
+        mmd, p_value = ref.mmd(context.text_embedding(feature.name), MMD_PERMUTATIONS)
+        feature_pid = context.feature_pids.get(feature.name, None)
+        measures.append(
+            Measure(
+                name="text_mmd",
+                score=mmd,
+                time=context.time,
+                feature_pid=feature_pid,
+            )
+        )
+        if np.isfinite(p_value):
+            measures.append(
+                Measure(
+                    name="text_mmd_p_value",
+                    score=p_value,
+                    time=context.time,
+                    feature_pid=feature_pid,
+                )
+            )
+    return measures
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 from sklearn.metrics import (
     accuracy_score,
     f1_score,
@@ -12,6 +11,7 @@ from sklearn.metrics import (
 from a4s_eval.data_model.evaluation import Dataset, DataShape, Model
 from a4s_eval.data_model.measure import Measure
 from a4s_eval.metric_registries.prediction_metric_registry import prediction_metric
+from a4s_eval.utils.window_context import window_context
 
 
 def robust_roc_auc_score(y_true: np.ndarray, y_pred_proba: np.ndarray) -> np.ndarray:
@@ -31,6 +31,51 @@ def robust_roc_auc_score(y_true: np.ndarray, y_pred_proba: np.ndarray) -> np.nda
     return roc_auc_score(y_true, y_pred_proba)
 
 
+def window_confusion(dataset: Dataset, binary: bool = False) -> np.ndarray | None:
+    """Confusion matrix of the current window, from the window statistics.
+
+    Args:
+        dataset: The evaluated dataset
+        binary: Only return the matrix of binary 0/1 labels, indexed by label
+
+    Returns:
+        np.ndarray | None: Confusion matrix (true labels in rows), or None if the
+            window statistics do not have it and the metric must be computed from
+            the data.
+    """
+    stats = dataset.stats
+    if stats is None or stats.confusion is None or not stats.confusion.any():
+        return None
+    if binary:
+        if not set(stats.labels.tolist()) <= {0, 1}:
+            return None
+        confusion = np.zeros((2, 2), dtype=np.int64)
+        positions = stats.labels.astype(int)
+        confusion[np.ix_(positions, positions)] = stats.confusion
+        return confusion
+    return stats.confusion
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    # zero_division=0.0, as with the sklearn scores
+    return float(numerator / denominator) if denominator else 0.0
+
+
+def matthews_corrcoef_from_confusion(confusion: np.ndarray) -> float:
+    """Matthews correlation coefficient from a confusion matrix, as in sklearn."""
+    confusion = confusion.astype(np.float64)
+    t_sum = confusion.sum(axis=1)
+    p_sum = confusion.sum(axis=0)
+    n_correct = np.trace(confusion)
+    n_samples = p_sum.sum()
+    cov_ytyp = n_correct * n_samples - np.dot(t_sum, p_sum)
+    cov_ypyp = n_samples**2 - np.dot(p_sum, p_sum)
+    cov_ytyt = n_samples**2 - np.dot(t_sum, t_sum)
+    if cov_ypyp * cov_ytyt == 0:
+        return 0.0
+    return float(cov_ytyp / np.sqrt(cov_ytyt * cov_ypyp))
+
+
 @prediction_metric(name="Empty model pred proba metric")
 def empty_model_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
@@ -42,15 +87,17 @@ def empty_model_metric(
 def classification_accuracy_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
-    y_pred = np.argmax(y_pred_proba, axis=1)
+    context = window_context(datashape, dataset, y_pred_proba)
+    confusion = window_confusion(dataset)
+    if confusion is not None:
+        score = _ratio(np.trace(confusion), confusion.sum())
+    else:
+        score = accuracy_score(context.y_true, context.y_pred)
 
     metric = Measure(
         name="Accuracy",
-        score=accuracy_score(y_true, y_pred),
-        time=date,
+        score=score,
+        time=context.time,
     )
 
     return [metric]
@@ -60,15 +107,18 @@ def classification_accuracy_metric(
 def classification_f1_score_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
-    y_pred = np.argmax(y_pred_proba, axis=1)
+    context = window_context(datashape, dataset, y_pred_proba)
+    confusion = window_confusion(dataset, binary=True)
+    if confusion is not None:
+        (_, fp), (fn, tp) = confusion
+        score = _ratio(2 * tp, 2 * tp + fp + fn)
+    else:
+        score = f1_score(context.y_true, context.y_pred)
 
     metric = Measure(
         name="F1",
-        score=f1_score(y_true, y_pred),
-        time=date,
+        score=score,
+        time=context.time,
     )
 
     return [metric]
@@ -78,15 +128,17 @@ def classification_f1_score_metric(
 def classification_precision_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
-    y_pred = np.argmax(y_pred_proba, axis=1)
+    context = window_context(datashape, dataset, y_pred_proba)
+    confusion = window_confusion(dataset, binary=True)
+    if confusion is not None:
+        score = _ratio(confusion[1, 1], confusion[:, 1].sum())
+    else:
+        score = precision_score(context.y_true, context.y_pred, zero_division=0.0)
 
     metric = Measure(
         name="Precision",
-        score=precision_score(y_true, y_pred, zero_division=0.0),
-        time=date,
+        score=score,
+        time=context.time,
     )
 
     return [metric]
@@ -96,15 +148,17 @@ def classification_precision_metric(
 def classification_recall_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
-    y_pred = np.argmax(y_pred_proba, axis=1)
+    context = window_context(datashape, dataset, y_pred_proba)
+    confusion = window_confusion(dataset, binary=True)
+    if confusion is not None:
+        score = _ratio(confusion[1, 1], confusion[1, :].sum())
+    else:
+        score = recall_score(context.y_true, context.y_pred)
 
     metric = Measure(
         name="Recall",
-        score=recall_score(y_true, y_pred),
-        time=date,
+        score=score,
+        time=context.time,
     )
 
     return [metric]
@@ -116,15 +170,17 @@ def classification_recall_metric(
 def classification_matthews_corrcoef_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
-    y_pred = np.argmax(y_pred_proba, axis=1)
+    context = window_context(datashape, dataset, y_pred_proba)
+    confusion = window_confusion(dataset)
+    if confusion is not None:
+        score = matthews_corrcoef_from_confusion(confusion)
+    else:
+        score = matthews_corrcoef(context.y_true, context.y_pred)
 
     metric = Measure(
         name="MCC",
-        score=matthews_corrcoef(y_true, y_pred),
-        time=date,
+        score=score,
+        time=context.time,
     )
 
     return [metric]
@@ -134,14 +190,12 @@ def classification_matthews_corrcoef_metric(
 def classification_roc_auc_metric(
     datashape: DataShape, model: Model, dataset: Dataset, y_pred_proba: np.ndarray
 ) -> list[Measure]:
-    date = pd.to_datetime(dataset.data[datashape.date.name]).max()
-    date = date.to_pydatetime()
-    y_true = dataset.data[datashape.target.name].to_numpy()
+    context = window_context(datashape, dataset, y_pred_proba)
 
     metric = Measure(
         name="ROCAUC",
-        score=robust_roc_auc_score(y_true, y_pred_proba),
-        time=date,
+        score=robust_roc_auc_score(context.y_true, context.y_pred_proba),
+        time=context.time,
     )
 
     return [metric]
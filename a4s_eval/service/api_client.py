@@ -1,15 +1,39 @@
+import gzip
+import hashlib
+import tempfile
 import uuid
-from io import BytesIO
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterator
 
 import onnxruntime as ort
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 import requests
 from pydantic import BaseModel
 
-from a4s_eval.data_model.evaluation import DataShape, Evaluation
-from a4s_eval.data_model.measure import Measure
-from a4s_eval.utils.env import API_URL_PREFIX
+from a4s_eval.data_model.evaluation import Dataset, DataShape, Evaluation
+from a4s_eval.data_model.measure import Measure, measures_to_json
+from a4s_eval.service import http_client, onnx_sessions
+from a4s_eval.utils.arrow import (
+    as_pandas_compatible,
+    csv_convert_options,
+    pandas_compatible_schema,
+    table_to_pandas,
+)
+from a4s_eval.utils.cache import CacheEntry, DiskCache, response_validators
+from a4s_eval.utils.env import (
+    API_URL_PREFIX,
+    CACHE_DIR,
+    CACHE_MAX_BYTES,
+    CLAIM_BULK,
+    CLAIM_CONCURRENCY,
+    MEASURE_BATCH_SIZE,
+    MEASURE_DEDUP,
+    MEASURE_GZIP,
+)
 from a4s_eval.utils.logging import get_logger
 
 logger = get_logger()
@@ -32,7 +56,11 @@ def fetch_pending_evaluations() -> list[uuid.UUID]:
         )
 
         logger.debug("2. Making API request...")
-        resp = requests.get(f"{API_URL_PREFIX}/evaluations?status=pending", timeout=30)
+        resp = http_client.request(
+            "GET",
+            f"{API_URL_PREFIX}/evaluations?status=pending",
+            endpoint="GET /evaluations",
+        )
         logger.debug(f"2. API call completed. Status: {resp.status_code}")
 
         if resp.status_code != 200:
@@ -42,23 +70,11 @@ def fetch_pending_evaluations() -> list[uuid.UUID]:
         evaluations = resp.json()
         logger.debug(f"4. Parsed evaluations: {evaluations}")
 
-        claimed_pids = []
-        logger.debug(f"5. Processing {len(evaluations)} evaluations...")
-
-        for i, e in enumerate(evaluations):
-            logger.debug(f"6.{i + 1} Processing evaluation: {e}")
-
-            if claim_evaluation(e["evaluation_pid"]):
-                claimed_pids.append(uuid.UUID(e["evaluation_pid"]))
-                logger.debug(
-                    f"7.{i + 1} Successfully claimed evaluation: {e['evaluation_pid']}"
-                )
-            else:
-                logger.warning(
-                    f"8.{i + 1} Failed to claim evaluation: {e['evaluation_pid']}"
-                )
+        pending_pids = [e["evaluation_pid"] for e in evaluations]
+        logger.debug(f"5. Claiming {len(pending_pids)} evaluations...")
+        claimed_pids = claim_evaluations(pending_pids)
 
-        logger.debug(f"9. Final claimed_pids: {claimed_pids}")
+        logger.debug(f"6. Final claimed_pids: {claimed_pids}")
         return claimed_pids
 
     except Exception as e:
@@ -75,8 +91,12 @@ def fetch_pending_evaluations() -> list[uuid.UUID]:
 def claim_evaluation(evaluation_pid: uuid.UUID) -> bool:
     logger.debug(f"Claiming evaluation {evaluation_pid}")
     try:
-        resp = requests.put(
-            f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=processing"
+        resp = http_client.request(
+            "PUT",
+            f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=processing",
+            endpoint="PUT /evaluations/{pid}",
+            # A claim that reached the server must not be sent again
+            idempotent=False,
         )
         logger.debug(f"Claim response status: {resp.status_code}")
 
@@ -91,48 +111,430 @@ def claim_evaluation(evaluation_pid: uuid.UUID) -> bool:
         return False
 
 
+# Set to False once the API answered that it does not support bulk claims
+_bulk_claim_supported = True
+
+
+def bulk_claim_evaluations(
+    evaluation_pids: list[uuid.UUID],
+) -> list[uuid.UUID] | None:
+    """Claim several evaluations with a single request.
+
+    Args:
+        evaluation_pids: PIDs of the evaluations to claim
+
+    Returns:
+        list[uuid.UUID] | None: PIDs that were claimed, or None if the API does
+            not support bulk claims.
+    """
+    global _bulk_claim_supported
+    resp = http_client.request(
+        "POST",
+        f"{API_URL_PREFIX}/evaluations/claim",
+        endpoint="POST /evaluations/claim",
+        json={"evaluation_pids": [str(pid) for pid in evaluation_pids]},
+    )
+    if resp.status_code in (404, 405, 501):
+        logger.info("Bulk claim not supported by the API, claiming one by one")
+        _bulk_claim_supported = False
+        return None
+    resp.raise_for_status()
+    return [uuid.UUID(str(pid)) for pid in resp.json()["claimed_pids"]]
+
+
+def claim_evaluations(evaluation_pids: list[uuid.UUID | str]) -> list[uuid.UUID]:
+    """Claim pending evaluations.
+
+    A single bulk claim is used when CLAIM_BULK is enabled and the API supports
+    it. Otherwise (404, 405 or 501 on the bulk endpoint) evaluations are claimed
+    one by one, concurrently, on a thread pool of CLAIM_CONCURRENCY threads. A
+    failed bulk claim is not retried one by one.
+
+    Args:
+        evaluation_pids: PIDs of the evaluations to claim
+
+    Returns:
+        list[uuid.UUID]: PIDs that were claimed, in the order they were given
+    """
+    pids = [uuid.UUID(str(pid)) for pid in evaluation_pids]
+    if not pids:
+        return []
+
+    if CLAIM_BULK and _bulk_claim_supported:
+        try:
+            claimed = bulk_claim_evaluations(pids)
+        except Exception as e:
+            # The claim may have been applied, claiming again could take the
+            # evaluations twice: they are claimed on the next poll instead
+            logger.error(f"Error in bulk claim, no evaluation claimed: {e}")
+            return []
+        if claimed is not None:
+            return claimed
+
+    n_workers = min(CLAIM_CONCURRENCY, len(pids))
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(claim_evaluation, pids))
+
+    for pid, claimed in zip(pids, results):
+        if not claimed:
+            logger.warning(f"Failed to claim evaluation: {pid}")
+    return [pid for pid, claimed in zip(pids, results) if claimed]
+
+
 def mark_completed(evaluation_pid: uuid.UUID) -> requests.Response:
-    return requests.put(f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=done")
+    return http_client.request(
+        "PUT",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=done",
+        endpoint="PUT /evaluations/{pid}",
+    )
 
 
 def mark_failed(evaluation_pid: uuid.UUID) -> None:
     payload = EvaluationStatusUpdateDTO(status="failed").model_dump()
-    requests.put(f"{API_URL_PREFIX}/evaluations/{evaluation_pid}", json=payload)
+    http_client.request(
+        "PUT",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}",
+        endpoint="PUT /evaluations/{pid}",
+        json=payload,
+    )
 
 
-def get_dataset_data(dataset_pid: uuid.UUID) -> pd.DataFrame:
-    resp = requests.get(f"{API_URL_PREFIX}/datasets/{dataset_pid}/data", stream=True)
-    resp.raise_for_status()
-    content_type = resp.headers.get("Content-Type", "")
+# Content encodings that Arrow can inflate while the body is being read
+ARROW_CODECS = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd"}
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Local file format of the cached datasets, by format of the API response
+DATASET_FILE_SUFFIX = {"csv": ".arrow", "parquet": ".parquet"}
 
+dataset_cache = DiskCache(f"{CACHE_DIR}/dataset_cache", CACHE_MAX_BYTES)
+model_cache = DiskCache(f"{CACHE_DIR}/model_cache", CACHE_MAX_BYTES)
+
+
+def _open_response_stream(resp: requests.Response) -> pa.NativeFile:
+    """Wrap the raw response body into an Arrow input stream.
+
+    Compressed bodies are inflated by Arrow on the fly, so the compressed
+    payload is never held in memory as a whole.
+    """
+    encoding = resp.headers.get("Content-Encoding", "").strip().lower()
+    raw = resp.raw
+    if encoding in ARROW_CODECS:
+        raw.decode_content = False
+        return pa.CompressedInputStream(
+            pa.PythonFile(raw, mode="r"), ARROW_CODECS[encoding]
+        )
+    raw.decode_content = True
+    return pa.PythonFile(raw, mode="r")
+
+
+def _spool_response(resp: requests.Response, file: Any) -> None:
+    """Copy the (decoded) response body to a file chunk by chunk."""
+    with _open_response_stream(resp) as stream:
+        while chunk := stream.read(STREAM_CHUNK_SIZE):
+            file.write(chunk)
+    file.flush()
+
+
+def _dataset_format(resp: requests.Response) -> str:
+    content_type = resp.headers.get("Content-Type", "")
     if "parquet" in content_type:
-        content_buffer = BytesIO(resp.content)
-        content_buffer.seek(0)
-        return pd.read_parquet(content_buffer)
+        return "parquet"
     elif "csv" in content_type:
-        content_buffer = BytesIO(resp.content)
-        content_buffer.seek(0)
-        return pd.read_csv(content_buffer)
+        return "csv"
     else:
         raise ValueError("Unsupported dataset format")
 
 
+def _request_dataset(
+    dataset_pid: uuid.UUID, headers: dict[str, str] | None = None
+) -> requests.Response:
+    resp = http_client.request(
+        "GET",
+        f"{API_URL_PREFIX}/datasets/{dataset_pid}/data",
+        endpoint="GET /datasets/{pid}/data",
+        stream=True,
+        headers={"Accept-Encoding": "gzip, zstd", **(headers or {})},
+    )
+    resp.raise_for_status()
+    return resp
+
+
+def iter_dataset_batches(
+    dataset_pid: uuid.UUID, columns: list[str] | None = None
+) -> Iterator[pa.RecordBatch]:
+    """Stream a dataset as Arrow record batches.
+
+    CSV bodies are parsed incrementally while they are downloaded. Parquet
+    needs random access to its footer, so the body is first spooled to a
+    temporary file, which is then read batch by batch.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        columns: Only read these columns. All columns are read if None.
+
+    Yields:
+        pa.RecordBatch: Consecutive batches of rows of the dataset
+    """
+    with _request_dataset(dataset_pid) as resp:
+        dataset_format = _dataset_format(resp)
+        if dataset_format == "csv":
+            with _open_response_stream(resp) as stream:
+                reader = pv.open_csv(
+                    stream, convert_options=csv_convert_options(columns)
+                )
+                for batch in reader:
+                    yield as_pandas_compatible(batch)
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".parquet") as file:
+                _spool_response(resp, file)
+                parquet_file = pq.ParquetFile(file.name, memory_map=True)
+                yield from parquet_file.iter_batches(columns=columns)
+
+
+def _write_dataset_file(
+    resp: requests.Response,
+    dataset_format: str,
+    path: str,
+    columns: list[str] | None = None,
+) -> None:
+    """Write a dataset response body to a file that can be memory-mapped.
+
+    Parquet bodies are stored as is. CSV bodies are parsed while downloaded and
+    written batch by batch as an Arrow IPC file.
+    """
+    if dataset_format == "parquet":
+        with open(path, "wb") as file:
+            _spool_response(resp, file)
+        return
+
+    with _open_response_stream(resp) as stream:
+        reader = pv.open_csv(stream, convert_options=csv_convert_options(columns))
+        schema = pandas_compatible_schema(reader.schema)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in reader:
+                writer.write_batch(as_pandas_compatible(batch))
+
+
+def _open_dataset_file(
+    dataset_pid: uuid.UUID, columns: list[str] | None = None
+) -> tuple[pa.MemoryMappedFile, str, str | None]:
+    """Memory-map a local copy of a dataset, downloading it if needed.
+
+    Datasets served with an ETag or a Last-Modified header are kept in the
+    dataset cache and revalidated with a conditional GET. Other datasets are
+    downloaded to a temporary file which is removed once mapped.
+
+    Returns:
+        tuple[pa.MemoryMappedFile, str, str | None]: The mapped file, its format
+            and the version of its content (None without validators)
+    """
+    key = str(dataset_pid)
+    with dataset_cache.lock(key):
+        entry = dataset_cache.get(key)
+        headers = entry.conditional_headers() if entry is not None else {}
+        with _request_dataset(dataset_pid, headers) as resp:
+            if resp.status_code == 304 and entry is not None:
+                logger.debug(f"Dataset {dataset_pid} served from cache")
+                dataset_cache.touch(entry)
+                return (
+                    pa.memory_map(entry.path),
+                    _cached_format(entry.path),
+                    entry.version,
+                )
+
+            dataset_format = _dataset_format(resp)
+            suffix = DATASET_FILE_SUFFIX[dataset_format]
+            etag, last_modified = response_validators(resp.headers)
+            if etag or last_modified:
+                with dataset_cache.temp_file(suffix) as tmp_path:
+                    _write_dataset_file(resp, dataset_format, tmp_path)
+                    entry = dataset_cache.put(
+                        key, tmp_path, suffix, etag, last_modified
+                    )
+                return pa.memory_map(entry.path), dataset_format, entry.version
+
+            with tempfile.NamedTemporaryFile(suffix=suffix) as file:
+                _write_dataset_file(resp, dataset_format, file.name, columns)
+                return pa.memory_map(file.name), dataset_format, None
+
+
+def _cached_format(path: str) -> str:
+    return "parquet" if path.endswith(DATASET_FILE_SUFFIX["parquet"]) else "csv"
+
+
+def _read_dataset_file(
+    source: pa.MemoryMappedFile, dataset_format: str, columns: list[str] | None
+) -> pa.Table:
+    if dataset_format == "parquet":
+        return pq.read_table(source, columns=columns)
+    table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def _iter_dataset_file(
+    source: pa.MemoryMappedFile, dataset_format: str, columns: list[str]
+) -> Iterator[pa.RecordBatch]:
+    with source:
+        if dataset_format == "parquet":
+            yield from pq.ParquetFile(source).iter_batches(columns=columns)
+        else:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).select(columns)
+
+
+def get_dataset_data(
+    dataset_pid: uuid.UUID, columns: list[str] | None = None
+) -> pd.DataFrame:
+    """Download a dataset and load it as a DataFrame.
+
+    The response body is streamed to a local file and read back memory-mapped,
+    instead of being buffered, so the worker holds roughly a single copy of the
+    data. Datasets are cached on disk across evaluations, see
+    ``_open_dataset_file``.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        columns: Only read these columns. All columns are read if None.
+
+    Returns:
+        pd.DataFrame: The dataset
+    """
+    return _get_dataset_data(dataset_pid, columns)[0]
+
+
+def _get_dataset_data(
+    dataset_pid: uuid.UUID, columns: list[str] | None = None
+) -> tuple[pd.DataFrame, str | None]:
+    source, dataset_format, version = _open_dataset_file(dataset_pid, columns)
+    with source:
+        table = _read_dataset_file(source, dataset_format, columns)
+        return table_to_pandas(table), version
+
+
+def get_dataset_columns(dataset_pid: uuid.UUID, datashape: DataShape) -> pd.DataFrame:
+    """Download only the columns of a dataset used by a project datashape.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        datashape: The project datashape, whose features, target and date
+            columns are loaded
+
+    Returns:
+        pd.DataFrame: The projected dataset
+    """
+    return get_dataset_data(dataset_pid, columns=datashape.column_names())
+
+
+def load_dataset_columns(dataset: Dataset, datashape: DataShape) -> None:
+    """Load the columns of a dataset used by a project datashape into it.
+
+    As ``get_dataset_columns``, and also sets the version of the dataset.
+
+    Args:
+        dataset: The dataset, whose data and version are set
+        datashape: The project datashape
+    """
+    dataset.data, dataset.version = _get_dataset_data(
+        dataset.pid, columns=datashape.column_names()
+    )
+
+
+def iter_dataset_columns(
+    dataset_pid: uuid.UUID, datashape: DataShape
+) -> Iterator[pa.RecordBatch]:
+    """Read the columns of a dataset used by a project datashape batch by batch.
+
+    The dataset goes through the dataset cache as with ``get_dataset_columns``,
+    but is never loaded as a whole, so memory does not grow with its size.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        datashape: The project datashape, whose features, target and date
+            columns are read
+
+    Yields:
+        pa.RecordBatch: Consecutive batches of rows of the dataset
+    """
+    yield from open_dataset_columns(dataset_pid, datashape)[0]
+
+
+def open_dataset_columns(
+    dataset_pid: uuid.UUID, datashape: DataShape
+) -> tuple[Iterator[pa.RecordBatch], str | None]:
+    """Open the columns of a dataset, to be read batch by batch.
+
+    As ``iter_dataset_columns``, but the dataset is downloaded now, and the
+    version of its content is returned with the batches.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        datashape: The project datashape
+
+    Returns:
+        tuple[Iterator[pa.RecordBatch], str | None]: The batches of rows and the
+            version of the dataset
+    """
+    columns = datashape.column_names()
+    source, dataset_format, version = _open_dataset_file(dataset_pid, columns)
+    return _iter_dataset_file(source, dataset_format, columns), version
+
+
 def get_onnx_model(
     model_pid: uuid.UUID,
 ) -> ort.capi.onnxruntime_inference_collection.InferenceSession:
-    resp = requests.get(f"{API_URL_PREFIX}/models/{model_pid}/data", stream=True)
-    resp.raise_for_status()
-    content_disposition = resp.headers.get("content-disposition", "")
+    """Download an ONNX model and get an inference session on it.
 
-    if "onnx" in content_disposition:
-        return ort.InferenceSession(resp.content)
-    else:
-        raise ValueError("Unsupported model format")
+    Models served with an ETag or a Last-Modified header are kept in the model
+    cache and revalidated with a conditional GET. Sessions are shared through the
+    in-process session cache, so an unchanged model is only loaded once per
+    worker.
+    """
+    key = str(model_pid)
+    with model_cache.lock(key):
+        entry = model_cache.get(key)
+        headers = entry.conditional_headers() if entry is not None else {}
+        with http_client.request(
+            "GET",
+            f"{API_URL_PREFIX}/models/{model_pid}/data",
+            endpoint="GET /models/{pid}/data",
+            stream=True,
+            headers=headers,
+        ) as resp:
+            resp.raise_for_status()
+            if resp.status_code == 304 and entry is not None:
+                logger.debug(f"Model {model_pid} served from cache")
+                model_cache.touch(entry)
+                return _cached_session(model_pid, entry)
+
+            content_disposition = resp.headers.get("content-disposition", "")
+            if "onnx" not in content_disposition:
+                raise ValueError("Unsupported model format")
+
+            etag, last_modified = response_validators(resp.headers)
+            if not (etag or last_modified):
+                return onnx_sessions.sessions.get(model_pid, resp.content)
+
+            with model_cache.temp_file(".onnx") as tmp_path:
+                with open(tmp_path, "wb") as file:
+                    _spool_response(resp, file)
+                entry = model_cache.put(key, tmp_path, ".onnx", etag, last_modified)
+            return _cached_session(model_pid, entry)
+
+
+def _cached_session(
+    model_pid: uuid.UUID, entry: CacheEntry
+) -> ort.capi.onnxruntime_inference_collection.InferenceSession:
+    # The optimized graph is kept with the model, and evicted with it
+    optimized_path = model_cache.companion_path(entry, onnx_sessions.OPTIMIZED_NAME)
+    return onnx_sessions.sessions.get(model_pid, entry.path, optimized_path)
 
 
 def get_evaluation_request(evaluation_pid: uuid.UUID) -> dict[str, Any]:
-    resp = requests.get(
-        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?include=project,dataset,model,datashape"
+    resp = http_client.request(
+        "GET",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?include=project,dataset,model,datashape",
+        endpoint="GET /evaluations/{pid}",
     )
     resp.raise_for_status()
     return resp.json()
@@ -144,52 +546,118 @@ def get_evaluation(
     return Evaluation.model_validate(get_evaluation_request(evaluation_pid))
 
 
+class MeasureUploadError(ValueError):
+    """Raised when some chunks of measures were not accepted by the API."""
+
+    def __init__(self, failed_chunks: list[int], message: str):
+        super().__init__(message)
+        self.failed_chunks = failed_chunks
+
+
+@dataclass
+class MeasureUpload:
+    """Summary of a measure upload."""
+
+    n_measures: int
+    n_chunks: int
+    n_sent: int
+
+
+def _post_measure_chunk(url: str, body: bytes) -> requests.Response:
+    # The API can recognize a chunk it already applied by its digest
+    headers = {
+        "Content-Type": "application/json",
+        "Idempotency-Key": hashlib.sha256(body).hexdigest(),
+    }
+    if MEASURE_GZIP:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return http_client.request(
+        "POST",
+        url,
+        endpoint="POST /evaluations/{pid}/metrics",
+        idempotent=MEASURE_DEDUP,
+        data=body,
+        headers=headers,
+    )
+
+
 def post_measures(
-    evaluation_pid: uuid.UUID, metrics: list[Measure]
-) -> requests.Response:
+    evaluation_pid: uuid.UUID,
+    metrics: list[Measure],
+    batch_size: int | None = None,
+) -> MeasureUpload:
     """Post metrics to the API for a specific evaluation.
 
+    Metrics are sent in chunks of ``batch_size`` (MEASURE_BATCH_SIZE by
+    default), gzip compressed if MEASURE_GZIP is set. Retries are left to
+    ``http_client.request``: a chunk that may have reached the API is only
+    resent if MEASURE_DEDUP is set, as the API would otherwise apply it twice.
+
     Args:
         evaluation_pid: UUID of the evaluation to post metrics for
         metrics: List of metrics to post
+        batch_size: Number of metrics per request
 
     Returns:
-        requests.Response: The API response
+        MeasureUpload: Summary of the upload
+
+    Raises:
+        MeasureUploadError: If some chunks were not accepted by the API
     """
+    batch_size = batch_size or MEASURE_BATCH_SIZE
     logger.debug(
         f"post_metrics called with {len(metrics)} metrics for evaluation {evaluation_pid}"
     )
 
-    payload = [m.model_dump() for m in metrics]
-    logger.debug(f"Payload prepared, size: {len(payload)}")
-    if len(payload) > 0:
-        logger.debug(f"Sample payload item: {payload[0]}")
-
     url = f"{API_URL_PREFIX}/evaluations/{evaluation_pid}/metrics"
-    logger.debug(f"Posting to URL: {url}")
-
-    response = requests.post(url, json=payload)
-    logger.debug(f"Response status: {response.status_code}")
-    logger.debug(f"Response headers: {dict(response.headers)}")
-    logger.debug(f"Response content: {response.text}")
-
-    if response.status_code != 201:
-        logger.error(f"ERROR: Expected status 201, got {response.status_code}")
-        logger.error(f"Response content: {response.text}")
-        raise ValueError(response.text)
-
-    return response
+    chunks = [
+        measures_to_json(metrics[i : i + batch_size])
+        for i in range(0, len(metrics), batch_size)
+    ]
+    logger.debug(f"Posting {len(chunks)} chunks of {batch_size} metrics to {url}")
+
+    n_sent = 0
+    failed = []
+    for i, chunk in enumerate(chunks):
+        try:
+            response = _post_measure_chunk(url, chunk)
+        except requests.RequestException as e:
+            logger.warning(f"Chunk {i} of metrics not posted: {e}")
+            failed.append(i)
+            continue
+        n_sent += 1
+        if response.status_code != 201:
+            logger.warning(
+                f"Chunk {i} of metrics refused, status {response.status_code}: "
+                f"{response.text[:500]}"
+            )
+            failed.append(i)
+
+    if failed:
+        logger.error(f"ERROR: {len(failed)} chunks of metrics were not accepted")
+        raise MeasureUploadError(
+            failed, f"Chunks {failed} of metrics were not accepted by the API"
+        )
+    return MeasureUpload(n_measures=len(metrics), n_chunks=len(chunks), n_sent=n_sent)
 
 
 def get_datashape_request(datashape_pid: uuid.UUID) -> dict[str, Any]:
-    resp = requests.get(f"{API_URL_PREFIX}/datashape/{datashape_pid}")
+    resp = http_client.request(
+        "GET",
+        f"{API_URL_PREFIX}/datashape/{datashape_pid}",
+        endpoint="GET /datashape/{pid}",
+    )
     resp.raise_for_status()
     return resp.json()
 
 
 def patch_datashape(dataset_pid: uuid.UUID, datashape: DataShape) -> requests.Response:
-    resp = requests.patch(
+    resp = http_client.request(
+        "PATCH",
         f"{API_URL_PREFIX}/datasets/{dataset_pid}/datashape",
+        endpoint="PATCH /datasets/{pid}/datashape",
+        idempotent=True,
         json=datashape.model_dump(),
     )
     resp.raise_for_status()
@@ -197,14 +665,21 @@ def patch_datashape(dataset_pid: uuid.UUID, datashape: DataShape) -> requests.Re
 
 
 def patch_datashape_status(datashape_pid: uuid.UUID, status: str) -> requests.Response:
-    resp = requests.patch(
+    resp = http_client.request(
+        "PATCH",
         f"{API_URL_PREFIX}/datashapes/{datashape_pid}/status?status={status}",
+        endpoint="PATCH /datashapes/{pid}/status",
+        idempotent=True,
     )
     resp.raise_for_status()
     return resp
 
 
 def get_project_datashape(project_pid: uuid.UUID) -> DataShape:
-    resp = requests.get(f"{API_URL_PREFIX}/projects/{project_pid}/datashape")
+    resp = http_client.request(
+        "GET",
+        f"{API_URL_PREFIX}/projects/{project_pid}/datashape",
+        endpoint="GET /projects/{pid}/datashape",
+    )
     resp.raise_for_status()
     return DataShape.model_validate(resp.json())
@@ -0,0 +1,320 @@
+"""Asynchronous client to the A4S API, for the FastAPI service.
+
+This module mirrors the evaluation, dataset, datashape and measure endpoints of
+``a4s_eval.service.api_client`` on top of a shared ``httpx.AsyncClient``, so
+``async def`` routes can talk to the A4S API without blocking the event loop.
+The client keeps a pool of connections alive and is closed on application
+shutdown with ``aclose_async_client``.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import tempfile
+import time
+import uuid
+from typing import Any
+
+import httpx
+import pandas as pd
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from a4s_eval.data_model.evaluation import DataShape, Evaluation
+from a4s_eval.data_model.measure import Measure, measures_to_json
+from a4s_eval.service.api_client import (
+    EvaluationStatusUpdateDTO,
+    MeasureUpload,
+    MeasureUploadError,
+)
+from a4s_eval.service.http_client import (
+    IDEMPOTENT_METHODS,
+    RETRY_STATUSES,
+    record_latency,
+)
+from a4s_eval.utils import env
+from a4s_eval.utils.arrow import (
+    as_pandas_compatible,
+    csv_convert_options,
+    table_to_pandas,
+)
+from a4s_eval.utils.env import API_URL_PREFIX
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the shared asynchronous HTTP client, creating it if needed.
+
+    Returns:
+        httpx.AsyncClient: The pooled client
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                env.HTTP_READ_TIMEOUT, connect=env.HTTP_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=env.HTTP_POOL_SIZE,
+                max_keepalive_connections=env.HTTP_POOL_SIZE,
+            ),
+            # Retries are all made by request()
+            transport=httpx.AsyncHTTPTransport(retries=0),
+        )
+    return _client
+
+
+async def aclose_async_client() -> None:
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request(
+    method: str,
+    url: str,
+    *,
+    endpoint: str,
+    idempotent: bool | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send a request through the shared client.
+
+    Behaves like ``a4s_eval.service.http_client.request``: failed connections
+    are retried, idempotent calls are also retried with an exponential backoff
+    on timeouts and transient server errors, and latencies are added to the
+    same per-endpoint counters.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    attempts = env.HTTP_RETRIES + 1
+
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        try:
+            resp = await get_async_client().request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            record_latency(endpoint, time.perf_counter() - start, error=True)
+            # The request did not reach the server if the connection failed
+            not_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+            if attempt == attempts - 1 or not (idempotent or not_sent):
+                raise
+            logger.warning(f"{endpoint} failed ({e}), retrying")
+        else:
+            failed = resp.status_code in RETRY_STATUSES
+            record_latency(endpoint, time.perf_counter() - start, error=failed)
+            if not failed or not idempotent or attempt == attempts - 1:
+                return resp
+            logger.warning(f"{endpoint} returned {resp.status_code}, retrying")
+        await asyncio.sleep(env.HTTP_BACKOFF * 2**attempt)
+
+    raise AssertionError("unreachable")
+
+
+async def claim_evaluation(evaluation_pid: uuid.UUID) -> bool:
+    try:
+        resp = await request(
+            "PUT",
+            f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=processing",
+            endpoint="PUT /evaluations/{pid}",
+            # A claim that reached the server must not be sent again
+            idempotent=False,
+        )
+        return resp.status_code == 200
+    except Exception as e:
+        logger.error(f"Error claiming evaluation {evaluation_pid}: {e}")
+        return False
+
+
+async def mark_completed(evaluation_pid: uuid.UUID) -> httpx.Response:
+    return await request(
+        "PUT",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?status=done",
+        endpoint="PUT /evaluations/{pid}",
+    )
+
+
+async def mark_failed(evaluation_pid: uuid.UUID) -> None:
+    payload = EvaluationStatusUpdateDTO(status="failed").model_dump()
+    await request(
+        "PUT",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}",
+        endpoint="PUT /evaluations/{pid}",
+        json=payload,
+    )
+
+
+async def get_evaluation_request(evaluation_pid: uuid.UUID) -> dict[str, Any]:
+    resp = await request(
+        "GET",
+        f"{API_URL_PREFIX}/evaluations/{evaluation_pid}?include=project,dataset,model,datashape",
+        endpoint="GET /evaluations/{pid}",
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def get_evaluation(evaluation_pid: uuid.UUID) -> Evaluation:
+    return Evaluation.model_validate(await get_evaluation_request(evaluation_pid))
+
+
+def _read_dataset_file(
+    path: str, dataset_format: str, columns: list[str] | None
+) -> pd.DataFrame:
+    if dataset_format == "parquet":
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        reader = pv.open_csv(path, convert_options=csv_convert_options(columns))
+        table = as_pandas_compatible(reader.read_all())
+    return table_to_pandas(table)
+
+
+async def get_dataset_data(
+    dataset_pid: uuid.UUID, columns: list[str] | None = None
+) -> pd.DataFrame:
+    """Download a dataset and load it as a DataFrame.
+
+    The body is streamed to a temporary file, then parsed in a worker thread so
+    the event loop is never blocked.
+
+    Args:
+        dataset_pid: UUID of the dataset to download
+        columns: Only read these columns. All columns are read if None.
+
+    Returns:
+        pd.DataFrame: The dataset
+    """
+    url = f"{API_URL_PREFIX}/datasets/{dataset_pid}/data"
+    start = time.perf_counter()
+    with tempfile.NamedTemporaryFile() as file:
+        async with get_async_client().stream(
+            "GET", url, headers={"Accept-Encoding": "gzip"}
+        ) as resp:
+            resp.raise_for_status()
+            content_type = resp.headers.get("Content-Type", "")
+            if "parquet" in content_type:
+                dataset_format = "parquet"
+            elif "csv" in content_type:
+                dataset_format = "csv"
+            else:
+                raise ValueError("Unsupported dataset format")
+            async for chunk in resp.aiter_bytes():
+                file.write(chunk)
+        file.flush()
+        record_latency(
+            "GET /datasets/{pid}/data", time.perf_counter() - start, error=False
+        )
+        return await asyncio.to_thread(
+            _read_dataset_file, file.name, dataset_format, columns
+        )
+
+
+async def get_datashape_request(datashape_pid: uuid.UUID) -> dict[str, Any]:
+    resp = await request(
+        "GET",
+        f"{API_URL_PREFIX}/datashape/{datashape_pid}",
+        endpoint="GET /datashape/{pid}",
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def patch_datashape(
+    dataset_pid: uuid.UUID, datashape: DataShape
+) -> httpx.Response:
+    resp = await request(
+        "PATCH",
+        f"{API_URL_PREFIX}/datasets/{dataset_pid}/datashape",
+        endpoint="PATCH /datasets/{pid}/datashape",
+        idempotent=True,
+        json=datashape.model_dump(),
+    )
+    resp.raise_for_status()
+    return resp
+
+
+async def patch_datashape_status(
+    datashape_pid: uuid.UUID, status: str
+) -> httpx.Response:
+    resp = await request(
+        "PATCH",
+        f"{API_URL_PREFIX}/datashapes/{datashape_pid}/status?status={status}",
+        endpoint="PATCH /datashapes/{pid}/status",
+        idempotent=True,
+    )
+    resp.raise_for_status()
+    return resp
+
+
+async def get_project_datashape(project_pid: uuid.UUID) -> DataShape:
+    resp = await request(
+        "GET",
+        f"{API_URL_PREFIX}/projects/{project_pid}/datashape",
+        endpoint="GET /projects/{pid}/datashape",
+    )
+    resp.raise_for_status()
+    return DataShape.model_validate(resp.json())
+
+
+async def post_measures(
+    evaluation_pid: uuid.UUID,
+    metrics: list[Measure],
+    batch_size: int | None = None,
+) -> MeasureUpload:
+    """Post metrics to the API for a specific evaluation.
+
+    Same chunked and compressed upload as ``api_client.post_measures``, with the
+    chunks sent one after the other.
+
+    Args:
+        evaluation_pid: UUID of the evaluation to post metrics for
+        metrics: List of metrics to post
+        batch_size: Number of metrics per request
+
+    Returns:
+        MeasureUpload: Summary of the upload
+
+    Raises:
+        MeasureUploadError: If some chunks were refused by the API
+    """
+    batch_size = batch_size or env.MEASURE_BATCH_SIZE
+    url = f"{API_URL_PREFIX}/evaluations/{evaluation_pid}/metrics"
+    headers = {"Content-Type": "application/json"}
+    if env.MEASURE_GZIP:
+        headers["Content-Encoding"] = "gzip"
+
+    failed = []
+    n_chunks = 0
+    for i in range(0, len(metrics), batch_size):
+        body = measures_to_json(metrics[i : i + batch_size])
+        key = hashlib.sha256(body).hexdigest()
+        if env.MEASURE_GZIP:
+            body = gzip.compress(body, compresslevel=5)
+        response = await request(
+            "POST",
+            url,
+            endpoint="POST /evaluations/{pid}/metrics",
+            idempotent=env.MEASURE_DEDUP,
+            content=body,
+            headers={**headers, "Idempotency-Key": key},
+        )
+        if response.status_code != 201:
+            logger.warning(
+                f"Chunk {n_chunks} of metrics refused, status {response.status_code}: "
+                f"{response.text[:500]}"
+            )
+            failed.append(n_chunks)
+        n_chunks += 1
+
+    if failed:
+        logger.error(f"ERROR: {len(failed)} chunks of metrics were not accepted")
+        raise MeasureUploadError(
+            failed, f"Chunks {failed} of metrics were not accepted by the API"
+        )
+    return MeasureUpload(n_measures=len(metrics), n_chunks=n_chunks, n_sent=n_chunks)
@@ -0,0 +1,225 @@
+"""Evaluation context shared by the tasks of an evaluation.
+
+The dataset and model tasks of an evaluation need the same evaluation, project
+datashape and datasets. They are fetched once from the API by the preparation
+task and saved in a directory of the worker-shared cache (the evaluation and
+datashape as JSON, the datasets as parquet files). The path of this directory is
+the handle given to the downstream tasks, which read it back without calling the
+API. If the context cannot be read, it is fetched again. The versions of the
+datasets are saved with them.
+
+The datasets are written batch by batch, and can be read back the same way with
+``iter_context_data``, so preparing an evaluation does not need its datasets to
+fit in memory.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from a4s_eval.data_model.evaluation import DataShape, Evaluation
+from a4s_eval.service.api_client import (
+    get_evaluation_request,
+    get_project_datashape,
+    iter_dataset_columns,
+    load_dataset_columns,
+    open_dataset_columns,
+)
+from a4s_eval.utils.arrow import table_to_pandas
+from a4s_eval.utils.env import CACHE_DIR
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+CONTEXT_DIR = f"{CACHE_DIR}/contexts"
+
+EVALUATION_FILE = "evaluation.json"
+DATASHAPE_FILE = "datashape.json"
+DATASET_FILE = "dataset.parquet"
+REFERENCE_FILE = "reference.parquet"
+VERSIONS_FILE = "versions.json"
+
+
+def context_path(evaluation_pid: uuid.UUID) -> str:
+    """Path of the context directory of an evaluation."""
+    return os.path.join(CONTEXT_DIR, str(evaluation_pid))
+
+
+def fetch_evaluation_context(
+    evaluation_pid: uuid.UUID, reference: bool = True, data: bool = True
+) -> tuple[Evaluation, DataShape]:
+    """Fetch an evaluation, its project datashape and its datasets from the API.
+
+    Only the columns used by the datashape are loaded.
+
+    Args:
+        evaluation_pid: UUID of the evaluation
+        reference: Whether to load the data of the model dataset
+        data: Whether to load the data of the datasets at all
+
+    Returns:
+        tuple[Evaluation, DataShape]: The evaluation, with the data of the
+            evaluated dataset and of the model dataset, and the datashape
+    """
+    evaluation = Evaluation.model_validate(get_evaluation_request(evaluation_pid))
+    datashape = get_project_datashape(evaluation.project.pid)
+    if not data:
+        return evaluation, datashape
+    load_dataset_columns(evaluation.dataset, datashape)
+    if reference:
+        load_dataset_columns(evaluation.model.dataset, datashape)
+    return evaluation, datashape
+
+
+def save_evaluation_context(evaluation_pid: uuid.UUID) -> str:
+    """Fetch the context of an evaluation and save it in the shared cache.
+
+    Args:
+        evaluation_pid: UUID of the evaluation
+
+    Returns:
+        str: Handle of the context, to be given to ``load_evaluation_context``
+    """
+    evaluation_data = get_evaluation_request(evaluation_pid)
+    evaluation = Evaluation.model_validate(evaluation_data)
+    datashape = get_project_datashape(evaluation.project.pid)
+
+    path = context_path(evaluation_pid)
+    os.makedirs(CONTEXT_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=CONTEXT_DIR, prefix=".tmp-")
+    try:
+        with open(os.path.join(tmp_path, EVALUATION_FILE), "w") as f:
+            json.dump(evaluation_data, f)
+        with open(os.path.join(tmp_path, DATASHAPE_FILE), "w") as f:
+            f.write(datashape.model_dump_json())
+        versions = {}
+        for dataset_pid, file_name in (
+            (evaluation.dataset.pid, DATASET_FILE),
+            (evaluation.model.dataset.pid, REFERENCE_FILE),
+        ):
+            batches, versions[file_name] = open_dataset_columns(dataset_pid, datashape)
+            _write_batches(batches, datashape, os.path.join(tmp_path, file_name))
+        with open(os.path.join(tmp_path, VERSIONS_FILE), "w") as f:
+            json.dump(versions, f)
+
+        # Replace a context left by a previous attempt
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    logger.debug(f"Context of evaluation {evaluation_pid} saved in {path}")
+    return path
+
+
+def _write_batches(
+    batches: Iterator[pa.RecordBatch], datashape: DataShape, path: str
+) -> None:
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_batch(batch)
+        if writer is None:
+            # Empty dataset, only the columns are known
+            columns = datashape.column_names()
+            pq.write_table(
+                pa.table({c: pa.array([], pa.null()) for c in columns}), path
+            )
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def load_evaluation_context(
+    evaluation_pid: uuid.UUID,
+    handle: str | None = None,
+    reference: bool = True,
+    data: bool = True,
+) -> tuple[Evaluation, DataShape]:
+    """Load the context of an evaluation.
+
+    Args:
+        evaluation_pid: UUID of the evaluation
+        handle: Handle returned by ``save_evaluation_context``. The context is
+            fetched from the API if None or if it cannot be read.
+        reference: Whether to load the data of the model dataset
+        data: Whether to load the data of the datasets at all. Without it, the
+            data can be read batch by batch with ``iter_context_data``.
+
+    Returns:
+        tuple[Evaluation, DataShape]: The evaluation, with the data of the
+            evaluated dataset and of the model dataset, and the datashape
+    """
+    if handle is None:
+        return fetch_evaluation_context(evaluation_pid, reference, data)
+
+    try:
+        with open(os.path.join(handle, EVALUATION_FILE)) as f:
+            evaluation = Evaluation.model_validate(json.load(f))
+        with open(os.path.join(handle, DATASHAPE_FILE)) as f:
+            datashape = DataShape.model_validate_json(f.read())
+        if not data:
+            return evaluation, datashape
+        with open(os.path.join(handle, VERSIONS_FILE)) as f:
+            versions = json.load(f)
+        evaluation.dataset.data = table_to_pandas(
+            pq.read_table(os.path.join(handle, DATASET_FILE), memory_map=True)
+        )
+        evaluation.dataset.version = versions.get(DATASET_FILE)
+        if reference:
+            evaluation.model.dataset.data = table_to_pandas(
+                pq.read_table(os.path.join(handle, REFERENCE_FILE), memory_map=True)
+            )
+            evaluation.model.dataset.version = versions.get(REFERENCE_FILE)
+    except (OSError, ValueError) as e:
+        logger.warning(
+            f"Context of evaluation {evaluation_pid} not readable ({e}), fetching it"
+        )
+        return fetch_evaluation_context(evaluation_pid, reference, data)
+
+    return evaluation, datashape
+
+
+def iter_context_data(
+    evaluation: Evaluation,
+    datashape: DataShape,
+    handle: str | None = None,
+    reference: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Read the data of a dataset of an evaluation batch by batch.
+
+    Args:
+        evaluation: The evaluation
+        datashape: Datashape of the project
+        handle: Handle returned by ``save_evaluation_context``. The data is read
+            from the API if None or if the context has no such dataset.
+        reference: Read the model dataset instead of the evaluated dataset
+
+    Yields:
+        pd.DataFrame: Consecutive batches of rows of the dataset
+    """
+    path = None
+    if handle is not None:
+        path = os.path.join(handle, REFERENCE_FILE if reference else DATASET_FILE)
+    if path is not None and os.path.exists(path):
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches()
+    else:
+        dataset = evaluation.model.dataset if reference else evaluation.dataset
+        batches = iter_dataset_columns(dataset.pid, datashape)
+    for batch in batches:
+        yield table_to_pandas(pa.Table.from_batches([batch]))
+
+
+def remove_evaluation_context(evaluation_pid: uuid.UUID) -> None:
+    """Remove the saved context of an evaluation, if any."""
+    shutil.rmtree(context_path(evaluation_pid), ignore_errors=True)
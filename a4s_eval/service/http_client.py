@@ -0,0 +1,160 @@
+"""Process-wide HTTP client used to talk to the A4S API.
+
+All calls go through a single ``requests.Session`` per process, so TCP and TLS
+connections are kept alive and reused from a bounded pool instead of being set
+up again for every request. Every call gets a timeout, failed connections are
+retried, and idempotent calls are also retried on timeouts and transient server
+errors, with an exponential backoff. All the retries are made by ``request``,
+the session itself does not retry. Latencies are recorded per endpoint.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+
+from a4s_eval.utils import env
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+@dataclass
+class EndpointStats:
+    """Latency counters of an endpoint."""
+
+    count: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_session_lock = threading.Lock()
+
+_stats: dict[str, EndpointStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Get the HTTP session of the current process.
+
+    The session is created lazily, and created again after a fork, so pooled
+    connections are never shared between worker processes.
+
+    Returns:
+        requests.Session: The pooled session
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _create_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    # Only redirects are followed here, retries are all made by request()
+    retry = Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5)
+    adapter = HTTPAdapter(
+        pool_connections=env.HTTP_POOL_SIZE,
+        pool_maxsize=env.HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def record_latency(endpoint: str, seconds: float, error: bool) -> None:
+    """Add a call to the latency counters of an endpoint."""
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, EndpointStats())
+        stats.count += 1
+        stats.errors += int(error)
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+
+def get_endpoint_stats() -> dict[str, EndpointStats]:
+    """Snapshot of the latency counters of the current process, by endpoint."""
+    with _stats_lock:
+        return {name: EndpointStats(**vars(s)) for name, s in _stats.items()}
+
+
+def reset_endpoint_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def _not_sent(error: requests.RequestException) -> bool:
+    """Whether a request failed before reaching the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    endpoint: str,
+    idempotent: bool | None = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """Send a request through the pooled session.
+
+    Args:
+        method: HTTP method
+        url: Full URL of the request
+        endpoint: Name of the endpoint for the latency counters, e.g.
+            ``"PUT /evaluations/{pid}"``
+        idempotent: Whether the call can be retried after it reached the server.
+            Defaults to True for idempotent HTTP methods. Failed connections
+            are always retried.
+        **kwargs: Passed to ``requests.Session.request``. A default
+            (connect, read) timeout is used if none is given.
+
+    Returns:
+        requests.Response: The response of the last attempt
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    kwargs.setdefault("timeout", (env.HTTP_CONNECT_TIMEOUT, env.HTTP_READ_TIMEOUT))
+    attempts = env.HTTP_RETRIES + 1
+
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        try:
+            resp = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            record_latency(endpoint, time.perf_counter() - start, error=True)
+            if attempt == attempts - 1 or not (idempotent or _not_sent(e)):
+                raise
+            logger.warning(f"{endpoint} failed ({e}), retrying")
+        else:
+            failed = resp.status_code in RETRY_STATUSES
+            record_latency(endpoint, time.perf_counter() - start, error=failed)
+            if not failed or not idempotent or attempt == attempts - 1:
+                return resp
+            logger.warning(f"{endpoint} returned {resp.status_code}, retrying")
+            resp.close()
+        time.sleep(env.HTTP_BACKOFF * 2**attempt)
+
+    raise AssertionError("unreachable")
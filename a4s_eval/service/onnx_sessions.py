@@ -0,0 +1,161 @@
+"""In-process cache of ONNX inference sessions.
+
+Building an ``InferenceSession`` parses the model and runs the graph optimizer,
+which can take longer than the inference itself. Sessions are therefore kept in
+memory, keyed by model pid and content hash, and evicted least recently used
+first once their models exceed a memory budget. The optimized graph of a cached
+model is also saved with its entry of the model cache, so a new worker process
+loads it without running the optimizer again. The graph is optimized for the
+CPU of the host, and saved under the name of the host.
+"""
+
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+import onnxruntime as ort
+
+from a4s_eval.utils import env
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+# Name of the optimized graph among the files of a model cache entry
+OPTIMIZED_NAME = f"optimized-{socket.gethostname()}.onnx"
+
+
+def session_options(optimized: bool = False) -> ort.SessionOptions:
+    """Build the session options from the ONNX_* environment variables.
+
+    Args:
+        optimized: Whether the model was already optimized, in which case the
+            graph optimizer is disabled.
+
+    Returns:
+        ort.SessionOptions: The options
+    """
+    options = ort.SessionOptions()
+    # 0 lets onnxruntime pick the number of threads
+    options.intra_op_num_threads = env.ONNX_INTRA_OP_THREADS
+    options.inter_op_num_threads = env.ONNX_INTER_OP_THREADS
+    options.execution_mode = EXECUTION_MODES[env.ONNX_EXECUTION_MODE]
+    options.enable_cpu_mem_arena = env.ONNX_MEM_ARENA
+    options.enable_mem_pattern = env.ONNX_MEM_PATTERN
+    options.graph_optimization_level = (
+        ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        if optimized
+        else ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    return options
+
+
+def _create_session(
+    model: bytes | str, optimized_path: str | None
+) -> ort.InferenceSession:
+    if optimized_path is None:
+        return ort.InferenceSession(model, session_options())
+    if os.path.exists(optimized_path):
+        try:
+            return ort.InferenceSession(optimized_path, session_options(optimized=True))
+        except Exception as e:
+            logger.warning(f"Cannot load optimized model {optimized_path}: {e}")
+
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=".onnx", dir=os.path.dirname(optimized_path), prefix=".tmp-"
+    )
+    os.close(fd)
+    try:
+        options = session_options()
+        options.optimized_model_filepath = tmp_path
+        session = ort.InferenceSession(model, options)
+        os.replace(tmp_path, optimized_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return session
+
+
+class SessionCache:
+    """LRU cache of inference sessions bounded by the size of their models."""
+
+    def __init__(self, max_bytes: int):
+        """Initialize the cache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached models
+        """
+        self.max_bytes = max_bytes
+        self._sessions: OrderedDict[
+            tuple[uuid.UUID, str], tuple[ort.InferenceSession, int]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._sessions.values())
+
+    def get(
+        self,
+        model_pid: uuid.UUID,
+        model: bytes | str,
+        optimized_path: str | None = None,
+    ) -> ort.InferenceSession:
+        """Get the session of a model, creating it if it is not cached.
+
+        Args:
+            model_pid: UUID of the model
+            model: Content of the model, or path to the model file
+            optimized_path: Where the optimized graph of the model is saved and
+                loaded from, see ``OPTIMIZED_NAME``. Not saved if None.
+
+        Returns:
+            ort.InferenceSession: The session, shared with other callers
+        """
+        if isinstance(model, bytes):
+            content_hash = hashlib.sha256(model).hexdigest()
+            size = len(model)
+        else:
+            with open(model, "rb") as f:
+                content_hash = hashlib.file_digest(f, "sha256").hexdigest()
+            size = os.path.getsize(model)
+        key = (model_pid, content_hash)
+
+        with self._lock:
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                logger.debug(f"Session of model {model_pid} served from memory")
+                return self._sessions[key][0]
+
+            session = _create_session(model, optimized_path)
+            # Older versions of the model will not be used again
+            for old_key in [k for k in self._sessions if k[0] == model_pid]:
+                del self._sessions[old_key]
+            self._sessions[key] = (session, size)
+            self._evict(keep=key)
+            return session
+
+    def _evict(self, keep: tuple[uuid.UUID, str]) -> None:
+        total = self.total_bytes
+        for key in list(self._sessions):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._sessions.pop(key)[1]
+            logger.debug(f"Evicted session of model {key[0]}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+sessions = SessionCache(env.ONNX_SESSION_CACHE_BYTES)
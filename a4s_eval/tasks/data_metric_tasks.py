@@ -5,17 +5,21 @@ from multiprocessing.util import get_logger
 from a4s_eval.celery_app import celery_app
 from a4s_eval.data_model.measure import Measure
 from a4s_eval.metric_registries.data_metric_registry import data_metric_registry
-from a4s_eval.service.api_client import (
-    get_dataset_data,
-    get_evaluation,
-    get_project_datashape,
-    post_measures,
+from a4s_eval.service.api_client import post_measures
+from a4s_eval.service.evaluation_context import (
+    iter_context_data,
+    load_evaluation_context,
 )
+from a4s_eval.tasks.window_pool import evaluate_sketch_windows, evaluate_windows
 from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.env import DRIFT_MODE, DRIFT_SKETCH_K
+from a4s_eval.utils.sketches import BucketSketches, FrameSketch
 
 
 @celery_app.task
-def dataset_evaluation_task(evaluation_pid: uuid.UUID) -> None:
+def dataset_evaluation_task(
+    evaluation_pid: uuid.UUID, context: str | None = None
+) -> None:
     get_logger().info(f"Starting evaluation task for {evaluation_pid}.")
 
     # Check if any evaluators are registered
@@ -25,43 +29,49 @@ def dataset_evaluation_task(evaluation_pid: uuid.UUID) -> None:
         get_logger().info(f"  - {name}")
 
     try:
-        evaluation = get_evaluation(evaluation_pid)
-        evaluation.dataset.data = get_dataset_data(evaluation.dataset.pid)
-        evaluation.model.dataset.data = get_dataset_data(evaluation.model.dataset.pid)
+        # In sketch mode the datasets are streamed, never loaded
+        sketch_mode = DRIFT_MODE == "sketch"
+        evaluation, datashape = load_evaluation_context(
+            evaluation_pid, context, data=not sketch_mode
+        )
 
         metrics: list[Measure] = []
 
-        x_test = evaluation.dataset.data
-
         iteration_count = 0
-        datashape = get_project_datashape(evaluation.project.pid)
 
         try:
             if not datashape.date:
                 raise ValueError(
                     "Datashape is missing a date feature, which is required for time-based evaluation."
                 )
-            date_iterator = DateIterator(
-                date_round="1 D",
-                window=evaluation.project.window_size,
-                freq=evaluation.project.frequency,
-                df=evaluation.dataset.data,
-                date_feature=datashape.date.name,
-            )
+            if sketch_mode:
+                reference = FrameSketch(datashape, DRIFT_SKETCH_K)
+                for df in iter_context_data(
+                    evaluation, datashape, context, reference=True
+                ):
+                    reference.update(df)
+                buckets = BucketSketches(datashape, "1 D", DRIFT_SKETCH_K)
+                for df in iter_context_data(evaluation, datashape, context):
+                    buckets.update(df)
+                batches = buckets.batches(
+                    evaluation.project.window_size, evaluation.project.frequency
+                )
 
-            for i, (date_val, x_curr) in enumerate(date_iterator):
-                iteration_count += 1
-                get_logger().info(
-                    f"Iteration {i}, date: {date_val}, data shape: {x_curr.shape}"
+                iteration_count = len(batches)
+                metrics = evaluate_sketch_windows(
+                    datashape, evaluation, reference, buckets, batches
+                )
+            else:
+                date_iterator = DateIterator(
+                    date_round="1 D",
+                    window=evaluation.project.window_size,
+                    freq=evaluation.project.frequency,
+                    df=evaluation.dataset.data,
+                    date_feature=datashape.date.name,
                 )
-                evaluation.dataset.data = x_curr
 
-                for name, evaluator in data_metric_registry:
-                    get_logger().info(f"Running evaluator: {name}")
-                    new_metrics = evaluator(
-                        datashape, evaluation.model.dataset, evaluation.dataset
-                    )
-                    metrics.extend(new_metrics)
+                iteration_count = len(date_iterator.batches)
+                metrics = evaluate_windows("data", datashape, evaluation, date_iterator)
 
         except Exception as e:
             get_logger().error(f"Error in DateIterator: {e}")
@@ -70,13 +80,11 @@ def dataset_evaluation_task(evaluation_pid: uuid.UUID) -> None:
         get_logger().info(f"Total iterations: {iteration_count}")
         get_logger().info(f"Total metrics generated: {len(metrics)}")
 
-        evaluation.dataset.data = x_test
-
         get_logger().debug(f"Posting {len(metrics)} metrics to API...")
         try:
-            response = post_measures(evaluation_pid, metrics)
+            upload = post_measures(evaluation_pid, metrics)
             get_logger().info(
-                f"Metrics posted successfully, status: {response.status_code}."
+                f"Metrics posted successfully, {upload.n_measures} metrics in {upload.n_chunks} chunks."
             )
         except Exception as e:
             get_logger().error(f"Error posting metrics: {e}")
@@ -7,13 +7,9 @@ from a4s_eval.data_model.measure import Measure
 from a4s_eval.metric_registries.prediction_metric_registry import (
     prediction_metric_registry,
 )
-from a4s_eval.service.api_client import (
-    get_dataset_data,
-    get_evaluation,
-    get_onnx_model,
-    get_project_datashape,
-    post_measures,
-)
+from a4s_eval.service.api_client import get_onnx_model, post_measures
+from a4s_eval.service.evaluation_context import load_evaluation_context
+from a4s_eval.tasks.window_pool import evaluate_windows
 from a4s_eval.utils.dates import DateIterator
 from a4s_eval.utils.env import API_URL_PREFIX
 from a4s_eval.utils.logging import get_logger
@@ -22,7 +18,9 @@ logger = get_logger()
 
 
 @celery_app.task
-def model_evaluation_task(evaluation_pid: uuid.UUID) -> None:
+def model_evaluation_task(
+    evaluation_pid: uuid.UUID, context: str | None = None
+) -> None:
     get_logger().info(f"Starting evaluation task for {evaluation_pid}.")
 
     # Debug: Check registry and API configuration
@@ -35,14 +33,13 @@ def model_evaluation_task(evaluation_pid: uuid.UUID) -> None:
         get_logger().info(f"  - {name}")
 
     try:
-        evaluation = get_evaluation(evaluation_pid)
-        evaluation.dataset.data = get_dataset_data(evaluation.dataset.pid)
+        evaluation, datashape = load_evaluation_context(
+            evaluation_pid, context, reference=False
+        )
         session = get_onnx_model(evaluation.model.pid)
 
         metrics: list[Measure] = []
 
-        datashape = get_project_datashape(evaluation.project.pid)
-
         x_test = evaluation.dataset.data
         x_test_np = x_test[[f.name for f in datashape.features]].to_numpy()
 
@@ -67,28 +64,15 @@ def model_evaluation_task(evaluation_pid: uuid.UUID) -> None:
                 date_feature=datashape.date.name,
             )
 
-            for i, (date_val, x_curr) in enumerate(date_iterator):
-                iteration_count += 1
-                get_logger().info(
-                    f"Iteration {i}, date: {date_val}, data shape: {x_curr.shape}"
-                )
-                evaluation.dataset.data = x_curr
-
-                ## Get the current y_pred_proba for current date batch
-                ## ATTENTION: This assumes that the index of x_test is not predifined
-                y_curr_pred_proba = y_pred_proba[list(x_curr.index)]
-
-                evaluator_count = 0
-                for name, evaluator in prediction_metric_registry:
-                    evaluator_count += 1
-                    get_logger().info(f"Running evaluator: {name}")
-                    new_metrics = evaluator(
-                        datashape,
-                        evaluation.model,
-                        evaluation.dataset,
-                        y_curr_pred_proba,
-                    )
-                    metrics.extend(new_metrics)
+            iteration_count = len(date_iterator.batches)
+            # Predictions in the order of the rows sorted by date
+            metrics = evaluate_windows(
+                "prediction",
+                datashape,
+                evaluation,
+                date_iterator,
+                y_pred_proba=y_pred_proba[date_iterator.order],
+            )
 
         except Exception as e:
             get_logger().error(f"Error in DateIterator: {e}")
@@ -101,9 +85,9 @@ def model_evaluation_task(evaluation_pid: uuid.UUID) -> None:
 
         get_logger().debug(f"Posting {len(metrics)} metrics to API...")
         try:
-            response = post_measures(evaluation_pid, metrics)
+            upload = post_measures(evaluation_pid, metrics)
             get_logger().info(
-                f"Metrics posted successfully, status: {response.status_code}."
+                f"Metrics posted successfully, {upload.n_measures} metrics in {upload.n_chunks} chunks."
             )
         except Exception as e:
             get_logger().error(f"Error posting metrics: {e}")
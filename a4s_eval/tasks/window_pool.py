@@ -0,0 +1,399 @@
+"""Evaluation of the windows of an evaluation, sequentially or in parallel.
+
+Windows are independent, so with ``WINDOW_WORKERS`` above 1 they are split in
+contiguous chunks evaluated by a pool of processes. The rows sorted by date (and
+the reference rows and predictions) are written once to Arrow IPC and numpy files
+that every worker memory-maps when it starts, and the running statistics of the
+windows are computed once, their per-row arrays memory-mapped too, so the
+workers share the pages of the rows and only the window bounds are sent with
+each chunk. Each worker converts the rows of one window at a time to pandas.
+The profile of the reference is built once too, and loaded by memory map in the
+workers, whose reference only has the columns read outside of the profile.
+The measures are gathered back in window order.
+
+The pool is a billiard pool, the multiprocessing fork of Celery, whose
+processes can be started from the daemonic processes of the default Celery
+prefork pool.
+
+A window whose evaluation fails is logged and keeps the measures of the metrics
+run before the failure, the other windows are still evaluated.
+"""
+
+import os
+import tempfile
+from typing import Any, Literal
+
+import billiard
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from a4s_eval.data_model.evaluation import DataShape, Dataset, Evaluation
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric_registry
+from a4s_eval.metrics.data_metrics.drift_metric import sketch_drift_metric
+from a4s_eval.metrics.data_metrics.kl_metric import sketch_divergence_metric
+from a4s_eval.metric_registries.prediction_metric_registry import (
+    prediction_metric_registry,
+)
+from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.env import CACHE_DIR, WINDOW_WORKERS
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.reference_profile import (
+    ReferenceProfile,
+    reference_profile,
+    share_profile,
+)
+from a4s_eval.utils.sketches import BucketSketches, FrameSketch
+from a4s_eval.utils.window_context import WindowContext
+from a4s_eval.utils.window_stats import WindowStats, iter_window_stats
+
+logger = get_logger()
+
+WindowKind = Literal["data", "prediction"]
+
+# Chunks per worker, to balance windows of different sizes
+CHUNKS_PER_WORKER = 4
+
+
+def evaluate_window(
+    kind: WindowKind,
+    datashape: DataShape,
+    evaluation: Evaluation,
+    dataset: Dataset,
+    y_pred_proba: np.ndarray | None = None,
+) -> list[Measure]:
+    """Run the registered metrics on one window.
+
+    Args:
+        kind: "data" to run the data metrics, "prediction" to run the prediction
+            metrics
+        datashape: Datashape of the project
+        evaluation: The evaluation
+        dataset: The evaluated dataset, restricted to the window
+        y_pred_proba: Predicted probabilities of the rows of the window
+
+    Returns:
+        list[Measure]: The measures of the window, up to the first failing
+            metric
+    """
+    measures: list[Measure] = []
+    try:
+        if kind == "data":
+            for name, evaluator in data_metric_registry:
+                logger.info(f"Running evaluator: {name}")
+                measures.extend(evaluator(datashape, evaluation.model.dataset, dataset))
+        else:
+            for name, evaluator in prediction_metric_registry:
+                logger.info(f"Running evaluator: {name}")
+                measures.extend(
+                    evaluator(datashape, evaluation.model, dataset, y_pred_proba)
+                )
+    except Exception as e:
+        end = dataset.context.end if dataset.context is not None else None
+        logger.exception(f"Error in window ending {end}: {e}")
+    return measures
+
+
+def window_workers() -> int:
+    """Number of processes evaluating windows, all the cores if WINDOW_WORKERS is 0."""
+    return WINDOW_WORKERS if WINDOW_WORKERS > 0 else os.cpu_count() or 1
+
+
+def evaluate_windows(
+    kind: WindowKind,
+    datashape: DataShape,
+    evaluation: Evaluation,
+    iterator: DateIterator,
+    y_pred_proba: np.ndarray | None = None,
+) -> list[Measure]:
+    """Run the registered metrics on every window of a date iterator.
+
+    Args:
+        kind: "data" to run the data metrics, "prediction" to run the prediction
+            metrics
+        datashape: Datashape of the project
+        evaluation: The evaluation. For data metrics, the model dataset must
+            hold the reference data.
+        iterator: Iterator over the windows of the evaluated data, not consumed
+        y_pred_proba: Predicted probabilities of the rows of ``iterator.df``, in
+            the same order, for prediction metrics
+
+    Returns:
+        list[Measure]: The measures of all the windows, in window order
+    """
+    n_workers = min(window_workers(), len(iterator.batches))
+    if n_workers > 1:
+        try:
+            return _evaluate_parallel(
+                kind, datashape, evaluation, iterator, y_pred_proba, n_workers
+            )
+        except Exception as e:
+            # Failing metrics are handled by each window, this is the pool
+            logger.warning(f"Window pool failed ({e}), evaluating sequentially")
+
+    profile = _profile(kind, datashape, evaluation)
+    y_pred = np.argmax(y_pred_proba, axis=1) if y_pred_proba is not None else None
+    window_stats = iter_window_stats(
+        datashape,
+        iterator,
+        y_pred=y_pred,
+        profile=profile,
+        version=evaluation.dataset.version,
+        confusion_only=kind == "prediction",
+    )
+
+    measures: list[Measure] = []
+    for i, ((lo, hi), stats) in enumerate(zip(iterator.bounds, window_stats)):
+        x_curr = iterator.df.iloc[lo:hi]
+        logger.info(
+            f"Iteration {i}, date: {iterator.batches[i][1]}, data shape: {x_curr.shape}"
+        )
+        window_proba = y_pred_proba[lo:hi] if y_pred_proba is not None else None
+        dataset = window_dataset(
+            datashape, evaluation, x_curr, stats, window_proba, *iterator.batches[i]
+        )
+        measures.extend(
+            evaluate_window(kind, datashape, evaluation, dataset, window_proba)
+        )
+    return measures
+
+
+def evaluate_sketch_windows(
+    datashape: DataShape,
+    evaluation: Evaluation,
+    reference: FrameSketch,
+    buckets: BucketSketches,
+    batches: list[tuple[pd.Timestamp, pd.Timestamp]],
+) -> list[Measure]:
+    """Approximate the data drift of every window from summaries of the data.
+
+    Used instead of ``evaluate_windows`` by the sketch drift mode, where the
+    datasets are streamed into summaries and never loaded. Only the drift and
+    the divergences are measured, with the same measure names as the "Data
+    drift" and "Divergences" metrics.
+
+    Args:
+        datashape: Datashape of the project
+        evaluation: The evaluation
+        reference: Summary of the reference dataset
+        buckets: Summaries of the date buckets of the evaluated dataset
+        batches: Windows of the evaluated dataset, from ``buckets.batches``
+
+    Returns:
+        list[Measure]: The measures of all the windows, in window order
+    """
+    measures: list[Measure] = []
+    for i, (start, end) in enumerate(batches):
+        window, date = buckets.window(start, end)
+        logger.info(f"Iteration {i}, date: {end}, rows: {window.n_rows}")
+        if date is None:
+            continue
+        for metric in (sketch_drift_metric, sketch_divergence_metric):
+            measures.extend(
+                metric(datashape, evaluation.dataset.shape, reference, window, date)
+            )
+    return measures
+
+
+def window_dataset(
+    datashape: DataShape,
+    evaluation: Evaluation,
+    data: pd.DataFrame,
+    stats: Any,
+    y_pred_proba: np.ndarray | None,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+) -> Dataset:
+    """Copy of the evaluated dataset restricted to a window, with its context.
+
+    Args:
+        datashape: Datashape of the project
+        evaluation: The evaluation
+        data: Rows of the window
+        stats: Statistics of the window
+        y_pred_proba: Predicted probabilities of the rows of the window
+        start: Start of the window
+        end: End of the window
+
+    Returns:
+        Dataset: The dataset given to the metrics of the window
+    """
+    context = WindowContext(
+        datashape,
+        data,
+        y_pred_proba,
+        start=start,
+        end=end,
+        shape=evaluation.dataset.shape,
+    )
+    # The rows of a window are not the content of the dataset version
+    return evaluation.dataset.model_copy(
+        update={"data": data, "version": None, "stats": stats, "context": context}
+    )
+
+
+def _profile(
+    kind: WindowKind, datashape: DataShape, evaluation: Evaluation
+) -> ReferenceProfile | None:
+    """Profile of the reference data, for data metrics."""
+    if kind != "data" or evaluation.model.dataset.data is None:
+        return None
+    return reference_profile(datashape, evaluation.model.dataset)
+
+
+def _without_data(evaluation: Evaluation) -> Evaluation:
+    """Copy of an evaluation without data and model session, cheap to pickle."""
+    model_dataset = evaluation.model.dataset.model_copy(
+        update={"data": None, "stats": None, "context": None}
+    )
+    return evaluation.model_copy(
+        update={
+            "dataset": evaluation.dataset.model_copy(
+                update={"data": None, "stats": None, "context": None}
+            ),
+            "model": evaluation.model.model_copy(
+                update={"model": None, "dataset": model_dataset}
+            ),
+        }
+    )
+
+
+def _write_frame(df: pd.DataFrame, path: str) -> None:
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _map_frame(path: str) -> pa.Table:
+    """Table memory-mapped from an Arrow IPC file, without reading it."""
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _evaluate_parallel(
+    kind: WindowKind,
+    datashape: DataShape,
+    evaluation: Evaluation,
+    iterator: DateIterator,
+    y_pred_proba: np.ndarray | None,
+    n_workers: int,
+) -> list[Measure]:
+    n_windows = len(iterator.batches)
+    chunks = np.array_split(
+        np.arange(n_windows), min(n_windows, n_workers * CHUNKS_PER_WORKER)
+    )
+    logger.info(f"Evaluating {n_windows} windows with {n_workers} processes")
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=CACHE_DIR, prefix=".windows-") as tmp_dir:
+        paths: dict[str, str] = {"df": os.path.join(tmp_dir, "df.arrow")}
+        _write_frame(iterator.df, paths["df"])
+        profile = _profile(kind, datashape, evaluation)
+        if profile is not None:
+            # Categorical features of the reference are only read through its
+            # profile, which the workers share
+            columns = [
+                f.name for f in datashape.features if f.name not in profile.categorical
+            ]
+            paths["reference"] = os.path.join(tmp_dir, "reference.arrow")
+            _write_frame(evaluation.model.dataset.data[columns], paths["reference"])
+        if y_pred_proba is not None:
+            paths["y_pred_proba"] = os.path.join(tmp_dir, "y_pred_proba.npy")
+            np.save(paths["y_pred_proba"], y_pred_proba)
+        y_pred = np.argmax(y_pred_proba, axis=1) if y_pred_proba is not None else None
+        stats = WindowStats(
+            datashape,
+            iterator.df,
+            y_pred=y_pred,
+            profile=profile,
+            confusion_only=kind == "prediction",
+        ).map_rows(tmp_dir)
+
+        # Forking a process running onnxruntime or HTTP threads is unsafe
+        context = billiard.get_context("forkserver")
+        with context.Pool(
+            processes=n_workers,
+            initializer=_init_worker,
+            initargs=(
+                kind,
+                datashape,
+                _without_data(evaluation),
+                paths,
+                stats,
+                profile,
+            ),
+        ) as pool:
+            results = pool.map(
+                _evaluate_chunk,
+                [
+                    [(int(i), *iterator.bounds[i], *iterator.batches[i]) for i in chunk]
+                    for chunk in chunks
+                    if len(chunk)
+                ],
+                chunksize=1,
+            )
+
+    measures: list[Measure] = []
+    for chunk_measures in results:
+        for window_measures in chunk_measures:
+            measures.extend(window_measures)
+    return measures
+
+
+# State of a pool worker, set by _init_worker
+_worker: dict[str, Any] = {}
+
+
+def _init_worker(
+    kind: WindowKind,
+    datashape: DataShape,
+    evaluation: Evaluation,
+    paths: dict[str, str],
+    stats: WindowStats,
+    profile: ReferenceProfile | None,
+) -> None:
+    if "reference" in paths:
+        # Numerical columns without missing values stay views of the mapped file
+        reference = evaluation.model.dataset
+        reference.data = _map_frame(paths["reference"]).to_pandas(split_blocks=True)
+        share_profile(datashape, reference, profile)
+    _worker.update(
+        kind=kind,
+        datashape=datashape,
+        evaluation=evaluation,
+        table=_map_frame(paths["df"]),
+        y_pred_proba=(
+            np.load(paths["y_pred_proba"], mmap_mode="r")
+            if "y_pred_proba" in paths
+            else None
+        ),
+        stats=stats,
+    )
+
+
+def _evaluate_chunk(
+    windows: list[tuple[int, int, int, pd.Timestamp, pd.Timestamp]],
+) -> list[list[Measure]]:
+    """Evaluate consecutive windows, given as (index, lo, hi, start, end)."""
+    kind = _worker["kind"]
+    datashape = _worker["datashape"]
+    evaluation = _worker["evaluation"]
+    table = _worker["table"]
+    y_pred_proba = _worker["y_pred_proba"]
+    stats = _worker["stats"]
+
+    results = []
+    for i, lo, hi, start, end in windows:
+        x_curr = table.slice(lo, hi - lo).to_pandas(split_blocks=True)
+        logger.info(f"Iteration {i}, date: {end}, data shape: {x_curr.shape}")
+        window_proba = (
+            np.asarray(y_pred_proba[lo:hi]) if y_pred_proba is not None else None
+        )
+        dataset = window_dataset(
+            datashape, evaluation, x_curr, stats.move(lo, hi), window_proba, start, end
+        )
+        results.append(
+            evaluate_window(kind, datashape, evaluation, dataset, window_proba)
+        )
+    return results
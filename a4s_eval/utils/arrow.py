@@ -0,0 +1,83 @@
+"""Arrow helpers used to load datasets.
+
+Datasets are parsed with pyarrow and converted to pandas at the end. These
+helpers keep the resulting frames identical to what pandas readers produce.
+"""
+
+from typing import TypeVar
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+ArrowData = TypeVar("ArrowData", pa.RecordBatch, pa.Table)
+
+# Default na_values of pd.read_csv
+NULL_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+
+def csv_convert_options(columns: list[str] | None = None) -> pv.ConvertOptions:
+    """CSV conversion options matching pd.read_csv.
+
+    Args:
+        columns (list[str] | None): Only read these columns, the Arrow
+            counterpart of pd.read_csv(usecols=...). All columns if None.
+
+    Returns:
+        pv.ConvertOptions: The conversion options
+    """
+    # Dates are kept as strings, and the default missing value markers are
+    # missing in string columns too, as pd.read_csv does.
+    return pv.ConvertOptions(
+        timestamp_parsers=[],
+        include_columns=columns,
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+    )
+
+
+def pandas_compatible_schema(schema: pa.Schema) -> pa.Schema:
+    """Schema of the data returned by ``as_pandas_compatible``."""
+    return pa.schema(
+        f.with_type(pa.string()) if pa.types.is_temporal(f.type) else f for f in schema
+    )
+
+
+def as_pandas_compatible(data: ArrowData) -> ArrowData:
+    """Cast inferred temporal columns back to strings to match pd.read_csv."""
+    if not any(pa.types.is_temporal(f.type) for f in data.schema):
+        return data
+    columns = [
+        col.cast(pa.string()) if pa.types.is_temporal(col.type) else col
+        for col in data.columns
+    ]
+    return type(data).from_arrays(columns, names=data.schema.names)
+
+
+def table_to_pandas(table: pa.Table) -> pd.DataFrame:
+    """Convert a table to pandas, releasing Arrow memory along the way.
+
+    self_destruct frees each Arrow column once converted, so only one copy of
+    the data is alive at any time.
+    """
+    return table.to_pandas(self_destruct=True, split_blocks=True)
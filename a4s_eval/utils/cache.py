@@ -0,0 +1,310 @@
+"""Persistent on-disk cache shared by the worker processes of a host.
+
+Entries are identified by a key (e.g. a dataset pid) and by the HTTP validators
+(ETag / Last-Modified) of the content they hold, so an entry can be revalidated
+with a conditional GET instead of being downloaded again. The cache is bounded in
+size and evicts the least recently used entries first. Lock files make concurrent
+accesses from several worker processes safe.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Mapping
+
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+LOCK_SUFFIX = ".lock"
+META_SUFFIX = ".json"
+GLOBAL_LOCK = "cache.lock"
+TMP_PREFIX = ".tmp-"
+# Temporary files not written for this long are left by killed processes
+TMP_MAX_AGE = 3600
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """A cached file and the HTTP validators of its content."""
+
+    key: str
+    path: str
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Headers to revalidate this entry with a conditional GET."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    @property
+    def version(self) -> str:
+        """Version of the content, from its validators."""
+        return content_version(self.etag, self.last_modified)
+
+
+def response_validators(headers: Mapping[str, str]) -> tuple[str | None, str | None]:
+    """Extract the ETag and Last-Modified validators from response headers."""
+    return headers.get("ETag"), headers.get("Last-Modified")
+
+
+def content_version(etag: str | None, last_modified: str | None) -> str:
+    """Identifier of a content given by its HTTP validators."""
+    return hashlib.sha256(f"{etag}|{last_modified}".encode()).hexdigest()[:16]
+
+
+class DiskCache:
+    """Size-bounded LRU cache of files stored in a directory.
+
+    For each key, the directory holds a metadata file ``<key>.json`` pointing to
+    the current data file ``<key>.<content hash><suffix>``, and a lock file
+    ``<key>.lock``. Files derived from the data (``companion_path``) are named
+    after the data file, counted in the size of the entry and removed with it.
+    The recency of an entry is the modification time of its data file, which is
+    refreshed on every hit.
+
+    Entries are published by their writers under the exclusive lock of their
+    key. Readers do not lock an opened entry: a data file removed by an update or
+    an eviction stays readable through the open file or mapping.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """Initialize the cache.
+
+        Args:
+            root (str): Directory where the entries are stored
+            max_bytes (int): Maximum total size of the data files
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _flock(self, name: str) -> Iterator[None]:
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(name), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """Lock an entry across processes.
+
+        Writers hold the lock while they revalidate, download and publish an
+        entry, and the entry is not evicted meanwhile.
+
+        Args:
+            key (str): Key of the entry
+        """
+        with self._flock(f"{key}{LOCK_SUFFIX}"):
+            yield
+
+    def get(self, key: str) -> CacheEntry | None:
+        """Look up an entry.
+
+        Args:
+            key (str): Key of the entry
+
+        Returns:
+            CacheEntry | None: The entry, or None if it is not cached
+        """
+        try:
+            with open(self._path(f"{key}{META_SUFFIX}")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        entry = CacheEntry(
+            key=key,
+            path=self._path(meta["file"]),
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+        )
+        if not os.path.exists(entry.path):
+            return None
+        return entry
+
+    def companion_path(self, entry: CacheEntry, name: str) -> str:
+        """Path of a file derived from the data of an entry.
+
+        The file is written by the caller, with the lock of the entry held. It is
+        removed when the entry is updated or evicted.
+
+        Args:
+            entry (CacheEntry): The entry
+            name (str): Name of the file among the files of the entry
+        """
+        return f"{entry.path}-{name}"
+
+    def _files(self, path: str, names: list[str] | None = None) -> list[str]:
+        """Data file of an entry and its companion files."""
+        base = os.path.basename(path)
+        if names is None:
+            names = os.listdir(self.root)
+        return [
+            self._path(name)
+            for name in names
+            if name == base or name.startswith(f"{base}-")
+        ]
+
+    def touch(self, entry: CacheEntry) -> None:
+        """Mark an entry as recently used."""
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+
+    def new_file(self, suffix: str = "") -> str:
+        """Create an empty temporary file on the cache filesystem.
+
+        Content written there can then be published atomically with ``put``.
+        Prefer ``temp_file``, which removes the file if it is not published.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.root, prefix=TMP_PREFIX)
+        os.close(fd)
+        return path
+
+    @contextmanager
+    def temp_file(self, suffix: str = "") -> Iterator[str]:
+        """Temporary file as ``new_file``, removed on exit unless published."""
+        path = self.new_file(suffix)
+        try:
+            yield path
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def put(
+        self,
+        key: str,
+        tmp_path: str,
+        suffix: str,
+        etag: str | None,
+        last_modified: str | None,
+    ) -> CacheEntry:
+        """Publish a downloaded file as the current content of an entry.
+
+        Must be called with the exclusive lock of the entry held.
+
+        Args:
+            key (str): Key of the entry
+            tmp_path (str): File created by ``new_file`` holding the content
+            suffix (str): Extension of the data file
+            etag (str | None): ETag of the content
+            last_modified (str | None): Last-Modified date of the content
+
+        Returns:
+            CacheEntry: The published entry
+        """
+        file_name = f"{key}.{content_version(etag, last_modified)}{suffix}"
+
+        previous = self.get(key)
+        os.replace(tmp_path, self._path(file_name))
+
+        meta = {"file": file_name, "etag": etag, "last_modified": last_modified}
+        with self.temp_file(META_SUFFIX) as meta_tmp:
+            with open(meta_tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_tmp, self._path(f"{key}{META_SUFFIX}"))
+
+        if previous is not None and previous.path != self._path(file_name):
+            # Open readers keep their mapping, unlinking is safe.
+            for path in self._files(previous.path):
+                os.remove(path)
+
+        entry = CacheEntry(key, self._path(file_name), etag, last_modified)
+        self.evict(keep=key)
+        return entry
+
+    def _remove_stale_files(self) -> None:
+        limit = time.time() - TMP_MAX_AGE
+        for name in os.listdir(self.root):
+            if not name.startswith(TMP_PREFIX):
+                continue
+            path = self._path(name)
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.remove(path)
+                    logger.debug(f"Removed stale temporary file {path}")
+            except FileNotFoundError:
+                pass
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        names = os.listdir(self.root)
+        for name in names:
+            if not name.endswith(META_SUFFIX) or name.startswith("."):
+                continue
+            key = name[: -len(META_SUFFIX)]
+            entry = self.get(key)
+            if entry is None:
+                continue
+            # The files of a replaced entry are removed under its key lock only
+            try:
+                files = self._files(entry.path, names)
+                size = sum(os.path.getsize(path) for path in files)
+                entries.append((os.stat(entry.path).st_mtime, size, key))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove least recently used entries until the cache fits its budget.
+
+        Entries currently locked by another process are skipped. Temporary files
+        left by killed processes are removed too.
+
+        Args:
+            keep (str | None): Key that must not be evicted, e.g. the entry that
+                was just written.
+        """
+        with self._flock(GLOBAL_LOCK):
+            self._remove_stale_files()
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                if self._remove_if_unlocked(key):
+                    total -= size
+                    logger.debug(f"Evicted cache entry {key} ({size} bytes)")
+
+    def _remove_if_unlocked(self, key: str) -> bool:
+        with open(self._path(f"{key}{LOCK_SUFFIX}"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                entry = self.get(key)
+                paths = [self._path(f"{key}{META_SUFFIX}")]
+                if entry is not None:
+                    paths += self._files(entry.path)
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,21 @@
+"""Helpers shared by the metrics comparing counts of the reference and a window."""
+
+import numpy as np
+
+# Smoothing of the counts
+EPS = 1e-10
+
+
+def stack_counts(
+    counts: list[tuple[np.ndarray, np.ndarray]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Stack pairs of count vectors of different lengths, with the mask of the bins."""
+    width = max((len(p) for p, _ in counts), default=0)
+    p_counts = np.zeros((len(counts), width))
+    q_counts = np.zeros((len(counts), width))
+    mask = np.zeros((len(counts), width), dtype=bool)
+    for i, (p, q) in enumerate(counts):
+        p_counts[i, : len(p)] = p
+        q_counts[i, : len(q)] = q
+        mask[i, : len(p)] = True
+    return p_counts, q_counts, mask
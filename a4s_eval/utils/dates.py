@@ -4,6 +4,7 @@ This module provides utilities for handling date-based operations, particularly
 for creating batches of data based on date ranges and iterating over temporal data.
 """
 
+import numpy as np
 import pandas as pd
 
 
@@ -58,6 +59,12 @@ class DateIterator:
 
     This class provides functionality to iterate over a DataFrame in time-based windows,
     useful for temporal analysis and time-series processing.
+
+    The rows are sorted by date once, and the boundaries of every window are found
+    by binary search on the sorted dates, so each window is a positional slice of
+    the sorted frame. Rows keep their original index labels. The DataFrame given
+    to the iterator is not modified, and the yielded slices must not be modified
+    either.
     """
 
     def __init__(
@@ -77,9 +84,9 @@ class DateIterator:
             df (pd.DataFrame): The DataFrame to iterate over
             date_feature (str): The column name containing dates
         """
-        df[date_feature] = pd.to_datetime(df[date_feature])
-        self.start_date = df[date_feature].min()
-        self.end_date = df[date_feature].max()
+        dates = pd.to_datetime(df[date_feature])
+        self.start_date = dates.min()
+        self.end_date = dates.max()
         self.date_round = date_round
         self.window = window
         self.freq = freq
@@ -87,9 +94,28 @@ class DateIterator:
             self.start_date, self.end_date, date_round, window, freq
         )
         self.index = 0
-        self.df = df
         self.date_feature = date_feature
 
+        # Dates as int64 nanoseconds, NaT is the smallest value and is never in
+        # a window.
+        date_values = pd.DatetimeIndex(dates).as_unit("ns").asi8
+        #: Positions in the original frame of the rows of the sorted frame
+        self.order = np.argsort(date_values, kind="stable")
+        sorted_values = date_values[self.order]
+
+        self.df = df.take(self.order)
+        self.df[date_feature] = dates.array.take(self.order)
+
+        starts = [pd.Timestamp(start).as_unit("ns").value for start, _ in self.batches]
+        ends = [pd.Timestamp(end).as_unit("ns").value for _, end in self.batches]
+        #: (start, end) positions of each window in the sorted frame
+        self.bounds = list(
+            zip(
+                np.searchsorted(sorted_values, starts, side="left").tolist(),
+                np.searchsorted(sorted_values, ends, side="left").tolist(),
+            )
+        )
+
     def __iter__(self) -> "DateIterator":
         """Return the iterator object."""
         return self
@@ -106,9 +132,7 @@ class DateIterator:
         """
         if self.index >= len(self.batches):
             raise StopIteration
-        start, end = self.batches[self.index]
+        _, end = self.batches[self.index]
+        lo, hi = self.bounds[self.index]
         self.index += 1
-        # Filter DataFrame for current time window
-        return end, self.df[
-            (self.df[self.date_feature] >= start) & (self.df[self.date_feature] < end)
-        ].copy()
+        return end, self.df.iloc[lo:hi]
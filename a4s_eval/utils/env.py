@@ -21,6 +21,76 @@ API_URL = os.getenv("API_URL", "http://a4s-api:8000")
 API_PREFIX = os.getenv("API_PREFIX", "/api/v1")
 API_URL_PREFIX = f"{API_URL}{API_PREFIX}"
 CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/cache")
+# Maximum size of the dataset and model caches, in bytes (each)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(10 * 1024**3)))
+
+# HTTP client to the A4S API
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+
+# Claiming of pending evaluations
+CLAIM_CONCURRENCY = int(os.getenv("CLAIM_CONCURRENCY", str(HTTP_POOL_SIZE)))
+CLAIM_BULK = handle_bool_var(os.getenv("CLAIM_BULK", "false"))
+
+# Upload of the measures
+MEASURE_BATCH_SIZE = int(os.getenv("MEASURE_BATCH_SIZE", "5000"))
+# The API must decompress gzip request bodies, FastAPI does not by default
+MEASURE_GZIP = handle_bool_var(os.getenv("MEASURE_GZIP", "false"))
+# The API ignores a chunk whose Idempotency-Key (sha256 of the chunk) it already
+# applied, so chunks can be resent after a timeout or a server error
+MEASURE_DEDUP = handle_bool_var(os.getenv("MEASURE_DEDUP", "false"))
+
+# ONNX inference sessions
+ONNX_SESSION_CACHE_BYTES = int(os.getenv("ONNX_SESSION_CACHE_BYTES", str(2 * 1024**3)))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+ONNX_EXECUTION_MODE = os.getenv("ONNX_EXECUTION_MODE", "sequential")
+ONNX_MEM_ARENA = handle_bool_var(os.getenv("ONNX_MEM_ARENA", "true"))
+ONNX_MEM_PATTERN = handle_bool_var(os.getenv("ONNX_MEM_PATTERN", "true"))
+
+# Number of histogram bins of the sliding window statistics
+WINDOW_STATS_BINS = int(os.getenv("WINDOW_STATS_BINS", "20"))
+# Number of reference quantile bins of the population stability index
+PSI_BINS = int(os.getenv("PSI_BINS", "10"))
+# Categorical features with more reference categories than the threshold are
+# counted on their most frequent categories (heavy hitters), a count-min sketch
+# of width x depth counters estimating the reference counts of the others. The
+# same settings bound the category counts of the DRIFT_MODE=sketch summaries
+CATEGORY_SKETCH_THRESHOLD = int(os.getenv("CATEGORY_SKETCH_THRESHOLD", "10000"))
+CATEGORY_HEAVY_HITTERS = int(os.getenv("CATEGORY_HEAVY_HITTERS", "1000"))
+CATEGORY_SKETCH_WIDTH = int(os.getenv("CATEGORY_SKETCH_WIDTH", "65536"))
+CATEGORY_SKETCH_DEPTH = int(os.getenv("CATEGORY_SKETCH_DEPTH", "4"))
+# Processes evaluating the windows of an evaluation, 0 for one per core
+WINDOW_WORKERS = int(os.getenv("WINDOW_WORKERS", "1"))
+# Size of the quantile sketches of the date buckets, read by
+# WindowSummary.quantiles. No metric reads them, so none are kept by default (0)
+WINDOW_SKETCH_K = int(os.getenv("WINDOW_SKETCH_K", "0"))
+# Drift of the data task: "exact" on the loaded datasets, or "sketch" from
+# summaries of the streamed datasets, for datasets larger than memory
+DRIFT_MODE = os.getenv("DRIFT_MODE", "exact")
+# Size of the quantile sketches of the sketch drift mode
+DRIFT_SKETCH_K = int(os.getenv("DRIFT_SKETCH_K", "200"))
+# Permutation p-values of the drift distances: maximum number of permutations
+# (0 for no p-values), permutations per batch, threshold of the early stopping,
+# processes (per process evaluating windows), seed, and maximum reference values
+# of a numerical test
+DRIFT_PERMUTATIONS = int(os.getenv("DRIFT_PERMUTATIONS", "0"))
+DRIFT_PERMUTATION_BATCH = int(os.getenv("DRIFT_PERMUTATION_BATCH", "200"))
+DRIFT_PERMUTATION_ALPHA = float(os.getenv("DRIFT_PERMUTATION_ALPHA", "0.05"))
+DRIFT_PERMUTATION_WORKERS = int(os.getenv("DRIFT_PERMUTATION_WORKERS", "1"))
+DRIFT_PERMUTATION_SEED = int(os.getenv("DRIFT_PERMUTATION_SEED", "0"))
+DRIFT_PERMUTATION_MAX_ROWS = int(os.getenv("DRIFT_PERMUTATION_MAX_ROWS", "10000"))
+# Multivariate drift: random Fourier features, maximum rows of each side, and
+# permutations of its p-value (0 for no p-value)
+MMD_FEATURES = int(os.getenv("MMD_FEATURES", "256"))
+MMD_MAX_ROWS = int(os.getenv("MMD_MAX_ROWS", "20000"))
+MMD_PERMUTATIONS = int(os.getenv("MMD_PERMUTATIONS", "200"))
+# Text drift: hashed character n-gram columns, and size of their projection
+TEXT_HASH_FEATURES = int(os.getenv("TEXT_HASH_FEATURES", "262144"))
+TEXT_EMBEDDING_DIM = int(os.getenv("TEXT_EMBEDDING_DIM", "128"))
 
 REDIS_SSL_CERT_REQS = handle_bool_var(os.getenv("REDIS_SSL_CERT_REQS", "true"))
 
@@ -0,0 +1,172 @@
+"""Maximum mean discrepancy between samples, with random Fourier features.
+
+The maximum mean discrepancy (MMD) with a Gaussian kernel compares the whole
+distributions of two samples of rows, but exactly it costs O(n^2). It is
+approximated with random Fourier features (Rahimi and Recht, 2007): each
+standardized row is mapped to ``MMD_FEATURES`` features whose inner products
+approximate the kernel, and the squared MMD is the squared distance between the
+mean features of the two samples, in O(n).
+
+Both samples are subsampled to at most ``MMD_MAX_ROWS`` rows. Missing values are
+replaced by the mean of their column. The kernel bandwidth is the median
+distance between reference rows. The significance of the distance is a
+permutation test of the mapped rows (see ``a4s_eval.utils.permutation``).
+"""
+
+from functools import partial
+
+import numpy as np
+
+from a4s_eval.utils.env import (
+    DRIFT_PERMUTATION_BATCH,
+    DRIFT_PERMUTATION_SEED,
+    MMD_FEATURES,
+    MMD_MAX_ROWS,
+)
+from a4s_eval.utils.permutation import (
+    MAX_BATCH_CELLS,
+    permutation_p_value,
+    subsample,
+)
+
+# Reference rows used to choose the kernel bandwidth
+BANDWIDTH_ROWS = 1000
+# Rows mapped at once
+CHUNK_ROWS = 65536
+
+
+class RandomFourierFeatures:
+    """Random Fourier features of a Gaussian kernel on standardized rows."""
+
+    def __init__(
+        self,
+        means: np.ndarray,
+        scales: np.ndarray,
+        bandwidth: float,
+        n_features: int,
+        seed: int,
+    ):
+        """Draw the random features.
+
+        Args:
+            means (np.ndarray): Mean of each column, to standardize the rows
+            scales (np.ndarray): Standard deviation of each column
+            bandwidth (float): Bandwidth of the kernel on standardized rows
+            n_features (int): Number of random features
+            seed (int): Seed of the random features
+        """
+        rng = np.random.default_rng(seed)
+        self.means = means
+        self.scales = scales
+        self.weights = rng.normal(0.0, 1.0 / bandwidth, (len(means), n_features))
+        self.offsets = rng.uniform(0.0, 2 * np.pi, n_features)
+
+    def standardize(self, values: np.ndarray) -> np.ndarray:
+        """Standardize rows, missing values being replaced by the mean."""
+        standardized = (values - self.means) / self.scales
+        return np.nan_to_num(standardized, nan=0.0)
+
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        """Map rows to their random features.
+
+        Args:
+            values (np.ndarray): Rows of shape (n, columns), NaN if missing
+
+        Returns:
+            np.ndarray: float32 features of shape (n, n_features)
+        """
+        n_features = self.weights.shape[1]
+        features = np.empty((len(values), n_features), dtype=np.float32)
+        for lo in range(0, len(values), CHUNK_ROWS):
+            chunk = self.standardize(values[lo : lo + CHUNK_ROWS])
+            features[lo : lo + CHUNK_ROWS] = np.cos(chunk @ self.weights + self.offsets)
+        features *= np.sqrt(2.0 / n_features)
+        return features
+
+
+def mmd_statistics(features: np.ndarray, labels: np.ndarray, n_new: int) -> np.ndarray:
+    """Squared MMD of splits of mapped rows.
+
+    Args:
+        features: Random features of the pooled rows
+        labels: Whether each pooled row is in the window, one split per row
+        n_new: Number of rows in the window
+
+    Returns:
+        np.ndarray: The squared MMD between the two parts of each split
+    """
+    n_ref = len(features) - n_new
+    new_sums = (labels @ features).astype(np.float64)
+    ref_sums = features.sum(axis=0, dtype=np.float64) - new_sums
+    return ((ref_sums / n_ref - new_sums / n_new) ** 2).sum(axis=1)
+
+
+def _mmd_batch(
+    features: np.ndarray, n_new: int, rng: np.random.Generator, size: int
+) -> np.ndarray:
+    labels = np.zeros((size, len(features)), dtype=np.float32)
+    labels[:, :n_new] = 1.0
+    return mmd_statistics(features, rng.permuted(labels, axis=1), n_new)
+
+
+def _bandwidth(standardized: np.ndarray) -> float:
+    """Median distance between rows, 1 if all the rows are the same."""
+    rows = standardized
+    squared = (rows * rows).sum(axis=1)
+    distances = squared[:, None] + squared[None, :] - 2 * rows @ rows.T
+    distances = np.sqrt(np.maximum(distances[np.triu_indices(len(rows), 1)], 0.0))
+    median = float(np.median(distances)) if len(distances) else 0.0
+    return median if median > 0 else 1.0
+
+
+class ReferenceFeatures:
+    """Random features of the subsampled rows of a reference."""
+
+    def __init__(self, values: np.ndarray, means: np.ndarray, scales: np.ndarray):
+        """Map the rows of the reference.
+
+        Args:
+            values (np.ndarray): Rows of shape (n, columns), NaN if missing
+            means (np.ndarray): Mean of each column, NaN if unknown
+            scales (np.ndarray): Standard deviation of each column, the columns
+                without a positive deviation are not scaled
+        """
+        scales = np.where(np.isfinite(scales) & (scales > 0), scales, 1.0)
+        means = np.nan_to_num(means, nan=0.0)
+        values = subsample(values, MMD_MAX_ROWS, DRIFT_PERMUTATION_SEED)
+
+        sample = subsample(values, BANDWIDTH_ROWS, DRIFT_PERMUTATION_SEED)
+        bandwidth = _bandwidth(np.nan_to_num((sample - means) / scales, nan=0.0))
+        self.mapping = RandomFourierFeatures(
+            means, scales, bandwidth, MMD_FEATURES, DRIFT_PERMUTATION_SEED
+        )
+        self.features = self.mapping.transform(values)
+
+    def mmd(self, values: np.ndarray, n_permutations: int = 0) -> tuple[float, float]:
+        """Squared MMD between the reference and other rows, and its p-value.
+
+        Args:
+            values (np.ndarray): Rows of shape (n, columns), NaN if missing.
+                Subsampled to MMD_MAX_ROWS rows.
+            n_permutations (int): Maximum number of random splits of the
+                p-value, no p-value if 0
+
+        Returns:
+            tuple[float, float]: The squared MMD, and its permutation p-value
+                (NaN without permutations)
+        """
+        values = subsample(values, MMD_MAX_ROWS, DRIFT_PERMUTATION_SEED)
+        features = np.concatenate([self.features, self.mapping.transform(values)])
+        n_new = len(values)
+        labels = np.zeros((1, len(features)), dtype=np.float32)
+        labels[:, -n_new:] = 1.0
+        mmd = float(mmd_statistics(features, labels, n_new)[0])
+        if not n_permutations:
+            return mmd, np.nan
+        batch_size = max(
+            1, min(DRIFT_PERMUTATION_BATCH, MAX_BATCH_CELLS // len(features))
+        )
+        p_value = permutation_p_value(
+            partial(_mmd_batch, features, n_new), mmd, n_permutations, batch_size
+        )
+        return mmd, p_value
@@ -0,0 +1,262 @@
+"""Permutation tests of the drift statistics.
+
+The p-value of a drift distance is the share of random splits of the pooled
+reference and window values whose distance is at least the observed one. Splits
+are drawn in batches, and the distances of a whole batch are computed at once:
+
+- Wasserstein distance: the pooled values are sorted once, and a split is a
+  vector of labels in this order. The distance is the sum over the gaps between
+  consecutive values of the gap times the difference of the two CDFs, which are
+  cumulative sums of the labels.
+- Jensen-Shannon distance: only the counts of the categories matter, and the
+  counts of the window of a random split follow a multivariate hypergeometric
+  distribution, drawn directly.
+
+Each split of numerical values costs O(n), so the reference values are
+subsampled to ``DRIFT_PERMUTATION_MAX_ROWS``, the observed distance of the test
+being the distance of the subsample.
+
+Batches are seeded from the batch index, so a test gives the same p-value with
+any number of workers. The workers are a billiard pool (the multiprocessing
+fork of Celery), which can be started from the daemonic processes of the Celery
+prefork pool and of the window pool. The test stops early once the p-value is
+clearly above or below the significance threshold.
+"""
+
+from functools import partial
+from typing import Callable
+
+import billiard
+import numpy as np
+from billiard.pool import Pool
+from scipy.special import rel_entr
+
+from a4s_eval.utils.env import (
+    DRIFT_PERMUTATION_ALPHA,
+    DRIFT_PERMUTATION_BATCH,
+    DRIFT_PERMUTATION_MAX_ROWS,
+    DRIFT_PERMUTATION_SEED,
+    DRIFT_PERMUTATION_WORKERS,
+    DRIFT_PERMUTATIONS,
+)
+from a4s_eval.utils.logging import get_logger
+
+logger = get_logger()
+
+# Maximum number of cells of the label matrix of a batch
+MAX_BATCH_CELLS = 2**24
+# Width of the confidence interval of the p-value used to stop early
+STOP_Z = 2.576
+
+_pool: Pool | None = None
+
+
+def wasserstein_statistics(
+    gaps: np.ndarray, labels: np.ndarray, n_new: int
+) -> np.ndarray:
+    """Wasserstein distances of splits of sorted pooled values.
+
+    Args:
+        gaps: Differences between consecutive sorted pooled values
+        labels: Whether each sorted pooled value is in the window, one split
+            per row
+        n_new: Number of values in the window
+
+    Returns:
+        np.ndarray: The distance between the two parts of each split
+    """
+    n_ref = labels.shape[1] - n_new
+    new_below = np.cumsum(labels[:, :-1], axis=1, dtype=np.int64)
+    ref_below = np.arange(1, labels.shape[1]) - new_below
+    return (np.abs(ref_below / n_ref - new_below / n_new) * gaps).sum(axis=1)
+
+
+def jensenshannon_statistics(
+    ref_counts: np.ndarray, new_counts: np.ndarray
+) -> np.ndarray:
+    """Jensen-Shannon distances between the rows of two matrices of counts.
+
+    Args:
+        ref_counts: Counts of the categories in the reference, one row per split
+        new_counts: Counts of the same categories in the window
+
+    Returns:
+        np.ndarray: The distance of each row, as ``scipy.spatial.distance.jensenshannon``
+    """
+    p = ref_counts / ref_counts.sum(axis=1, keepdims=True)
+    q = new_counts / new_counts.sum(axis=1, keepdims=True)
+    m = (p + q) / 2
+    js = (rel_entr(p, m).sum(axis=1) + rel_entr(q, m).sum(axis=1)) / 2
+    return np.sqrt(np.maximum(js, 0.0))
+
+
+def _numerical_batch(
+    gaps: np.ndarray, n_ref: int, n_new: int, rng: np.random.Generator, size: int
+) -> np.ndarray:
+    labels = np.zeros((size, n_ref + n_new), dtype=np.int8)
+    labels[:, :n_new] = 1
+    return wasserstein_statistics(gaps, rng.permuted(labels, axis=1), n_new)
+
+
+def _categorical_batch(
+    totals: np.ndarray, n_new: int, rng: np.random.Generator, size: int
+) -> np.ndarray:
+    new_counts = rng.multivariate_hypergeometric(totals, n_new, size=size)
+    return jensenshannon_statistics(totals - new_counts, new_counts)
+
+
+def _run_batch(
+    batch_statistics: Callable[[np.random.Generator, int], np.ndarray],
+    observed: float,
+    seed: int,
+    index: int,
+    size: int,
+) -> int:
+    """Number of splits of a batch at least as distant as the observed split."""
+    rng = np.random.default_rng([seed, index])
+    statistics = batch_statistics(rng, size)
+    # Tolerance for the rounding of the observed distance
+    return int((statistics >= observed - 1e-12 * abs(observed)).sum())
+
+
+def _is_decided(exceed: int, done: int, alpha: float) -> bool:
+    """Whether the p-value is clearly above or below ``alpha``."""
+    p_value = (exceed + 1) / (done + 1)
+    half_width = STOP_Z * np.sqrt(p_value * (1 - p_value) / (done + 1))
+    return p_value - half_width > alpha or p_value + half_width < alpha
+
+
+def _executor(workers: int) -> Pool | None:
+    global _pool
+    if workers <= 1:
+        return None
+    if _pool is None:
+        _pool = billiard.get_context("forkserver").Pool(processes=workers)
+    return _pool
+
+
+def subsample(values: np.ndarray, max_rows: int, seed: int) -> np.ndarray:
+    """At most ``max_rows`` rows drawn without replacement, in their order."""
+    if len(values) <= max_rows:
+        return values
+    rng = np.random.default_rng(seed)
+    return values[np.sort(rng.choice(len(values), max_rows, replace=False))]
+
+
+def permutation_p_value(
+    batch_statistics: Callable[[np.random.Generator, int], np.ndarray],
+    observed: float,
+    n_permutations: int,
+    batch_size: int,
+    alpha: float | None = None,
+    seed: int | None = None,
+    workers: int | None = None,
+) -> float:
+    """P-value of an observed statistic against the statistics of random splits.
+
+    Args:
+        batch_statistics: Function of a generator and a batch size, returning
+            the statistics of that many random splits. Must be picklable to run
+            on several workers.
+        observed: Statistic of the actual split
+        n_permutations: Maximum number of random splits
+        batch_size: Number of random splits per batch
+        alpha: Significance threshold of the early stopping, DRIFT_PERMUTATION_ALPHA
+            by default
+        seed: Seed of the random splits, DRIFT_PERMUTATION_SEED by default
+        workers: Processes computing the batches, DRIFT_PERMUTATION_WORKERS by
+            default
+
+    Returns:
+        float: The p-value ``(exceed + 1) / (splits + 1)``
+    """
+    alpha = DRIFT_PERMUTATION_ALPHA if alpha is None else alpha
+    seed = DRIFT_PERMUTATION_SEED if seed is None else seed
+    workers = DRIFT_PERMUTATION_WORKERS if workers is None else workers
+    sizes = [
+        min(batch_size, n_permutations - start)
+        for start in range(0, n_permutations, batch_size)
+    ]
+    run = partial(_run_batch, batch_statistics, observed, seed)
+    pool = _executor(workers)
+
+    exceed = 0
+    done = 0
+    # Batches are submitted by rounds of one per worker, and counted in order
+    round_size = workers if pool is not None else 1
+    for start in range(0, len(sizes), round_size):
+        indices = range(start, min(start + round_size, len(sizes)))
+        if pool is not None:
+            counts = pool.starmap(run, [(i, sizes[i]) for i in indices])
+        else:
+            counts = [run(i, sizes[i]) for i in indices]
+        for i, count in zip(indices, counts):
+            exceed += count
+            done += sizes[i]
+            if _is_decided(exceed, done, alpha):
+                return (exceed + 1) / (done + 1)
+    return (exceed + 1) / (done + 1)
+
+
+def numerical_p_value(
+    x_ref: np.ndarray, x_new: np.ndarray, n_permutations: int | None = None
+) -> float:
+    """Permutation p-value of the Wasserstein distance between two samples.
+
+    Args:
+        x_ref: Reference values, without missing values. Subsampled to
+            DRIFT_PERMUTATION_MAX_ROWS values.
+        x_new: Window values, without missing values
+        n_permutations: Maximum number of random splits, DRIFT_PERMUTATIONS by
+            default
+
+    Returns:
+        float: The p-value, NaN if a sample is empty
+    """
+    n_permutations = n_permutations or DRIFT_PERMUTATIONS
+    x_ref = subsample(x_ref, DRIFT_PERMUTATION_MAX_ROWS, DRIFT_PERMUTATION_SEED)
+    n_ref, n_new = len(x_ref), len(x_new)
+    if n_ref == 0 or n_new == 0:
+        return np.nan
+    pooled = np.concatenate([x_ref, x_new])
+    order = np.argsort(pooled, kind="stable")
+    gaps = np.diff(pooled[order])
+    observed = wasserstein_statistics(gaps, (order >= n_ref)[None], n_new)[0]
+    batch_size = max(
+        1, min(DRIFT_PERMUTATION_BATCH, MAX_BATCH_CELLS // (n_ref + n_new))
+    )
+    return permutation_p_value(
+        partial(_numerical_batch, gaps, n_ref, n_new),
+        observed,
+        n_permutations,
+        batch_size,
+    )
+
+
+def categorical_p_value(
+    ref_counts: np.ndarray, new_counts: np.ndarray, n_permutations: int | None = None
+) -> float:
+    """Permutation p-value of the Jensen-Shannon distance between two count vectors.
+
+    Args:
+        ref_counts: Counts of the categories in the reference
+        new_counts: Counts of the same categories in the window
+        n_permutations: Maximum number of random splits, DRIFT_PERMUTATIONS by
+            default
+
+    Returns:
+        float: The p-value, NaN if a sample is empty
+    """
+    n_permutations = n_permutations or DRIFT_PERMUTATIONS
+    ref_counts = np.asarray(ref_counts, dtype=np.int64)
+    new_counts = np.asarray(new_counts, dtype=np.int64)
+    n_new = int(new_counts.sum())
+    if ref_counts.sum() == 0 or n_new == 0:
+        return np.nan
+    observed = jensenshannon_statistics(ref_counts[None], new_counts[None])[0]
+    return permutation_p_value(
+        partial(_categorical_batch, ref_counts + new_counts, n_new),
+        observed,
+        n_permutations,
+        DRIFT_PERMUTATION_BATCH,
+    )
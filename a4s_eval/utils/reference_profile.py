@@ -0,0 +1,745 @@
+"""Profiles of reference datasets.
+
+The reference of the drift metrics is the dataset of the model, which is the same
+for every window of every evaluation of the model. ``ReferenceProfile`` keeps
+what the metrics need from it:
+
+- for numerical features, the sorted values and the integral of their empirical
+  CDF, the histogram on ``WINDOW_STATS_BINS`` bins, and the count, mean and
+  variance of the values;
+- for categorical features, the dictionary of categories and their counts, with
+  which the evaluated rows are encoded (``encode_frame``).
+
+Categorical features with more than ``CATEGORY_SKETCH_THRESHOLD`` categories
+(e.g. identifiers) would give dictionaries and count vectors as large as the
+data. Their profile only keeps the ``CATEGORY_HEAVY_HITTERS`` most frequent
+categories with their exact counts, and a count-min sketch of the others, which
+are counted together as ``OTHER_CATEGORY``. Evaluated rows are encoded on the
+heavy hitters, the most frequent other values of the rows, whose reference
+counts are estimated by the sketch, and ``OTHER_CATEGORY``, so the counts of a
+window have a bounded size.
+
+A profile is built the first time a reference is used, and saved in the cache
+directory under the pid of the dataset, a hash of the datashape and profile
+settings, and a hash of its version (the validators of the download, see
+``Dataset.version``), or of its content when the dataset has no version, so a
+known dataset is not hashed. Saving a new version only replaces the profiles
+with the same settings. A profile is a JSON header with the format version,
+feature names and categories, and one ``.npy`` file per array. It is loaded back
+by memory map, so the metrics of a window only go through the rows of the window.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.utils.env import (
+    CACHE_DIR,
+    CATEGORY_HEAVY_HITTERS,
+    CATEGORY_SKETCH_DEPTH,
+    CATEGORY_SKETCH_THRESHOLD,
+    CATEGORY_SKETCH_WIDTH,
+    WINDOW_STATS_BINS,
+)
+from a4s_eval.utils.logging import get_logger
+from a4s_eval.utils.sketches import CountMinSketch, value_hashes
+
+logger = get_logger()
+
+# Version of the profile format, profiles of another version are rebuilt
+PROFILE_VERSION = 2
+PROFILE_DIR = f"{CACHE_DIR}/reference_profiles"
+HEADER_FILE = "profile.json"
+
+NUMERICAL_TYPES = (FeatureType.INTEGER, FeatureType.FLOAT)
+ARRAYS = (
+    "sorted_values",
+    "integrals",
+    "bin_edges",
+    "histograms",
+    "moments",
+    "category_counts",
+    "count_min",
+)
+# Category of the values of a sketched feature that are not counted apart
+OTHER_CATEGORY = "__other__"
+
+
+class EncodedCategories:
+    """Categorical features of rows, encoded with dictionaries shared with a reference.
+
+    The codes of all the features are in one int32 matrix, with an offset per
+    feature, so the counts of all the categories of a range of rows are a single
+    ``np.bincount``. Each feature has one code per category, then one for missing
+    values.
+    """
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        categories: dict[str, pd.Index],
+        reference_counts: dict[str, np.ndarray],
+    ):
+        """Initialize the encoding, see ``encode_categories``.
+
+        Args:
+            codes (np.ndarray): Codes of shape (rows, features), offset by the
+                codes of the previous features
+            categories (dict[str, pd.Index]): Categories of each feature
+            reference_counts (dict[str, np.ndarray]): Counts of the categories of
+                each feature in the reference, then of its missing values
+        """
+        self.codes = codes
+        self.categories = categories
+        self.reference_counts = reference_counts
+        #: Codes of each feature
+        self.slices: dict[str, slice] = {}
+        offset = 0
+        for name, index in categories.items():
+            self.slices[name] = slice(offset, offset + len(index) + 1)
+            offset += len(index) + 1
+        self.size = offset
+
+    def counts(self, lo: int = 0, hi: int | None = None) -> np.ndarray:
+        """Counts of the codes of the rows ``lo:hi``, sliced by ``slices``."""
+        return np.bincount(self.codes[lo:hi].ravel(), minlength=self.size)
+
+
+def encode_categories(
+    categorical: list[str], df: pd.DataFrame, reference: pd.DataFrame | None = None
+) -> EncodedCategories:
+    """Encode categorical features with dictionaries shared with a reference.
+
+    Each feature is factorized once on the reference followed by the rows, so
+    the categories of the reference come first.
+
+    Args:
+        categorical (list[str]): Names of the categorical features
+        df (pd.DataFrame): Rows to encode
+        reference (pd.DataFrame | None): Reference data, none if None
+
+    Returns:
+        EncodedCategories: The codes of the rows
+    """
+    codes = np.empty((len(df), len(categorical)), dtype=np.int32)
+    categories: dict[str, pd.Index] = {}
+    reference_counts: dict[str, np.ndarray] = {}
+    offset = 0
+    for j, name in enumerate(categorical):
+        ref_values = reference[name] if reference is not None else df[name].iloc[:0]
+        all_codes, uniques = pd.factorize(
+            pd.concat([ref_values, df[name]], ignore_index=True)
+        )
+        n_categories = len(uniques)
+        # Missing values get the last code
+        all_codes[all_codes < 0] = n_categories
+        categories[name] = pd.Index(uniques)
+        reference_counts[name] = np.bincount(
+            all_codes[: len(ref_values)], minlength=n_categories + 1
+        )
+        codes[:, j] = all_codes[len(ref_values) :] + offset
+        offset += n_categories + 1
+    return EncodedCategories(codes, categories, reference_counts)
+
+
+def category_counts(
+    x_ref: "pd.Series", x_new: "pd.Series"
+) -> tuple[np.ndarray, np.ndarray]:
+    """Count the categories of two samples in a dictionary shared by both.
+
+    Both samples are factorized in one pass, and counted with ``np.bincount``.
+    Missing values are not counted.
+
+    Args:
+        x_ref: Reference sample
+        x_new: New sample
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Counts of each category seen in either
+            sample, in the reference then in the new sample
+    """
+    codes, uniques = pd.factorize(pd.concat([x_ref, x_new], ignore_index=True))
+    codes = codes.astype(np.int32)
+    ref_codes, new_codes = codes[: len(x_ref)], codes[len(x_ref) :]
+    return (
+        np.bincount(ref_codes[ref_codes >= 0], minlength=len(uniques)),
+        np.bincount(new_codes[new_codes >= 0], minlength=len(uniques)),
+    )
+
+
+class ReferenceProfile:
+    """Per-feature profile of a reference dataset. Arrays must not be modified.
+
+    Histograms have ``n_bins + 3`` counts, as in ``WindowStats``: values below the
+    first edge (none), the ``n_bins`` bins, values above the last edge (none) and
+    missing values. Category counts have one count per category, then the count
+    of missing values. The categories of a sketched feature are its heavy
+    hitters, then ``OTHER_CATEGORY``.
+    """
+
+    def __init__(
+        self,
+        numerical: list[str],
+        categorical: list[str],
+        categories: dict[str, pd.Index],
+        arrays: dict[str, np.ndarray],
+        n_bins: int,
+        content_hash: str,
+        sketched: list[str] | None = None,
+    ):
+        """Initialize a profile from its arrays, see ``build`` and ``load``."""
+        self.numerical = numerical
+        self.categorical = categorical
+        self.categories = categories
+        #: Count-min sketches of the categories other than the heavy hitters of
+        #: the sketched categorical features
+        self.sketches: dict[str, CountMinSketch] = {
+            name: CountMinSketch(table=arrays["count_min"][i])
+            for i, name in enumerate(sketched or [])
+        }
+        self.n_bins = n_bins
+        self.content_hash = content_hash
+        #: Columns of the numerical features sorted, missing values last
+        self.sorted_values: np.ndarray = arrays["sorted_values"]
+        #: Integral of the CDF of each column from its first value to each value
+        self.integrals: np.ndarray = arrays["integrals"]
+        self._bin_edges: np.ndarray = arrays["bin_edges"]
+        self._histograms: np.ndarray = arrays["histograms"]
+        self._moments: np.ndarray = arrays["moments"]
+        self._category_counts: np.ndarray = arrays["category_counts"]
+        self.arrays = arrays
+        #: Directory of the saved profile, None if it is not saved
+        self.path: str | None = None
+
+        self.n_rows = len(self.sorted_values)
+        #: Whether each numerical column has missing values
+        self.missing = (
+            np.isnan(self.sorted_values[-1])
+            if self.n_rows
+            else np.zeros(len(numerical), dtype=bool)
+        )
+        self._numerical = {name: j for j, name in enumerate(numerical)}
+        self._cat_slices: dict[str, slice] = {}
+        offset = 0
+        for name in categorical:
+            size = len(categories[name]) + 1
+            self._cat_slices[name] = slice(offset, offset + size)
+            offset += size
+        self._quantile_bins: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def build(
+        cls,
+        datashape: DataShape,
+        data: pd.DataFrame,
+        n_bins: int | None = None,
+        content_hash: str = "",
+    ) -> "ReferenceProfile":
+        """Profile the features of a reference dataset.
+
+        Args:
+            datashape (DataShape): Datashape of the project
+            data (pd.DataFrame): The reference data
+            n_bins (int | None): Number of histogram bins, WINDOW_STATS_BINS by
+                default
+            content_hash (str): Hash of the data, see ``profile_hash`` and
+                ``version_hash``
+
+        Returns:
+            ReferenceProfile: The profile
+        """
+        n_bins = n_bins or WINDOW_STATS_BINS
+        numerical = [
+            f.name for f in datashape.features if f.feature_type in NUMERICAL_TYPES
+        ]
+        categorical = [
+            f.name
+            for f in datashape.features
+            if f.feature_type == FeatureType.CATEGORICAL
+        ]
+
+        values = np.empty((len(data), len(numerical)), dtype=np.float64)
+        for j, name in enumerate(numerical):
+            values[:, j] = pd.to_numeric(data[name], errors="coerce")
+        values.sort(axis=0)
+        steps = (
+            np.arange(1, len(values))[:, None] / len(values) * np.diff(values, axis=0)
+        )
+        integrals = np.concatenate(
+            [np.zeros((1, len(numerical))), np.cumsum(steps, axis=0)]
+        )
+
+        bin_edges = np.empty((len(numerical), n_bins + 1))
+        histograms = np.zeros((len(numerical), n_bins + 3), dtype=np.int64)
+        moments = np.full((3, len(numerical)), np.nan)
+        for j in range(len(numerical)):
+            column = values[:, j]
+            present = column[~np.isnan(column)]
+            bin_edges[j] = _bin_edges(present, n_bins)
+            histograms[j, 1 : n_bins + 1] = np.histogram(present, bins=bin_edges[j])[0]
+            histograms[j, -1] = len(column) - len(present)
+            moments[0, j] = len(present)
+            if len(present):
+                moments[1, j] = present.mean()
+                moments[2, j] = present.var()
+
+        categories: dict[str, pd.Index] = {}
+        counts = []
+        sketched = []
+        tables = []
+        for name in categorical:
+            codes, uniques = pd.factorize(data[name])
+            codes[codes < 0] = len(uniques)
+            feature_counts = np.bincount(codes, minlength=len(uniques) + 1)
+            if len(uniques) <= CATEGORY_SKETCH_THRESHOLD:
+                categories[name] = pd.Index(uniques)
+                counts.append(feature_counts)
+                continue
+            order = np.argsort(-feature_counts[:-1], kind="stable")
+            heavy, tail = order[:CATEGORY_HEAVY_HITTERS], order[CATEGORY_HEAVY_HITTERS:]
+            sketch = CountMinSketch(CATEGORY_SKETCH_WIDTH, CATEGORY_SKETCH_DEPTH)
+            sketch.update(value_hashes(uniques[tail]), feature_counts[tail])
+            categories[name] = pd.Index(uniques[heavy], dtype=object).append(
+                pd.Index([OTHER_CATEGORY], dtype=object)
+            )
+            counts.append(
+                np.r_[
+                    feature_counts[heavy],
+                    feature_counts[tail].sum(),
+                    feature_counts[-1],
+                ]
+            )
+            sketched.append(name)
+            tables.append(sketch.table)
+        category_counts = (
+            np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+        )
+        count_min = (
+            np.stack(tables)
+            if tables
+            else np.zeros((0, CATEGORY_SKETCH_DEPTH, CATEGORY_SKETCH_WIDTH), np.int64)
+        )
+
+        arrays = {
+            "sorted_values": values,
+            "integrals": integrals[: len(values)],
+            "bin_edges": bin_edges,
+            "histograms": histograms,
+            "moments": moments,
+            "category_counts": category_counts.astype(np.int64),
+            "count_min": count_min,
+        }
+        return cls(
+            numerical, categorical, categories, arrays, n_bins, content_hash, sketched
+        )
+
+    def save(self, path: str) -> None:
+        """Save the profile in a new directory.
+
+        Raises:
+            TypeError: If the categories cannot be saved as JSON
+        """
+        header = {
+            "version": PROFILE_VERSION,
+            "content_hash": self.content_hash,
+            "n_bins": self.n_bins,
+            "numerical": self.numerical,
+            "categorical": self.categorical,
+            "sketched": list(self.sketches),
+            "categories": {
+                name: index.tolist() for name, index in self.categories.items()
+            },
+        }
+        encoded = json.dumps(header, allow_nan=False)
+        os.makedirs(path)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), self.arrays[name])
+        with open(os.path.join(path, HEADER_FILE), "w") as f:
+            f.write(encoded)
+
+    @classmethod
+    def load(cls, path: str) -> "ReferenceProfile":
+        """Load a saved profile, with its arrays memory-mapped.
+
+        Raises:
+            ValueError: If the profile has another format version
+        """
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+        if header.get("version") != PROFILE_VERSION:
+            raise ValueError(f"Profile version {header.get('version')} not supported")
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        categories = {
+            name: pd.Index(values, dtype=object)
+            for name, values in header["categories"].items()
+        }
+        return cls(
+            header["numerical"],
+            header["categorical"],
+            categories,
+            arrays,
+            header["n_bins"],
+            header["content_hash"],
+            header["sketched"],
+        )
+
+    def __reduce__(self):
+        # A saved profile is pickled as its path, so processes receiving it
+        # memory-map the same pages instead of copying the arrays
+        if self.path is not None:
+            return (_load_saved, (self.path,))
+        return super().__reduce__()
+
+    def bin_edges(self, feature: str, n_bins: int | None = None) -> np.ndarray:
+        """Histogram bin edges of a numerical feature, on the range of its values.
+
+        Args:
+            feature (str): Name of the feature
+            n_bins (int | None): Number of bins, the bins of the profile if None
+
+        Returns:
+            np.ndarray: The ``n_bins + 1`` edges, as ``np.histogram_bin_edges``
+        """
+        j = self._numerical[feature]
+        if n_bins is None or n_bins == self.n_bins:
+            return np.array(self._bin_edges[j])
+        column = self.sorted_values[:, j]
+        present = column[: self.count(feature)]
+        return _bin_edges(present[[0, -1]] if len(present) else present, n_bins)
+
+    def quantile_bins(self, n_bins: int) -> tuple[np.ndarray, np.ndarray]:
+        """Bins of equal reference counts of all the numerical features.
+
+        The edges are the ``i / n_bins`` quantiles of the values (the lower
+        value, without interpolation). Bin ``i`` holds the values from edge
+        ``i - 1`` (included) to edge ``i``, the first and last bins are open.
+        Computed once per number of bins.
+
+        Args:
+            n_bins (int): Number of bins
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Inner edges of shape (numerical
+                features, n_bins - 1), NaN for features without values, and
+                reference counts of shape (numerical features, n_bins + 1),
+                the last count being of missing values
+        """
+        if n_bins not in self._quantile_bins:
+            n_features = len(self.numerical)
+            present = self._moments[0].astype(np.int64)
+            q = np.arange(1, n_bins) / n_bins
+            edges = np.full((n_features, n_bins - 1), np.nan)
+            if self.n_rows:
+                rows = np.floor(q[:, None] * np.maximum(present - 1, 0)).astype(
+                    np.int64
+                )
+                edges = self.sorted_values[rows, np.arange(n_features)].T
+                edges[present == 0] = np.nan
+
+            counts = np.zeros((n_features, n_bins + 1), dtype=np.int64)
+            for j in range(n_features):
+                # Number of values below each edge, the values being sorted
+                below = np.searchsorted(self.sorted_values[: present[j], j], edges[j])
+                bounds = np.concatenate([[0], below, [present[j]]])
+                counts[j, :n_bins] = np.diff(bounds)
+                counts[j, n_bins] = self.n_rows - present[j]
+            self._quantile_bins[n_bins] = (edges, counts)
+        return self._quantile_bins[n_bins]
+
+    def values(self, feature: str) -> np.ndarray:
+        """Sorted values of a numerical feature, without missing values."""
+        return self.sorted_values[: self.count(feature), self._numerical[feature]]
+
+    def histogram(self, feature: str) -> np.ndarray:
+        """Histogram counts of a numerical feature on the bins of the profile."""
+        return np.array(self._histograms[self._numerical[feature]])
+
+    def count(self, feature: str) -> int:
+        """Number of non missing values of a numerical feature."""
+        return int(self._moments[0, self._numerical[feature]])
+
+    def mean(self, feature: str) -> float:
+        return float(self._moments[1, self._numerical[feature]])
+
+    def variance(self, feature: str) -> float:
+        """Population variance of a numerical feature."""
+        return float(self._moments[2, self._numerical[feature]])
+
+    def category_counts(self, feature: str) -> np.ndarray:
+        """Counts of the categories of a categorical feature, then of missing values."""
+        return np.array(self._category_counts[self._cat_slices[feature]])
+
+    def encode(
+        self, feature: str, values: "pd.Series"
+    ) -> tuple[np.ndarray, pd.Index, np.ndarray]:
+        """Encode values of a categorical feature with the reference dictionary.
+
+        Categories not in the reference are added after the reference ones, in
+        order of appearance, as ``pd.factorize`` on the reference followed by the
+        values would do. For a sketched feature, see ``_encode_sketched``.
+
+        Args:
+            feature (str): Name of the feature
+            values (pd.Series): Values to encode
+
+        Returns:
+            tuple[np.ndarray, pd.Index, np.ndarray]: Code of each value (the
+                number of categories for missing values), the categories, and
+                the reference counts of the categories then of missing values
+        """
+        if feature in self.sketches:
+            return self._encode_sketched(feature, values)
+        categories = self.categories[feature]
+        codes = categories.get_indexer(values)
+        missing = pd.isna(values).to_numpy()
+        unknown = (codes < 0) & ~missing
+        if unknown.any():
+            new_codes, new_values = pd.factorize(values[unknown])
+            codes[unknown] = new_codes + len(categories)
+            categories = categories.append(pd.Index(new_values, dtype=object))
+        codes[missing] = len(categories)
+
+        reference_counts = self.category_counts(feature)
+        n_new = len(categories) - len(self.categories[feature])
+        reference_counts = np.concatenate(
+            [
+                reference_counts[:-1],
+                np.zeros(n_new, dtype=np.int64),
+                reference_counts[-1:],
+            ]
+        )
+        return codes.astype(np.int64), categories, reference_counts
+
+    def _encode_sketched(
+        self, feature: str, values: "pd.Series"
+    ) -> tuple[np.ndarray, pd.Index, np.ndarray]:
+        """Encode values of a sketched feature, as ``encode``.
+
+        The categories are the heavy hitters of the reference, then the
+        ``CATEGORY_HEAVY_HITTERS`` most frequent other values, then
+        ``OTHER_CATEGORY`` for the remaining values. The reference counts of the
+        most frequent other values are estimated by the count-min sketch, and
+        the rest of the reference values not in the heavy hitters are counted as
+        ``OTHER_CATEGORY``.
+        """
+        heavy = self.categories[feature][:-1]
+        reference_counts = self.category_counts(feature)
+        other_count = reference_counts[-2]
+        codes = heavy.get_indexer(values)
+        missing = pd.isna(values).to_numpy()
+        others = (codes < 0) & ~missing
+
+        other_codes, other_values = pd.factorize(values[others])
+        frequent = np.argsort(
+            -np.bincount(other_codes, minlength=len(other_values)), kind="stable"
+        )[:CATEGORY_HEAVY_HITTERS]
+        ranks = np.full(len(other_values), len(frequent))
+        ranks[frequent] = np.arange(len(frequent))
+        codes[others] = len(heavy) + ranks[other_codes]
+        codes[missing] = len(heavy) + len(frequent) + 1
+
+        frequent_values = pd.Index(other_values[frequent], dtype=object)
+        estimates = np.minimum(
+            self.sketches[feature].query(value_hashes(frequent_values)), other_count
+        )
+        categories = heavy.append(frequent_values).append(
+            pd.Index([OTHER_CATEGORY], dtype=object)
+        )
+        reference_counts = np.concatenate(
+            [
+                reference_counts[:-2],
+                estimates,
+                [max(other_count - estimates.sum(), 0), reference_counts[-1]],
+            ]
+        )
+        return codes.astype(np.int64), categories, reference_counts.astype(np.int64)
+
+    def encode_frame(self, df: pd.DataFrame) -> "EncodedCategories":
+        """Encode all the categorical features of rows with the reference dictionaries.
+
+        Args:
+            df (pd.DataFrame): Rows with the columns of the categorical features
+
+        Returns:
+            EncodedCategories: The codes of the rows, as ``encode`` per feature
+        """
+        codes = np.empty((len(df), len(self.categorical)), dtype=np.int32)
+        categories: dict[str, pd.Index] = {}
+        reference_counts: dict[str, np.ndarray] = {}
+        offset = 0
+        for j, name in enumerate(self.categorical):
+            feature_codes, categories[name], reference_counts[name] = self.encode(
+                name, df[name]
+            )
+            codes[:, j] = feature_codes + offset
+            offset += len(categories[name]) + 1
+        return EncodedCategories(codes, categories, reference_counts)
+
+    def cdf_integrals(self, x: np.ndarray) -> np.ndarray:
+        """Integrals of the CDFs of the numerical features up to given values.
+
+        Args:
+            x (np.ndarray): Values of shape (n, numerical features)
+
+        Returns:
+            np.ndarray: Integral of the CDF of each column up to each value
+        """
+        m = self.n_rows
+        counts = np.empty(x.shape, dtype=np.int64)
+        for j in range(x.shape[1]):
+            counts[:, j] = np.searchsorted(
+                self.sorted_values[:, j], x[:, j], side="right"
+            )
+        previous = np.maximum(counts - 1, 0)
+        integrals = np.take_along_axis(self.integrals, previous, axis=0) + (
+            counts / m
+        ) * (x - np.take_along_axis(self.sorted_values, previous, axis=0))
+        return np.where(counts > 0, integrals, 0.0)
+
+
+def _load_saved(path: str) -> ReferenceProfile:
+    profile = ReferenceProfile.load(path)
+    profile.path = path
+    return profile
+
+
+def _bin_edges(values: np.ndarray, n_bins: int) -> np.ndarray:
+    if len(values) == 0:
+        return np.linspace(0.0, 1.0, n_bins + 1)
+    return np.histogram_bin_edges(values, bins=n_bins)
+
+
+def _settings_digest(datashape: DataShape, n_bins: int) -> "hashlib._Hash":
+    digest = hashlib.sha256()
+    digest.update(
+        f"{PROFILE_VERSION}|{n_bins}|{CATEGORY_SKETCH_THRESHOLD}|"
+        f"{CATEGORY_HEAVY_HITTERS}|{CATEGORY_SKETCH_WIDTH}|{CATEGORY_SKETCH_DEPTH}".encode()
+    )
+    digest.update(datashape.model_dump_json(include={"features"}).encode())
+    return digest
+
+
+def profile_hash(datashape: DataShape, data: pd.DataFrame, n_bins: int) -> str:
+    """Hash of the content of a reference and of the profile settings."""
+    digest = _settings_digest(datashape, n_bins)
+    columns = [f.name for f in datashape.features]
+    hashes = pd.util.hash_pandas_object(data[columns], index=False)
+    digest.update(hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def version_hash(datashape: DataShape, version: str, n_bins: int) -> str:
+    """Hash of the version of a reference and of the profile settings."""
+    digest = _settings_digest(datashape, n_bins)
+    digest.update(f"version|{version}".encode())
+    return digest.hexdigest()
+
+
+def settings_hash(datashape: DataShape, n_bins: int) -> str:
+    """Short hash of the profile settings, shared by the versions of a dataset."""
+    return _settings_digest(datashape, n_bins).hexdigest()[:16]
+
+
+def profile_path(dataset_pid: object, settings: str, content_hash: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{dataset_pid}-{settings}-{content_hash}")
+
+
+# Profiles of the reference frames in use, by frame id and datashape. An entry is
+# removed when its frame is garbage collected.
+_profiles: dict[tuple[int, str], tuple[weakref.ref, ReferenceProfile]] = {}
+
+
+def reference_profile(datashape: DataShape, reference: Dataset) -> ReferenceProfile:
+    """Profile of a reference dataset, built once and then loaded from the cache.
+
+    Args:
+        datashape: Datashape of the project
+        reference: The reference dataset, with its data
+
+    Returns:
+        ReferenceProfile: The profile, shared with other callers
+    """
+    data = reference.data
+    key = (id(data), datashape.model_dump_json(include={"features"}))
+    cached = _profiles.get(key)
+    if cached is not None and cached[0]() is data:
+        return cached[1]
+
+    if reference.version is not None:
+        content_hash = version_hash(datashape, reference.version, WINDOW_STATS_BINS)
+    else:
+        content_hash = profile_hash(datashape, data, WINDOW_STATS_BINS)
+    settings = settings_hash(datashape, WINDOW_STATS_BINS)
+    path = profile_path(reference.pid, settings, content_hash)
+    profile = None
+    if os.path.exists(path):
+        try:
+            profile = _load_saved(path)
+            logger.debug(f"Profile of dataset {reference.pid} loaded from {path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Cannot load profile {path} ({e}), building it")
+    if profile is None:
+        profile = ReferenceProfile.build(
+            datashape, data, WINDOW_STATS_BINS, content_hash
+        )
+        if _save_profile(profile, reference.pid, settings, path):
+            profile.path = path
+
+    share_profile(datashape, reference, profile)
+    return profile
+
+
+def share_profile(
+    datashape: DataShape, reference: Dataset, profile: ReferenceProfile
+) -> None:
+    """Use a profile built elsewhere as the profile of a reference dataset.
+
+    Used by the processes evaluating windows, whose copy of the reference may
+    only have the columns read outside of the profile.
+
+    Args:
+        datashape: Datashape of the project
+        reference: The reference dataset, with its data
+        profile: The profile of the full reference
+    """
+    data = reference.data
+    key = (id(data), datashape.model_dump_json(include={"features"}))
+    _profiles[key] = (weakref.ref(data), profile)
+    weakref.finalize(data, _profiles.pop, key, None)
+
+
+def _save_profile(
+    profile: ReferenceProfile, dataset_pid: object, settings: str, path: str
+) -> bool:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=PROFILE_DIR, prefix=".tmp-")
+    tmp_path = os.path.join(tmp_dir, "profile")
+    try:
+        profile.save(tmp_path)
+        # A profile published meanwhile by another worker is the same
+        if not os.path.exists(path):
+            os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Profile of dataset {dataset_pid} not saved: {e}")
+        return False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Profiles of older versions of the dataset with the same settings will not
+    # be used again. Other datashapes of the dataset keep their profiles.
+    prefix = f"{dataset_pid}-{settings}-"
+    for name in os.listdir(PROFILE_DIR):
+        if name.startswith(prefix) and name != os.path.basename(path):
+            shutil.rmtree(os.path.join(PROFILE_DIR, name), ignore_errors=True)
+    logger.debug(f"Profile of dataset {dataset_pid} saved in {path}")
+    return True
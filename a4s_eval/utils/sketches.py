@@ -0,0 +1,533 @@
+"""Mergeable sketches of data streams.
+
+``KLLSketch`` is a KLL sketch (Karnin, Lang and Liberty, "Optimal Quantile
+Approximation in Streams", 2016). It keeps a small weighted sample of the values
+seen, organized in levels where an item of level ``h`` stands for ``2**h``
+values. When a level is full, it is sorted and every other item is promoted to
+the next level. Sketches of different parts of the data can be merged, and the
+result has the same guarantees as a sketch of the whole data.
+
+With a top level of ``k`` items, the rank error of a quantile is in the order of
+``2 / k`` of the number of values (about 1% for the default ``k=200``, also after
+merges). Sketches of at most ``k`` values are exact.
+
+``CountMinSketch`` is a count-min sketch (Cormode and Muthukrishnan, "An
+Improved Data Stream Summary: the Count-Min Sketch and its Applications", 2005),
+which estimates the count of any value of a stream of categories with a fixed
+table of counters, whatever the number of distinct values.
+
+``CategorySketch`` counts the values of a categorical feature exactly up to a
+number of distinct values, then with a count-min sketch and the estimated counts
+of its most frequent values, as the reference profiles do.
+
+``FrameSketch`` summarizes the features of rows read chunk by chunk, with a KLL
+sketch per numerical feature and a category sketch per categorical feature. Its
+size depends on ``k`` and on the sketch settings, not on the number of rows. ``BucketSketches`` keeps one per date bucket, so the rows of any window of
+whole buckets can be summarized without keeping the rows.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import DataShape, FeatureType
+from a4s_eval.utils.dates import get_date_batches
+from a4s_eval.utils.env import (
+    CATEGORY_HEAVY_HITTERS,
+    CATEGORY_SKETCH_DEPTH,
+    CATEGORY_SKETCH_THRESHOLD,
+    CATEGORY_SKETCH_WIDTH,
+)
+
+NUMERICAL_TYPES = (FeatureType.INTEGER, FeatureType.FLOAT)
+
+
+class KLLSketch:
+    """Quantile sketch of a stream of floats."""
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        """Initialize an empty sketch.
+
+        Args:
+            k (int): Capacity of the top level, which sets the accuracy
+            seed (int): Seed of the random choices of the compactions, so the
+                sketch of the same values is always the same
+        """
+        self.k = k
+        self.n = 0
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item stays at its level
+            keep = items[len(items) - len(items) % 2 :]
+            promoted = items[self._rng.integers(2) : len(items) - len(keep) : 2]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # Capacities of lower levels shrink when a level is added
+            level = 0
+
+    def update(self, values: np.ndarray) -> "KLLSketch":
+        """Add values to the sketch. Missing values are ignored.
+
+        Args:
+            values (np.ndarray): Values to add
+
+        Returns:
+            KLLSketch: The sketch, updated in place
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Add the values of another sketch to this sketch.
+
+        Args:
+            other (KLLSketch): The sketch to merge, left unchanged
+
+        Returns:
+            KLLSketch: This sketch, updated in place
+        """
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def copy(self) -> "KLLSketch":
+        sketch = KLLSketch(self.k)
+        sketch.n = self.n
+        sketch.levels = [items.copy() for items in self.levels]
+        sketch._rng = np.random.default_rng(self._rng.integers(2**32))
+        return sketch
+
+    def weighted_items(self) -> tuple[np.ndarray, np.ndarray]:
+        """Items kept by the sketch and the number of values each stands for."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(items), 2**level) for level, items in enumerate(self.levels)]
+        )
+        return items, weights
+
+    def _weighted_items(self) -> tuple[np.ndarray, np.ndarray]:
+        items, weights = self.weighted_items()
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, q: np.ndarray | float) -> np.ndarray:
+        """Approximate quantiles of the values.
+
+        Args:
+            q (np.ndarray | float): Quantiles to compute, between 0 and 1
+
+        Returns:
+            np.ndarray: The smallest values whose rank is at least ``q`` of the
+                values, NaN if the sketch is empty
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return items[np.minimum(positions, len(items) - 1)]
+
+    def cdf(self, x: np.ndarray | float) -> np.ndarray:
+        """Approximate fraction of the values lower than or equal to ``x``."""
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        if self.n == 0:
+            return np.full(x.shape, np.nan)
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(items, x, side="right")
+        ranks = np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)], 0)
+        return ranks / cumulative[-1]
+
+
+def value_hashes(values: "pd.Series | np.ndarray") -> np.ndarray:
+    """64 bits hashes of categories, the same for a value and its string."""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+class CountMinSketch:
+    """Approximate counts of the values of a stream of categories.
+
+    Each of the ``depth`` rows of ``width`` counters counts the values hashed to
+    its counters, and the estimated count of a value is the smallest of its
+    counters. The estimate is never below the true count, and above it by at
+    most ``e / width`` of the total count with probability ``1 - exp(-depth)``.
+    """
+
+    def __init__(
+        self,
+        width: int = 65536,
+        depth: int = 4,
+        seed: int = 0,
+        table: np.ndarray | None = None,
+    ):
+        """Initialize an empty sketch, or a sketch of saved counters.
+
+        Args:
+            width (int): Counters per row, which sets the accuracy
+            depth (int): Number of rows, which sets the confidence
+            seed (int): Seed of the hash functions of the rows, the same for
+                sketches to be merged or compared
+            table (np.ndarray | None): Counters of shape (depth, width), which
+                set the width and depth when given
+        """
+        if table is None:
+            table = np.zeros((depth, width), dtype=np.int64)
+        self.table = table
+        self.seed = seed
+        depth, self.width = table.shape
+        rng = np.random.default_rng(seed)
+        # Odd multipliers of the multiply-shift hash of each row
+        self._multipliers = rng.integers(
+            2**63, size=depth, dtype=np.uint64
+        ) * np.uint64(2) + np.uint64(1)
+
+    @property
+    def n(self) -> int:
+        """Total count of the values."""
+        return int(self.table[0].sum())
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        mixed = (hashes[None, :] * self._multipliers[:, None]) >> np.uint64(32)
+        return (mixed % np.uint64(self.width)).astype(np.int64)
+
+    def update(
+        self, hashes: np.ndarray, counts: np.ndarray | None = None
+    ) -> "CountMinSketch":
+        """Count values.
+
+        Args:
+            hashes (np.ndarray): Hashes of the values, from ``value_hashes``
+            counts (np.ndarray | None): Number of times each value is counted,
+                once if None
+
+        Returns:
+            CountMinSketch: The sketch, updated in place
+        """
+        for row, columns in zip(self.table, self._columns(hashes)):
+            added = np.bincount(columns, weights=counts, minlength=self.width)
+            row += np.rint(added).astype(np.int64)
+        return self
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        """Add the counts of a sketch of the same width, depth and seed."""
+        self.table = self.table + other.table
+        return self
+
+    def query(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated counts of values, given by their hashes."""
+        columns = self._columns(hashes)
+        return self.table[np.arange(len(columns))[:, None], columns].min(axis=0)
+
+
+class CategorySketch:
+    """Counts of the values of a stream of categories, with bounded memory.
+
+    The counts are exact up to ``threshold`` distinct values. Beyond, all the
+    values are counted by a count-min sketch, and the ``heavy_hitters`` values
+    with the largest estimated counts are kept as the known categories.
+    """
+
+    def __init__(
+        self,
+        threshold: int | None = None,
+        heavy_hitters: int | None = None,
+        width: int | None = None,
+        depth: int | None = None,
+    ):
+        """Initialize an empty sketch.
+
+        Args:
+            threshold (int | None): Distinct values counted exactly,
+                CATEGORY_SKETCH_THRESHOLD by default
+            heavy_hitters (int | None): Values kept once sketched,
+                CATEGORY_HEAVY_HITTERS by default
+            width (int | None): Width of the count-min sketch,
+                CATEGORY_SKETCH_WIDTH by default
+            depth (int | None): Depth of the count-min sketch,
+                CATEGORY_SKETCH_DEPTH by default
+        """
+        self.threshold = threshold or CATEGORY_SKETCH_THRESHOLD
+        self.heavy_hitters = heavy_hitters or CATEGORY_HEAVY_HITTERS
+        self.width = width or CATEGORY_SKETCH_WIDTH
+        self.depth = depth or CATEGORY_SKETCH_DEPTH
+        #: Total count of the values
+        self.n = 0
+        #: Exact counts, None once sketched
+        self.exact: Counter | None = Counter()
+        self.count_min: CountMinSketch | None = None
+        #: Estimated counts of the most frequent values, once sketched
+        self.heavy: dict = {}
+
+    @property
+    def sketched(self) -> bool:
+        """Whether the counts are estimated by the count-min sketch."""
+        return self.count_min is not None
+
+    def _keep_heavy(self, candidates: list) -> None:
+        values = list(dict.fromkeys([*self.heavy, *candidates]))
+        estimates = self.count_min.query(value_hashes(values))
+        top = np.argsort(-estimates, kind="stable")[: self.heavy_hitters]
+        self.heavy = {values[i]: int(estimates[i]) for i in top}
+
+    def _sketch(self) -> None:
+        exact, self.exact = self.exact, None
+        self.count_min = CountMinSketch(self.width, self.depth)
+        self._count(exact)
+
+    def _count(self, counts: dict) -> None:
+        if not counts:
+            return
+        if self.exact is not None:
+            self.exact.update(counts)
+            if len(self.exact) > self.threshold:
+                self._sketch()
+            return
+        values = list(counts)
+        self.count_min.update(
+            value_hashes(values), np.fromiter(counts.values(), float, len(values))
+        )
+        self._keep_heavy(values)
+
+    def update(self, values: pd.Series) -> "CategorySketch":
+        """Count values. Missing values are ignored.
+
+        Args:
+            values (pd.Series): Values to count
+
+        Returns:
+            CategorySketch: The sketch, updated in place
+        """
+        counts = values.value_counts(dropna=True).to_dict()
+        self.n += int(sum(counts.values()))
+        self._count(counts)
+        return self
+
+    def merge(self, other: "CategorySketch") -> "CategorySketch":
+        """Add the counts of a sketch with the same settings.
+
+        Args:
+            other (CategorySketch): The sketch to merge, left unchanged
+
+        Returns:
+            CategorySketch: This sketch, updated in place
+        """
+        self.n += other.n
+        if other.exact is not None:
+            self._count(other.exact)
+            return self
+        if self.exact is not None:
+            self._sketch()
+        self.count_min.merge(other.count_min)
+        self._keep_heavy(list(other.heavy))
+        return self
+
+    def keys(self) -> list:
+        """Known categories: all the values, or the heavy hitters once sketched."""
+        return list(self.exact if self.exact is not None else self.heavy)
+
+    def table(self) -> dict:
+        """Counts of the known categories, estimated once sketched."""
+        return dict(self.exact if self.exact is not None else self.heavy)
+
+    def counts(self, categories: list) -> np.ndarray:
+        """Counts of categories, estimated once sketched."""
+        if self.exact is not None:
+            return np.array([self.exact.get(c, 0) for c in categories], dtype=float)
+        return self.count_min.query(value_hashes(categories)).astype(float)
+
+
+def aligned_counts(
+    ref: CategorySketch, new: CategorySketch
+) -> tuple[np.ndarray, np.ndarray]:
+    """Counts of two category sketches on the known categories of both.
+
+    When either is sketched, the count of the other values is appended to both.
+    """
+    categories = list(dict.fromkeys([*ref.keys(), *new.keys()]))
+    ref_counts, new_counts = ref.counts(categories), new.counts(categories)
+    if ref.sketched or new.sketched:
+        ref_counts = np.append(ref_counts, max(ref.n - ref_counts.sum(), 0))
+        new_counts = np.append(new_counts, max(new.n - new_counts.sum(), 0))
+    return ref_counts, new_counts
+
+
+class FrameSketch:
+    """Mergeable summary of the features of a stream of rows.
+
+    Missing values are counted apart and left out of the sketches.
+    """
+
+    def __init__(self, datashape: DataShape, k: int = 200):
+        """Initialize an empty summary.
+
+        Args:
+            datashape (DataShape): Datashape of the project
+            k (int): Size of the KLL sketches of the numerical features
+        """
+        self.k = k
+        self.n_rows = 0
+        self.sketches: dict[str, KLLSketch] = {
+            f.name: KLLSketch(k)
+            for f in datashape.features
+            if f.feature_type in NUMERICAL_TYPES
+        }
+        self.counts: dict[str, CategorySketch] = {
+            f.name: CategorySketch()
+            for f in datashape.features
+            if f.feature_type == FeatureType.CATEGORICAL
+        }
+        self.missing: Counter = Counter()
+
+    def update(self, df: pd.DataFrame) -> "FrameSketch":
+        """Add rows to the summary.
+
+        Args:
+            df (pd.DataFrame): Rows with the columns of the features
+
+        Returns:
+            FrameSketch: The summary, updated in place
+        """
+        self.n_rows += len(df)
+        for name, sketch in self.sketches.items():
+            values = pd.to_numeric(df[name], errors="coerce").to_numpy(float)
+            sketch.update(values)
+            self.missing[name] += int(np.isnan(values).sum())
+        for name, counts in self.counts.items():
+            column = df[name]
+            counts.update(column)
+            self.missing[name] += int(column.isna().sum())
+        return self
+
+    def merge(self, other: "FrameSketch") -> "FrameSketch":
+        """Add the rows summarized by another summary of the same features.
+
+        Args:
+            other (FrameSketch): The summary to merge, left unchanged
+
+        Returns:
+            FrameSketch: This summary, updated in place
+        """
+        self.n_rows += other.n_rows
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        for name, counts in self.counts.items():
+            counts.merge(other.counts[name])
+        self.missing.update(other.missing)
+        return self
+
+
+class BucketSketches:
+    """Summaries of each ``date_round`` bucket of a stream of dated rows.
+
+    Rows can come in any date order. Windows made of whole buckets are
+    assembled by merging the summaries of their buckets.
+    """
+
+    def __init__(self, datashape: DataShape, date_round: str, k: int = 200):
+        """Initialize empty summaries.
+
+        Args:
+            datashape (DataShape): Datashape of the project, with a date feature
+            date_round (str): Size of the buckets (e.g. '1 D')
+            k (int): Size of the KLL sketches of the numerical features
+        """
+        self.datashape = datashape
+        self.date_round = date_round
+        self.k = k
+        #: Summary of each bucket, by bucket start as int64 nanoseconds
+        self.buckets: dict[int, FrameSketch] = {}
+        #: First and last date of the rows of each bucket
+        self.first_dates: dict[int, pd.Timestamp] = {}
+        self.last_dates: dict[int, pd.Timestamp] = {}
+
+    def update(self, df: pd.DataFrame) -> "BucketSketches":
+        """Add rows to the summaries of their buckets. Undated rows are ignored.
+
+        Args:
+            df (pd.DataFrame): Rows with the columns of the features and the date
+
+        Returns:
+            BucketSketches: The summaries, updated in place
+        """
+        dates = pd.to_datetime(df[self.datashape.date.name])
+        dated = dates.notna().to_numpy()
+        df, dates = df[dated], dates[dated]
+        buckets = pd.DatetimeIndex(dates.dt.floor(self.date_round)).as_unit("ns").asi8
+        for bucket, positions in pd.Series(np.arange(len(df))).groupby(buckets):
+            rows = positions.to_numpy()
+            if bucket not in self.buckets:
+                self.buckets[bucket] = FrameSketch(self.datashape, self.k)
+            self.buckets[bucket].update(df.iloc[rows])
+            bucket_dates = dates.iloc[rows]
+            first, last = bucket_dates.min(), bucket_dates.max()
+            self.first_dates[bucket] = min(self.first_dates.get(bucket, first), first)
+            self.last_dates[bucket] = max(self.last_dates.get(bucket, last), last)
+        return self
+
+    def batches(
+        self, window: str, freq: str
+    ) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+        """Windows of the rows, as ``DateIterator.batches``.
+
+        Raises:
+            ValueError: If the windows are not made of whole buckets
+        """
+        if not self.buckets:
+            return []
+        start_date = min(self.first_dates.values())
+        end_date = max(self.last_dates.values())
+        batches = get_date_batches(start_date, end_date, self.date_round, window, freq)
+        if start_date != end_date and any(
+            start.floor(self.date_round) != start or end.floor(self.date_round) != end
+            for start, end in batches
+        ):
+            raise ValueError(f"Windows are not made of {self.date_round} buckets")
+        return batches
+
+    def window(
+        self, start: pd.Timestamp, end: pd.Timestamp
+    ) -> tuple[FrameSketch, pd.Timestamp | None]:
+        """Summary of the rows dated from ``start`` (included) to ``end``.
+
+        Args:
+            start (pd.Timestamp): Start of the window
+            end (pd.Timestamp): End of the window
+
+        Returns:
+            tuple[FrameSketch, pd.Timestamp | None]: The summary of the window,
+                and the last date of its rows (None if it has no rows)
+        """
+        first = start.floor(self.date_round).as_unit("ns").value
+        last = end.as_unit("ns").value
+        summary = FrameSketch(self.datashape, self.k)
+        last_date = None
+        for bucket in sorted(b for b in self.buckets if first <= b < last):
+            summary.merge(self.buckets[bucket])
+            bucket_date = self.last_dates[bucket]
+            last_date = (
+                bucket_date if last_date is None else max(last_date, bucket_date)
+            )
+        return summary, last_date
@@ -0,0 +1,76 @@
+"""Fixed-size embeddings of text, without a trained model.
+
+Each text is turned into the counts of its character n-grams, hashed to
+``TEXT_HASH_FEATURES`` columns of a sparse matrix (``HashingVectorizer``, which
+needs no vocabulary, so any chunk of rows is vectorized on its own). The rows
+are then reduced to ``TEXT_EMBEDDING_DIM`` dimensions by a sparse random
+projection, which keeps the distances between rows (Johnson-Lindenstrauss). The
+projection only depends on its dimensions and seed, and is drawn once per
+process.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.random_projection import SparseRandomProjection
+
+from a4s_eval.utils.env import TEXT_EMBEDDING_DIM, TEXT_HASH_FEATURES
+
+# Character n-grams of the words, padded with spaces
+NGRAM_RANGE = (2, 4)
+# Rows vectorized at once
+CHUNK_ROWS = 10000
+
+
+@lru_cache(maxsize=4)
+def _vectorizer(n_features: int) -> HashingVectorizer:
+    return HashingVectorizer(
+        analyzer="char_wb",
+        ngram_range=NGRAM_RANGE,
+        n_features=n_features,
+        alternate_sign=False,
+        norm="l2",
+        dtype=np.float32,
+    )
+
+
+@lru_cache(maxsize=4)
+def projection(
+    n_features: int, n_components: int, seed: int
+) -> scipy.sparse.csr_matrix:
+    """Sparse random projection matrix of shape (n_features, n_components)."""
+    transformer = SparseRandomProjection(n_components, random_state=seed)
+    transformer.fit(scipy.sparse.csr_matrix((1, n_features), dtype=np.float32))
+    return scipy.sparse.csr_matrix(transformer.components_.T, dtype=np.float32)
+
+
+def embed_text(
+    values: "pd.Series | np.ndarray",
+    n_features: int | None = None,
+    n_components: int | None = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """Embed texts with hashed n-grams and a random projection.
+
+    Args:
+        values: Texts, missing values being embedded as empty texts
+        n_features: Number of hashed n-gram columns, TEXT_HASH_FEATURES by default
+        n_components: Size of the embeddings, TEXT_EMBEDDING_DIM by default
+        seed: Seed of the projection
+
+    Returns:
+        np.ndarray: float32 embeddings of shape (n, n_components)
+    """
+    n_features = n_features or TEXT_HASH_FEATURES
+    n_components = n_components or TEXT_EMBEDDING_DIM
+    texts = pd.Series(values, dtype=object).fillna("").astype(str).to_numpy()
+    vectorizer = _vectorizer(n_features)
+    matrix = projection(n_features, n_components, seed)
+    embeddings = np.empty((len(texts), n_components), dtype=np.float32)
+    for lo in range(0, len(texts), CHUNK_ROWS):
+        counts = vectorizer.transform(texts[lo : lo + CHUNK_ROWS])
+        embeddings[lo : lo + CHUNK_ROWS] = (counts @ matrix).toarray()
+    return embeddings
@@ -0,0 +1,167 @@
+"""Arrays of an evaluation window shared by the metrics.
+
+The metrics of a window all need the date of the window, the targets, the
+predicted labels or the feature values. ``WindowContext`` derives each of them
+from the window the first time it is read and keeps it, so the registered
+metrics share the work instead of repeating it on the DataFrame. The evaluation
+tasks build one context per window and attach it to the evaluated dataset.
+"""
+
+import uuid
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, Feature, FeatureType
+from a4s_eval.utils.text_embedding import embed_text
+
+NUMERICAL_TYPES = (FeatureType.INTEGER, FeatureType.FLOAT)
+
+
+class WindowContext:
+    """Lazily computed and memoized arrays of one window. Must not be modified."""
+
+    def __init__(
+        self,
+        datashape: DataShape,
+        data: pd.DataFrame,
+        y_pred_proba: np.ndarray | None = None,
+        start: pd.Timestamp | None = None,
+        end: pd.Timestamp | None = None,
+        shape: DataShape | None = None,
+    ):
+        """Initialize the context of a window.
+
+        Args:
+            datashape (DataShape): Datashape of the project
+            data (pd.DataFrame): Rows of the window
+            y_pred_proba (np.ndarray | None): Predicted probabilities of the rows
+            start (pd.Timestamp | None): Start of the window, the first date of
+                the rows if None
+            end (pd.Timestamp | None): End of the window, the last date of the
+                rows if None
+            shape (DataShape | None): Datashape of the evaluated dataset, which
+                gives the feature pids of the measures. The project datashape
+                if None.
+        """
+        self.datashape = datashape
+        self.data = data
+        self.y_pred_proba = y_pred_proba
+        self._start = start
+        self._end = end
+        self.shape = shape if shape is not None else datashape
+        self._text_embeddings: dict[str, np.ndarray] = {}
+
+    @cached_property
+    def dates(self) -> pd.Series:
+        """Dates of the rows."""
+        return pd.to_datetime(self.data[self.datashape.date.name])
+
+    @cached_property
+    def date(self) -> pd.Timestamp:
+        """Last date of the rows, the time of the measures of the window."""
+        return self.dates.max()
+
+    @property
+    def time(self) -> datetime:
+        """Time of the measures of the window."""
+        return self.date.to_pydatetime()
+
+    @cached_property
+    def start(self) -> pd.Timestamp:
+        return self._start if self._start is not None else self.dates.min()
+
+    @cached_property
+    def end(self) -> pd.Timestamp:
+        return self._end if self._end is not None else self.date
+
+    @cached_property
+    def y_true(self) -> np.ndarray:
+        """Targets of the rows."""
+        return self.data[self.datashape.target.name].to_numpy()
+
+    @cached_property
+    def y_pred(self) -> np.ndarray | None:
+        """Predicted labels of the rows, None without predictions."""
+        if self.y_pred_proba is None:
+            return None
+        return np.argmax(self.y_pred_proba, axis=1)
+
+    @cached_property
+    def feature_pids(self) -> dict[str, uuid.UUID]:
+        """Pids of the features of the evaluated dataset, by name."""
+        return {feature.name: feature.pid for feature in self.shape.features}
+
+    @cached_property
+    def numerical_features(self) -> list[Feature]:
+        return [f for f in self.datashape.features if f.feature_type in NUMERICAL_TYPES]
+
+    @cached_property
+    def categorical_features(self) -> list[Feature]:
+        return [
+            f
+            for f in self.datashape.features
+            if f.feature_type == FeatureType.CATEGORICAL
+        ]
+
+    @cached_property
+    def numerical_matrix(self) -> np.ndarray:
+        """Values of the numerical features, one column per feature, NaN if missing."""
+        names = [f.name for f in self.numerical_features]
+        matrix = np.empty((len(self.data), len(names)), dtype=np.float64)
+        for j, name in enumerate(names):
+            matrix[:, j] = pd.to_numeric(self.data[name], errors="coerce")
+        return matrix
+
+    @cached_property
+    def categorical_matrix(self) -> np.ndarray:
+        """Values of the categorical features, one column per feature."""
+        names = [f.name for f in self.categorical_features]
+        return self.data[names].to_numpy(dtype=object)
+
+    def text_embedding(self, name: str) -> np.ndarray:
+        """Embeddings of the texts of a feature, see ``embed_text``."""
+        if name not in self._text_embeddings:
+            self._text_embeddings[name] = embed_text(self.data[name])
+        return self._text_embeddings[name]
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of a numerical or categorical feature, from the feature matrices.
+
+        Args:
+            name (str): Name of the feature
+
+        Returns:
+            np.ndarray: The values of the feature, a view of the matrix
+
+        Raises:
+            KeyError: If the feature is not a numerical or categorical feature
+        """
+        for j, feature in enumerate(self.numerical_features):
+            if feature.name == name:
+                return self.numerical_matrix[:, j]
+        for j, feature in enumerate(self.categorical_features):
+            if feature.name == name:
+                return self.categorical_matrix[:, j]
+        raise KeyError(name)
+
+
+def window_context(
+    datashape: DataShape, dataset: Dataset, y_pred_proba: np.ndarray | None = None
+) -> WindowContext:
+    """Context of the window of an evaluated dataset.
+
+    Args:
+        datashape: Datashape of the project
+        dataset: The evaluated dataset
+        y_pred_proba: Predicted probabilities of the rows of the dataset
+
+    Returns:
+        WindowContext: The context set by the evaluation tasks, or a new context
+            of the dataset when a metric is called on its own
+    """
+    if dataset.context is not None:
+        return dataset.context
+    return WindowContext(datashape, dataset.data, y_pred_proba, shape=dataset.shape)
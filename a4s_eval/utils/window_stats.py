@@ -0,0 +1,844 @@
+"""Incremental statistics of sliding date windows.
+
+Consecutive windows of an evaluation overlap, e.g. by 29 days out of 30 for a
+30 days window moved by 1 day. Instead of recomputing the statistics of every
+window from scratch, ``WindowStats`` keeps running counts over the rows sorted by
+date: moving to the next window adds the rows entering it and subtracts the rows
+leaving it, so the cost of a step depends on the number of rows that changed,
+not on the size of the window.
+
+The statistics kept are, for numerical features, a histogram on fixed bins, the
+count, sum and sum of squares of the values, and the sums of the products of
+each pair of features (with the number of rows where both are present), which
+give the correlation matrix, all summed around a shift close to the mean of each
+feature to keep their precision; for categorical features, the count of each
+category; and, when predictions are given, the confusion matrix between the
+target and the predicted classes.
+
+All these statistics can be merged, so when every window is made of whole
+``date_round`` buckets (e.g. days), ``BucketSummaries`` computes them once per
+bucket, with a quantile sketch of each numerical feature, and assembles any
+window from the buckets it covers. The summaries of the evaluated data are kept
+in a disk cache, as an ``.npz`` file of their arrays and a JSON header, under the
+version of the dataset (``Dataset.version``), so evaluating the same data with
+another window or frequency does not go through the rows again.
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.data_model.evaluation import DataShape, FeatureType
+from a4s_eval.utils.cache import DiskCache
+from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.env import (
+    CACHE_DIR,
+    CACHE_MAX_BYTES,
+    WINDOW_SKETCH_K,
+    WINDOW_STATS_BINS,
+)
+from a4s_eval.utils.reference_profile import ReferenceProfile, encode_categories
+from a4s_eval.utils.sketches import KLLSketch
+
+NUMERICAL_TYPES = (FeatureType.INTEGER, FeatureType.FLOAT)
+
+
+def cross_products(
+    values: np.ndarray, shift: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Sufficient statistics of the covariances of the columns of some rows.
+
+    Products are summed on values minus ``shift``, close to the mean, so that
+    the sums of many rows keep their precision. Both results are packed upper
+    triangles, as ``np.triu_indices``.
+
+    Args:
+        values: Rows of shape (n, columns), NaN if missing
+        shift: Value subtracted from each column
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The sum of the products of each pair of
+            columns over the rows where both are present, and the number of
+            these rows
+    """
+    upper = np.triu_indices(values.shape[1])
+    present = ~np.isnan(values)
+    centered = np.where(present, values - shift, 0.0)
+    cross = (centered.T @ centered)[upper]
+    if present.all():
+        pairs_count = np.full(len(cross), len(values), dtype=np.int64)
+    else:
+        mask = present.astype(np.float64)
+        pairs_count = np.rint((mask.T @ mask)[upper]).astype(np.int64)
+    return cross, pairs_count
+
+
+def correlation_matrix(
+    count: np.ndarray,
+    total: np.ndarray,
+    cross: np.ndarray,
+    pairs_count: np.ndarray,
+) -> np.ndarray:
+    """Correlation matrix of columns from their sufficient statistics.
+
+    Each covariance is computed on the rows where both columns are present,
+    around the means of all the present values of each column, which is exact
+    without missing values.
+
+    Args:
+        count: Number of present values of each column
+        total: Sum of the present values of each column, minus the shift of
+            the sums of products
+        cross: Packed sums of products, from ``cross_products``
+        pairs_count: Packed counts of rows, from ``cross_products``
+
+    Returns:
+        np.ndarray: The correlation matrix, NaN for constant or empty columns
+    """
+    n_columns = len(count)
+    upper = np.triu_indices(n_columns)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = total / count
+        covariance = np.empty((n_columns, n_columns))
+        covariance[upper] = cross / pairs_count - means[upper[0]] * means[upper[1]]
+        covariance.T[upper] = covariance[upper]
+        scale = np.sqrt(np.diag(covariance))
+        correlation = covariance / np.outer(scale, scale)
+    correlation[~np.isfinite(correlation)] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+
+class _Statistics:
+    """Accessors to the statistics of a window, shared by the window classes."""
+
+    lo: int
+    hi: int
+    bin_edges: dict[str, np.ndarray]
+    categories: dict[str, pd.Index]
+    reference_counts: dict[str, np.ndarray]
+    labels: np.ndarray | None
+    confusion: np.ndarray | None
+    _hist: np.ndarray
+    _hist_slices: dict[str, slice]
+    _count: np.ndarray
+    _sum: np.ndarray
+    _sum_sq: np.ndarray
+    _numerical: dict[str, int]
+    _shift: np.ndarray
+    _cross: np.ndarray
+    _pairs_count: np.ndarray
+    _cat_counts: np.ndarray
+    _cat_slices: dict[str, slice]
+
+    @property
+    def n_rows(self) -> int:
+        return self.hi - self.lo
+
+    def histogram(self, feature: str) -> np.ndarray:
+        """Histogram counts of a numerical feature in the window."""
+        return self._hist[self._hist_slices[feature]].copy()
+
+    def count(self, feature: str) -> int:
+        """Number of non missing values of a numerical feature."""
+        return int(self._count[self._numerical[feature]])
+
+    def mean(self, feature: str) -> float:
+        j = self._numerical[feature]
+        if not self._count[j]:
+            return np.nan
+        return self._shift[j] + self._sum[j] / self._count[j]
+
+    def variance(self, feature: str) -> float:
+        """Population variance of a numerical feature."""
+        j = self._numerical[feature]
+        if not self._count[j]:
+            return np.nan
+        # Sums are kept around the shift, close to the mean, so they do not
+        # cancel for values large relative to their spread
+        mean = self._sum[j] / self._count[j]
+        return max(self._sum_sq[j] / self._count[j] - mean * mean, 0.0)
+
+    def category_counts(self, feature: str) -> np.ndarray:
+        """Counts of the categories of a categorical feature, then of missing values."""
+        return self._cat_counts[self._cat_slices[feature]].copy()
+
+    def correlation(self) -> np.ndarray:
+        """Correlation matrix of the numerical features, as ``DataFrame.corr``.
+
+        Returns:
+            np.ndarray: Pearson correlation of each pair of numerical features,
+                in the order of the datashape, NaN for constant features
+        """
+        return correlation_matrix(
+            self._count, self._sum, self._cross, self._pairs_count
+        )
+
+
+class WindowStats(_Statistics):
+    """Running statistics of the rows of the current window.
+
+    The rows are the rows of a frame sorted by date, as ``DateIterator.df``, and
+    a window is a range of positions in this frame, as ``DateIterator.bounds``.
+
+    Histograms have ``n_bins + 3`` counts: values below the first edge, the
+    ``n_bins`` bins, values above the last edge and missing values.
+    Category counts have one count per category, then the count of missing values.
+    """
+
+    def __init__(
+        self,
+        datashape: DataShape,
+        df: pd.DataFrame,
+        reference: pd.DataFrame | None = None,
+        y_pred: np.ndarray | None = None,
+        n_bins: int | None = None,
+        profile: ReferenceProfile | None = None,
+        confusion_only: bool = False,
+    ):
+        """Initialize the statistics on an empty window.
+
+        Args:
+            datashape (DataShape): Datashape of the project
+            df (pd.DataFrame): Frame sorted by date
+            reference (pd.DataFrame | None): Reference data, used to fix the
+                histogram bins and the categories. The evaluated data is used if
+                None.
+            y_pred (np.ndarray | None): Predicted class index of each row of
+                ``df``, to keep a confusion matrix with the target
+            n_bins (int | None): Number of histogram bins, WINDOW_STATS_BINS by
+                default
+            profile (ReferenceProfile | None): Profile of the reference data,
+                read instead of ``reference``
+            confusion_only (bool): Only keep the confusion matrix, without
+                histograms or category counts, for the prediction metrics
+        """
+        n_bins = n_bins or WINDOW_STATS_BINS
+        self.lo = 0
+        self.hi = 0
+        # Files of the per-row arrays memory-mapped by map_rows
+        self._row_files: dict[str, str] = {}
+
+        features = [] if confusion_only else datashape.features
+        numerical = [f.name for f in features if f.feature_type in NUMERICAL_TYPES]
+        categorical = [
+            f.name for f in features if f.feature_type == FeatureType.CATEGORICAL
+        ]
+
+        # Numerical features: values, and bin of each value with a per-feature
+        # offset, so all histograms are counted with a single bincount.
+        self._values = np.empty((len(df), len(numerical)))
+        for j, name in enumerate(numerical):
+            self._values[:, j] = pd.to_numeric(df[name], errors="coerce")
+        self.bin_edges: dict[str, np.ndarray] = {}
+        bins = np.empty(self._values.shape, dtype=np.int64)
+        for j, name in enumerate(numerical):
+            if profile is not None:
+                edges = profile.bin_edges(name, n_bins)
+            else:
+                source = df[name] if reference is None else reference[name]
+                edges = _bin_edges(pd.to_numeric(source, errors="coerce"), n_bins)
+            self.bin_edges[name] = edges
+            column = self._values[:, j]
+            column_bins = np.searchsorted(edges, column, side="right")
+            # The last bin includes its upper edge, as in np.histogram
+            column_bins[column == edges[-1]] = n_bins
+            column_bins[np.isnan(column)] = n_bins + 2
+            bins[:, j] = column_bins + j * (n_bins + 3)
+        self._bins = bins
+        self._hist = np.zeros(len(numerical) * (n_bins + 3), dtype=np.int64)
+        self._hist_slices = {
+            name: slice(j * (n_bins + 3), (j + 1) * (n_bins + 3))
+            for j, name in enumerate(numerical)
+        }
+        self._count = np.zeros(len(numerical), dtype=np.int64)
+        self._sum = np.zeros(len(numerical))
+        self._sum_sq = np.zeros(len(numerical))
+        self._numerical = {name: j for j, name in enumerate(numerical)}
+        present = np.count_nonzero(~np.isnan(self._values), axis=0)
+        self._shift = np.nansum(self._values, axis=0) / np.maximum(present, 1)
+        n_pairs = len(numerical) * (len(numerical) + 1) // 2
+        self._cross = np.zeros(n_pairs)
+        self._pairs_count = np.zeros(n_pairs, dtype=np.int64)
+
+        # Categorical features: codes in a dictionary shared with the reference
+        encoded = (
+            profile.encode_frame(df)
+            if profile is not None and not confusion_only
+            else encode_categories(categorical, df, reference)
+        )
+        self.categories: dict[str, pd.Index] = encoded.categories
+        self.reference_counts: dict[str, np.ndarray] = encoded.reference_counts
+        self._cat_slices: dict[str, slice] = encoded.slices
+        self._codes = encoded.codes
+        self._cat_counts = np.zeros(encoded.size, dtype=np.int64)
+
+        # Confusion matrix between target and predictions
+        self.labels: np.ndarray | None = None
+        self.confusion: np.ndarray | None = None
+        self._pairs: np.ndarray | None = None
+        if (
+            y_pred is not None
+            and datashape.target is not None
+            and pd.api.types.is_numeric_dtype(df[datashape.target.name])
+        ):
+            y_true = df[datashape.target.name].to_numpy()
+            if not pd.isna(y_true).any():
+                self.labels = np.union1d(y_true, np.arange(y_pred.max(initial=0) + 1))
+                n_labels = len(self.labels)
+                self._pairs = np.searchsorted(
+                    self.labels, y_true
+                ) * n_labels + np.searchsorted(self.labels, y_pred)
+                self.confusion = np.zeros((n_labels, n_labels), dtype=np.int64)
+
+    def map_rows(self, directory: str) -> "WindowStats":
+        """Move the arrays with one row per row of the frame to files.
+
+        The arrays are memory-mapped read-only, and pickled statistics only
+        keep the paths of the files, so processes sharing the statistics share
+        the pages of the rows instead of copying them.
+
+        Args:
+            directory (str): Directory of the files, which must outlive the
+                statistics and their copies
+
+        Returns:
+            WindowStats: The statistics, updated in place
+        """
+        for name in ("_values", "_bins", "_codes", "_pairs"):
+            array = getattr(self, name)
+            if array is None:
+                continue
+            path = os.path.join(directory, f"{name.lstrip('_')}.npy")
+            np.save(path, array)
+            self._row_files[name] = path
+            setattr(self, name, np.load(path, mmap_mode="r"))
+        return self
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in self._row_files:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        for name, path in self._row_files.items():
+            setattr(self, name, np.load(path, mmap_mode="r"))
+
+    def _update(self, lo: int, hi: int, sign: int) -> None:
+        if hi <= lo:
+            return
+        if self._hist.size:
+            self._hist += sign * np.bincount(
+                self._bins[lo:hi].ravel(), minlength=self._hist.size
+            )
+            values = self._values[lo:hi]
+            centered = values - self._shift
+            self._count += sign * np.count_nonzero(~np.isnan(values), axis=0)
+            self._sum += sign * np.nansum(centered, axis=0)
+            self._sum_sq += sign * np.nansum(centered * centered, axis=0)
+            cross, pairs_count = cross_products(values, self._shift)
+            self._cross += sign * cross
+            self._pairs_count += sign * pairs_count
+        if self._cat_counts.size:
+            self._cat_counts += sign * np.bincount(
+                self._codes[lo:hi].ravel(), minlength=self._cat_counts.size
+            )
+        if self.confusion is not None:
+            self.confusion += sign * np.bincount(
+                self._pairs[lo:hi], minlength=self.confusion.size
+            ).reshape(self.confusion.shape)
+
+    def move(self, lo: int, hi: int) -> "WindowStats":
+        """Move the window to the rows ``lo:hi`` of the sorted frame.
+
+        Only the rows entering and leaving the window are read. Windows that do
+        not overlap the current one are counted from scratch.
+
+        Args:
+            lo (int): First position of the window
+            hi (int): Position after the last row of the window
+
+        Returns:
+            WindowStats: The statistics, updated in place
+        """
+        if lo >= self.hi or hi <= self.lo:
+            self._update(self.lo, self.hi, -1)
+            self._update(lo, hi, 1)
+        else:
+            if lo > self.lo:
+                self._update(self.lo, lo, -1)
+            else:
+                self._update(lo, self.lo, 1)
+            if hi > self.hi:
+                self._update(self.hi, hi, 1)
+            else:
+                self._update(hi, self.hi, -1)
+        self.lo, self.hi = lo, hi
+        return self
+
+
+def _is_aligned(start: pd.Timestamp, end: pd.Timestamp, date_round: str) -> bool:
+    return start.floor(date_round) == start and end.floor(date_round) == end
+
+
+def _bin_edges(values: pd.Series, n_bins: int) -> np.ndarray:
+    values = values.dropna().to_numpy(float)
+    if len(values) == 0:
+        return np.linspace(0.0, 1.0, n_bins + 1)
+    return np.histogram_bin_edges(values, bins=n_bins)
+
+
+class WindowSummary(_Statistics):
+    """Statistics of a window assembled from bucket summaries."""
+
+    def __init__(self, summaries: "BucketSummaries", first: int, last: int):
+        """Merge the summaries of the buckets ``first:last``."""
+        self._summaries = summaries
+        self._buckets = slice(first, last)
+        self.lo = int(summaries.bucket_bounds[first])
+        self.hi = int(summaries.bucket_bounds[last])
+        self.bin_edges = summaries.bin_edges
+        self.categories = summaries.categories
+        self.reference_counts = summaries.reference_counts
+        self.labels = summaries.labels
+        self._hist_slices = summaries.hist_slices
+        self._numerical = summaries.numerical
+        self._shift = summaries.shift
+        self._cat_slices = summaries.cat_slices
+
+        # Statistics of the buckets are stored as cumulative sums
+        def merged(cumulative: np.ndarray) -> np.ndarray:
+            return cumulative[last] - cumulative[first]
+
+        self._hist = merged(summaries.hist)
+        self._count = merged(summaries.count)
+        self._sum = merged(summaries.sum)
+        self._sum_sq = merged(summaries.sum_sq)
+        self._cross = merged(summaries.cross)
+        self._pairs_count = merged(summaries.pairs_count)
+        self._cat_counts = merged(summaries.cat_counts)
+        self.confusion = (
+            merged(summaries.confusion).reshape(len(self.labels), -1)
+            if summaries.confusion is not None
+            else None
+        )
+        self._sketches: dict[str, KLLSketch] = {}
+
+    def sketch(self, feature: str) -> KLLSketch:
+        """Quantile sketch of a numerical feature in the window.
+
+        Raises:
+            ValueError: If the summaries were computed without sketches
+        """
+        if feature not in self._sketches:
+            buckets = self._summaries.sketches.get(feature)
+            if buckets is None:
+                raise ValueError(f"No quantile sketch of feature {feature}")
+            sketch = KLLSketch(self._summaries.sketch_k)
+            for bucket_sketch in buckets[self._buckets]:
+                sketch.merge(bucket_sketch)
+            self._sketches[feature] = sketch
+        return self._sketches[feature]
+
+    def quantiles(self, feature: str, q: np.ndarray | float) -> np.ndarray:
+        """Approximate quantiles of a numerical feature in the window."""
+        return self.sketch(feature).quantiles(q)
+
+
+class BucketSummaries:
+    """Mergeable statistics of each ``date_round`` bucket of the rows.
+
+    Additive statistics are stored as cumulative sums over the buckets, so the
+    statistics of any range of buckets are a single difference. Quantile sketches,
+    if ``sketch_k`` is set, are kept per bucket and merged on demand.
+
+    The summaries only keep the statistics, not the rows, and can be saved
+    without pickling.
+    """
+
+    def __init__(
+        self,
+        stats: WindowStats,
+        dates: pd.Series,
+        date_round: str,
+        sketch_k: int | None = None,
+    ):
+        """Summarize the rows of each bucket.
+
+        Args:
+            stats (WindowStats): Statistics of the rows, whose encoding of the
+                rows is reused
+            dates (pd.Series): Dates of the rows, sorted
+            date_round (str): Size of the buckets (e.g. '1 D')
+            sketch_k (int | None): Size of the quantile sketches, WINDOW_SKETCH_K
+                by default. No sketch is kept if 0.
+        """
+        self.date_round = date_round
+        self.sketch_k = WINDOW_SKETCH_K if sketch_k is None else sketch_k
+        self.bin_edges = stats.bin_edges
+        self.categories = stats.categories
+        self.reference_counts = stats.reference_counts
+        self.labels = stats.labels
+        self.hist_slices = stats._hist_slices
+        self.numerical = stats._numerical
+        self.shift = stats._shift
+        self.cat_slices = stats._cat_slices
+
+        # Missing dates are sorted first and belong to no bucket
+        first = int(dates.isna().sum())
+        buckets = pd.DatetimeIndex(dates.iloc[first:].dt.floor(date_round))
+        bucket_values = buckets.as_unit("ns").asi8
+        starts = (
+            np.flatnonzero(np.r_[True, bucket_values[1:] != bucket_values[:-1]])
+            if len(bucket_values)
+            else np.empty(0, dtype=np.int64)
+        )
+        #: Start date of each bucket, as int64 nanoseconds
+        self.bucket_dates = bucket_values[starts]
+        #: Positions of the rows of each bucket in the sorted frame
+        self.bucket_bounds = np.r_[starts + first, len(dates)]
+        n_buckets = len(starts)
+        bucket_ids = np.repeat(np.arange(n_buckets), np.diff(self.bucket_bounds))
+        rows = slice(first, len(dates))
+
+        def cumulative(per_bucket: np.ndarray) -> np.ndarray:
+            zeros = np.zeros((1, *per_bucket.shape[1:]), dtype=per_bucket.dtype)
+            return np.cumsum(np.concatenate([zeros, per_bucket]), axis=0)
+
+        def bucket_counts(codes: np.ndarray, size: int) -> np.ndarray:
+            codes = codes.reshape(len(bucket_ids), -1)
+            flat = (bucket_ids[:, None] * size + codes).ravel()
+            return cumulative(
+                np.bincount(flat, minlength=n_buckets * size).reshape(n_buckets, size)
+            )
+
+        def bucket_sums(values: np.ndarray) -> np.ndarray:
+            if not n_buckets:
+                return cumulative(np.zeros((0, values.shape[1])))
+            return cumulative(np.add.reduceat(values, starts, axis=0))
+
+        values = stats._values[rows]
+        missing = np.isnan(values)
+        centered = np.where(missing, 0.0, values - self.shift)
+        self.hist = bucket_counts(stats._bins[rows], stats._hist.size)
+        self.count = bucket_sums((~missing).astype(np.int64))
+        self.sum = bucket_sums(centered)
+        self.sum_sq = bucket_sums(centered * centered)
+        self.cross = np.zeros((n_buckets, stats._cross.size))
+        self.pairs_count = np.zeros((n_buckets, stats._cross.size), dtype=np.int64)
+        for b, part in enumerate(np.split(values, starts[1:]) if n_buckets else []):
+            self.cross[b], self.pairs_count[b] = cross_products(part, self.shift)
+        self.cross = cumulative(self.cross)
+        self.pairs_count = cumulative(self.pairs_count)
+        self.cat_counts = bucket_counts(stats._codes[rows], stats._cat_counts.size)
+        self.confusion = (
+            bucket_counts(stats._pairs[rows], stats.confusion.size)
+            if stats.confusion is not None
+            else None
+        )
+
+        self.sketches: dict[str, list[KLLSketch]] = {}
+        if self.sketch_k:
+            for name, j in self.numerical.items():
+                parts = np.split(values[:, j], starts[1:])
+                self.sketches[name] = [
+                    KLLSketch(self.sketch_k).update(part) for part in parts
+                ]
+
+    def is_aligned(self, start: pd.Timestamp, end: pd.Timestamp) -> bool:
+        """Whether a window is made of whole buckets."""
+        return _is_aligned(start, end, self.date_round)
+
+    def window(self, start: pd.Timestamp, end: pd.Timestamp) -> WindowSummary:
+        """Statistics of the rows dated from ``start`` (included) to ``end``.
+
+        Args:
+            start (pd.Timestamp): Start of the window, on a bucket boundary
+            end (pd.Timestamp): End of the window, on a bucket boundary
+
+        Returns:
+            WindowSummary: The statistics of the window
+
+        Raises:
+            ValueError: If the window is not made of whole buckets
+        """
+        if not self.is_aligned(start, end):
+            raise ValueError(
+                f"Window {start} - {end} is not made of {self.date_round} buckets"
+            )
+        first, last = np.searchsorted(
+            self.bucket_dates,
+            [start.as_unit("ns").value, end.as_unit("ns").value],
+            side="left",
+        )
+        return WindowSummary(self, int(first), int(last))
+
+    def save(self, path: str) -> None:
+        """Save the summaries in an ``.npz`` file.
+
+        Raises:
+            TypeError: If the categories cannot be saved as JSON
+        """
+        numerical = list(self.numerical)
+        header = {
+            "version": SUMMARY_VERSION,
+            "date_round": self.date_round,
+            "sketch_k": self.sketch_k,
+            "numerical": numerical,
+            "hist_slices": {
+                name: [s.start, s.stop] for name, s in self.hist_slices.items()
+            },
+            "cat_slices": {
+                name: [s.start, s.stop] for name, s in self.cat_slices.items()
+            },
+            "categories": {
+                name: index.tolist() for name, index in self.categories.items()
+            },
+            "sketched": list(self.sketches),
+        }
+        arrays = {
+            "header": np.frombuffer(
+                json.dumps(header, allow_nan=False).encode(), dtype=np.uint8
+            ),
+            **{name: getattr(self, name) for name in SUMMARY_ARRAYS},
+        }
+        for name in ("labels", "confusion"):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        for j, name in enumerate(numerical):
+            arrays[f"bin_edges_{j}"] = self.bin_edges[name]
+        for j, name in enumerate(header["categories"]):
+            arrays[f"reference_counts_{j}"] = self.reference_counts[name]
+        for j, name in enumerate(header["sketched"]):
+            sketches = self.sketches[name]
+            n_levels = max((len(sketch.levels) for sketch in sketches), default=0)
+            sizes = np.zeros((len(sketches), n_levels), dtype=np.int64)
+            for b, sketch in enumerate(sketches):
+                sizes[b, : len(sketch.levels)] = [len(i) for i in sketch.levels]
+            arrays[f"sketch_sizes_{j}"] = sizes
+            arrays[f"sketch_n_{j}"] = np.array([sk.n for sk in sketches], np.int64)
+            arrays[f"sketch_levels_{j}"] = np.array(
+                [len(sketch.levels) for sketch in sketches], np.int64
+            )
+            arrays[f"sketch_items_{j}"] = np.concatenate(
+                [items for sketch in sketches for items in sketch.levels]
+                or [np.empty(0)]
+            )
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "BucketSummaries":
+        """Load summaries saved by ``save``.
+
+        Raises:
+            ValueError: If the summaries have another format version
+        """
+        with np.load(path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        header = json.loads(arrays["header"].tobytes())
+        if header.get("version") != SUMMARY_VERSION:
+            raise ValueError(f"Summary version {header.get('version')} not supported")
+
+        summaries = cls.__new__(cls)
+        summaries.date_round = header["date_round"]
+        summaries.sketch_k = header["sketch_k"]
+        numerical = header["numerical"]
+        summaries.numerical = {name: j for j, name in enumerate(numerical)}
+        summaries.hist_slices = {
+            name: slice(*bounds) for name, bounds in header["hist_slices"].items()
+        }
+        summaries.cat_slices = {
+            name: slice(*bounds) for name, bounds in header["cat_slices"].items()
+        }
+        summaries.categories = {
+            name: pd.Index(values, dtype=object)
+            for name, values in header["categories"].items()
+        }
+        for name in SUMMARY_ARRAYS:
+            setattr(summaries, name, arrays[name])
+        summaries.labels = arrays.get("labels")
+        summaries.confusion = arrays.get("confusion")
+        summaries.bin_edges = {
+            name: arrays[f"bin_edges_{j}"] for j, name in enumerate(numerical)
+        }
+        summaries.reference_counts = {
+            name: arrays[f"reference_counts_{j}"]
+            for j, name in enumerate(header["categories"])
+        }
+        summaries.sketches = {}
+        for j, name in enumerate(header["sketched"]):
+            sizes = arrays[f"sketch_sizes_{j}"]
+            parts = np.split(arrays[f"sketch_items_{j}"], np.cumsum(sizes)[:-1])
+            sketches = []
+            levels = zip(arrays[f"sketch_n_{j}"], arrays[f"sketch_levels_{j}"])
+            for b, (n, n_levels) in enumerate(levels):
+                sketch = KLLSketch(summaries.sketch_k)
+                sketch.n = int(n)
+                first = b * sizes.shape[1]
+                sketch.levels = parts[first : first + n_levels]
+                sketches.append(sketch)
+            summaries.sketches[name] = sketches
+        return summaries
+
+
+# Version of the summary format, part of the cache key of the summaries
+SUMMARY_VERSION = 4
+# Statistics of the summaries saved as arrays of the same name
+SUMMARY_ARRAYS = (
+    "bucket_dates",
+    "bucket_bounds",
+    "shift",
+    "hist",
+    "count",
+    "sum",
+    "sum_sq",
+    "cross",
+    "pairs_count",
+    "cat_counts",
+)
+
+summary_cache = DiskCache(f"{CACHE_DIR}/summary_cache", CACHE_MAX_BYTES)
+
+
+def _summaries_key(
+    datashape: DataShape,
+    iterator: DateIterator,
+    version: str | None,
+    reference: pd.DataFrame | None,
+    n_bins: int,
+    sketch_k: int,
+    profile: ReferenceProfile | None = None,
+) -> str:
+    digest = hashlib.sha256()
+    digest.update(datashape.model_dump_json().encode())
+    digest.update(
+        f"{SUMMARY_VERSION}|{iterator.date_round}|{n_bins}|{sketch_k}".encode()
+    )
+    if profile is not None:
+        digest.update(f"profile|{profile.content_hash}".encode())
+    # Frames without a version are identified by their content
+    columns = datashape.column_names()
+    if version is not None:
+        digest.update(f"version|{version}".encode())
+    else:
+        hashes = pd.util.hash_pandas_object(iterator.df[columns], index=False)
+        digest.update(hashes.to_numpy().tobytes())
+    if reference is not None:
+        hashes = pd.util.hash_pandas_object(reference[columns], index=False)
+        digest.update(hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _cached_summaries(
+    datashape: DataShape,
+    iterator: DateIterator,
+    version: str | None,
+    reference: pd.DataFrame | None,
+    profile: ReferenceProfile | None = None,
+) -> BucketSummaries:
+    key = _summaries_key(
+        datashape,
+        iterator,
+        version,
+        reference,
+        WINDOW_STATS_BINS,
+        WINDOW_SKETCH_K,
+        profile,
+    )
+    with summary_cache.lock(key):
+        entry = summary_cache.get(key)
+        if entry is not None:
+            try:
+                summaries = BucketSummaries.load(entry.path)
+                summary_cache.touch(entry)
+                return summaries
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                pass
+
+        stats = WindowStats(
+            datashape, iterator.df, reference=reference, profile=profile
+        )
+        summaries = BucketSummaries(
+            stats, iterator.df[iterator.date_feature], iterator.date_round
+        )
+        try:
+            with summary_cache.temp_file(".npz") as tmp_path:
+                summaries.save(tmp_path)
+                summary_cache.put(key, tmp_path, ".npz", etag=key, last_modified=None)
+        except (OSError, TypeError, ValueError):
+            pass
+        return summaries
+
+
+def iter_window_stats(
+    datashape: DataShape,
+    iterator: DateIterator,
+    reference: pd.DataFrame | None = None,
+    y_pred: np.ndarray | None = None,
+    profile: ReferenceProfile | None = None,
+    version: str | None = None,
+    confusion_only: bool = False,
+) -> Iterator[_Statistics]:
+    """Statistics of each window of a date iterator.
+
+    When every window is made of whole ``date_round`` buckets, the windows are
+    assembled from bucket summaries. Summaries without predictions are cached on
+    disk. Otherwise, the statistics are updated incrementally from one window to
+    the next.
+
+    Args:
+        datashape (DataShape): Datashape of the project
+        iterator (DateIterator): Iterator over the windows, which does not need
+            to be consumed
+        reference (pd.DataFrame | None): Reference data
+        y_pred (np.ndarray | None): Predicted class index of each row of
+            ``iterator.df``
+        profile (ReferenceProfile | None): Profile of the reference data, read
+            instead of ``reference``
+        version (str | None): Version of the evaluated dataset, which identifies
+            its cached summaries. Its rows are hashed instead if None.
+        confusion_only (bool): Only keep the confusion matrix of ``y_pred``,
+            without the statistics of the features
+
+    Returns:
+        Iterator: The statistics of each window of ``iterator.batches``
+    """
+    aligned = bool(iterator.date_round) and all(
+        _is_aligned(start, end, iterator.date_round) for start, end in iterator.batches
+    )
+    if not aligned:
+        stats = WindowStats(
+            datashape,
+            iterator.df,
+            reference=reference,
+            y_pred=y_pred,
+            profile=profile,
+            confusion_only=confusion_only,
+        )
+        for lo, hi in iterator.bounds:
+            yield stats.move(lo, hi)
+        return
+
+    if y_pred is None:
+        summaries = _cached_summaries(datashape, iterator, version, reference, profile)
+    else:
+        stats = WindowStats(
+            datashape,
+            iterator.df,
+            reference=reference,
+            y_pred=y_pred,
+            profile=profile,
+            confusion_only=confusion_only,
+        )
+        summaries = BucketSummaries(
+            stats, iterator.df[iterator.date_feature], iterator.date_round
+        )
+    for start, end in iterator.batches:
+        yield summaries.window(start, end)
@@ -31,10 +31,15 @@ start_server() {
     exec uvicorn a4s_eval.main:app --host 0.0.0.0 --port 8001
 }
 
+# Celery pool and number of concurrent tasks. Windows of a task can also be
+# evaluated in parallel with WINDOW_WORKERS, with any pool.
+CELERY_POOL="${CELERY_POOL:-prefork}"
+CELERY_CONCURRENCY="${CELERY_CONCURRENCY:-1}"
+
 # Function to start Celery worker
 start_worker() {
     echo "Starting Celery worker..."
-    exec celery -A a4s_eval.celery_worker worker --loglevel=info --concurrency=1 --hostname=worker@%h
+    exec celery -A a4s_eval.celery_worker worker --loglevel=info --pool="$CELERY_POOL" --concurrency="$CELERY_CONCURRENCY" --hostname=worker@%h
 }
 
 # Function to start both server and worker
@@ -43,7 +48,7 @@ start_combined() {
     
     # Start Celery worker in background
     echo "Starting Celery worker in background..."
-    celery -A a4s_eval.celery_worker worker --loglevel=info --concurrency=1 --hostname=worker@%h &
+    celery -A a4s_eval.celery_worker worker --loglevel=info --pool="$CELERY_POOL" --concurrency="$CELERY_CONCURRENCY" --hostname=worker@%h &
     
     # Wait a moment for worker to start
     sleep 5
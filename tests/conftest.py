@@ -1,7 +1,10 @@
+import uuid
+
 import numpy as np
 import pandas as pd
 import pytest
 
+from a4s_eval.data_model.evaluation import DataShape, Feature, FeatureType
 
 DATE_FEATURE = "issue_d"
 N_SAMPLES: int | None = 1000
@@ -45,3 +48,68 @@ def tab_class_train_data(tab_class_dataset: pd.DataFrame) -> pd.DataFrame:
 @pytest.fixture(scope="session")
 def tab_class_test_data(tab_class_dataset: pd.DataFrame) -> pd.DataFrame:
     return sample(get_splits(tab_class_dataset)[1])
+
+
+def make_feature(name: str, feature_type: FeatureType) -> Feature:
+    return Feature(
+        pid=uuid.uuid4(),
+        name=name,
+        feature_type=feature_type,
+        min_value=0,
+        max_value=0,
+    )
+
+
+def make_datashape(*features: tuple[str, FeatureType]) -> DataShape:
+    """Datashape of the given features, with the target "y" and the date "date"."""
+    return DataShape(
+        features=[make_feature(name, feature_type) for name, feature_type in features],
+        target=make_feature("y", FeatureType.INTEGER),
+        date=make_feature("date", FeatureType.DATE),
+    )
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(("x", FeatureType.FLOAT), ("color", FeatureType.CATEGORICAL))
+
+
+def make_frame(
+    n: int,
+    seed: int,
+    shift: float = 0.0,
+    colors: list | None = None,
+    missing: float = 0.0,
+    correlation: float | None = None,
+    periods: int = 10,
+    unit: str = "D",
+) -> pd.DataFrame:
+    """Random rows of the features of the test datashapes.
+
+    Args:
+        n: Number of rows
+        seed: Seed of the values
+        shift: Mean of "x"
+        colors: Values of "color", red, green and blue by default
+        missing: Fraction of missing values of "x"
+        correlation: Correlation of "z" with "x", no "z" if None
+        periods: Number of dates, from 2024-01-01
+        unit: Unit of the periods between dates
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.normal(shift, size=n)
+    if missing:
+        x[rng.random(n) < missing] = np.nan
+    columns = {"x": x}
+    if correlation is not None:
+        noise = rng.normal(size=n)
+        columns["z"] = correlation * x + np.sqrt(1 - correlation**2) * noise
+    columns["n"] = rng.integers(0, 10, n)
+    columns["color"] = rng.choice(
+        colors if colors is not None else ["red", "green", "blue"], n
+    )
+    columns["y"] = rng.integers(0, 2, n)
+    columns["date"] = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+        rng.integers(0, periods, n), unit=unit
+    )
+    return pd.DataFrame(columns)
@@ -0,0 +1,79 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics.correlation_metric import (
+    correlation_metric,
+    frame_correlation,
+)
+from a4s_eval.utils.window_stats import WindowStats
+from tests.conftest import make_datashape, make_frame
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("z", FeatureType.FLOAT),
+        ("n", FeatureType.INTEGER),
+        ("color", FeatureType.CATEGORICAL),
+    )
+
+
+def test_frame_correlation() -> None:
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(200, 3))
+    values[:, 2] = 5.0
+
+    correlation = frame_correlation(values)
+
+    np.testing.assert_allclose(correlation[:2, :2], np.corrcoef(values[:, :2].T))
+    assert np.isnan(correlation[2]).all()
+
+
+def test_correlation_metric(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(2000, 0, colors=["red", "green"], correlation=0.0),
+    )
+    data = make_frame(1000, 1, colors=["red", "green"], correlation=0.8)
+    evaluated = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+
+    measures = correlation_metric(datashape, reference, evaluated)
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        ("correlation_drift", None),
+        *[("correlation_change", f.pid) for f in datashape.features[:3]],
+    ]
+    drift, x, z, n = (m.score for m in measures)
+    expected = data[["x", "z", "n"]].corr() - reference.data[["x", "z", "n"]].corr()
+    assert drift == pytest.approx(np.sqrt((expected.to_numpy() ** 2).sum()))
+    # The changed pair is the pair of the two largest changes
+    assert x == z == pytest.approx(abs(expected.loc["x", "z"]))
+    assert x > 0.7
+    assert n < 0.2
+
+    stats = WindowStats(datashape, data).move(0, len(data))
+    with_stats = correlation_metric(
+        datashape, reference, evaluated.model_copy(update={"stats": stats})
+    )
+    assert [m.score for m in with_stats] == pytest.approx([drift, x, z, n])
+
+
+def test_correlation_metric_without_pairs(datashape: DataShape) -> None:
+    datashape.features = datashape.features[:1]
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(50, 0, colors=["red", "green"], correlation=0),
+    )
+    evaluated = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(50, 1, colors=["red", "green"], correlation=0),
+    )
+
+    assert correlation_metric(datashape, reference, evaluated) == []
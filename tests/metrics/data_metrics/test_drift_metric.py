@@ -7,7 +7,10 @@ import pytest
 from a4s_eval.data_model.evaluation import Dataset, DataShape
 from a4s_eval.metrics.data_metrics.drift_metric import (
     data_drift_metric,
+    numerical_drift_test,
+    numerical_drift_tests,
 )
+from a4s_eval.utils.reference_profile import ReferenceProfile
 
 
 @pytest.fixture
@@ -66,3 +69,45 @@ def test_data_drift_metric_metrics_not_nan(
 ):
     metrics = data_drift_metric(data_shape, ref_dataset, test_dataset)
     assert all(not np.isnan(metric.score) for metric in metrics)
+
+
+def test_numerical_drift_tests_match_per_feature_tests():
+    rng = np.random.default_rng(0)
+    reference = pd.DataFrame(
+        {
+            "normal": rng.normal(size=500),
+            "ties": rng.integers(0, 5, 500),
+            "missing": np.where(rng.random(500) < 0.1, np.nan, rng.random(500)),
+        }
+    )
+    window = pd.DataFrame(
+        {
+            "normal": rng.normal(0.5, 2, size=80),
+            "ties": rng.integers(2, 8, 80),
+            "missing": rng.random(80),
+        }
+    )
+    names = list(reference.columns)
+    datashape = DataShape.model_validate(
+        {
+            "features": [
+                {
+                    "pid": uuid.uuid4(),
+                    "name": name,
+                    "feature_type": "float",
+                    "min_value": 0,
+                    "max_value": 0,
+                }
+                for name in names
+            ]
+        }
+    )
+
+    distances = numerical_drift_tests(
+        ReferenceProfile.build(datashape, reference),
+        window[names].to_numpy(dtype=float),
+    )
+
+    expected = [numerical_drift_test(reference[name], window[name]) for name in names]
+    np.testing.assert_allclose(distances, expected, rtol=1e-10, equal_nan=True)
+    assert np.isnan(distances[2])
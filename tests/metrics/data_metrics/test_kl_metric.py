@@ -1,16 +1,37 @@
 # importing the necessary libararies
+import uuid
+
+import numpy as np
 import pandas as pd
+import pytest
 import seaborn as sns
-from a4s_eval.metrics.data_metrics.kl_metric import compute_kl_for_column
+from scipy.spatial.distance import jensenshannon
+from scipy.stats import entropy
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics.kl_metric import (
+    DIVERGENCES,
+    EPS,
+    compute_kl_for_column,
+    divergence_metric,
+    divergences,
+    kl_categorical,
+    sketch_divergence_metric,
+)
+from a4s_eval.utils.reference_profile import ReferenceProfile
+from a4s_eval.utils.sketches import FrameSketch
+from a4s_eval.utils.window_stats import WindowStats
+from tests.conftest import make_datashape, make_frame
 
 
-#load the titanic datasets
+# load the titanic datasets
 def load_titanic():
     try:
         return pd.read_csv("data/titanic.csv")
     except:
         return sns.load_dataset("titanic")
-    
+
+
 # Test KL divergence on the first available Titanic column and store the value
 def test_kl_is_non_negative():
     df = load_titanic()
@@ -26,4 +47,104 @@ def test_kl_is_non_negative():
     assert kl_value >= 0
 
 
+def test_kl_categorical_compares_values_as_strings():
+    ref = pd.Series([1, "1", np.nan, "a", 2.5, None], dtype=object)
+    cur = pd.Series(["1", 1, "b", "2.5", np.nan], dtype=object)
+
+    expected = kl_categorical(
+        pd.Series(["1", "1", "a", "2.5"]), pd.Series(["1", "1", "b", "2.5"])
+    )
+
+    assert kl_categorical(ref, cur) == pytest.approx(expected)
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("n", FeatureType.INTEGER),
+        ("color", FeatureType.CATEGORICAL),
+    )
+
+
+def test_divergences_match_scipy():
+    rng = np.random.default_rng(0)
+    p_counts = rng.integers(0, 50, (4, 12))
+    q_counts = rng.integers(0, 50, (4, 12))
+    q_counts[1, 3] = 0
+
+    results = divergences(p_counts, q_counts)
+
+    for i in range(4):
+        p = (p_counts[i] + EPS) / (p_counts[i] + EPS).sum()
+        q = (q_counts[i] + EPS) / (q_counts[i] + EPS).sum()
+        assert results["kl_divergence"][i] == pytest.approx(entropy(p, q))
+        assert results["symmetric_kl_divergence"][i] == pytest.approx(
+            entropy(p, q) + entropy(q, p)
+        )
+        assert results["js_divergence"][i] == pytest.approx(jensenshannon(p, q) ** 2)
+        assert results["hellinger_distance"][i] == pytest.approx(
+            np.sqrt(0.5 * ((np.sqrt(p) - np.sqrt(q)) ** 2).sum())
+        )
+
+
+def test_padded_rows_match_unpadded_rows():
+    p, q = np.array([3, 0, 5]), np.array([1, 4, 4])
+    padded = divergences(
+        np.array([[3, 0, 5, 0, 0]]),
+        np.array([[1, 4, 4, 0, 0]]),
+        mask=np.array([[True, True, True, False, False]]),
+    )
+    expected = divergences(p[None], q[None])
+
+    for name in DIVERGENCES:
+        assert padded[name][0] == pytest.approx(expected[name][0])
+
+
+def test_divergence_metric_from_window_stats(datashape: DataShape):
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(300, 0, 0.0, ["red", "green", None], missing=0.05),
+    )
+    data = make_frame(100, 1, 0.5, ["red", "blue"], missing=0.05)
+    evaluated = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+
+    measures = divergence_metric(datashape, reference, evaluated)
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        (name, feature.pid) for feature in datashape.features for name in DIVERGENCES
+    ]
+    assert all(np.isfinite(m.score) and m.score >= 0 for m in measures)
+    assert measures[0].time == data["date"].max().to_pydatetime()
+
+    # Same measures from the statistics kept by the evaluation tasks
+    profile = ReferenceProfile.build(datashape, reference.data)
+    stats = WindowStats(datashape, data, profile=profile).move(0, len(data))
+    with_stats = divergence_metric(
+        datashape, reference, evaluated.model_copy(update={"stats": stats})
+    )
+    assert [m.score for m in with_stats] == pytest.approx([m.score for m in measures])
+
+
+def test_sketch_divergences_are_exact_on_small_data(datashape: DataShape):
+    reference = make_frame(150, 0, 0.0, ["red", "green"], missing=0.05)
+    data = make_frame(100, 1, 0.5, ["red", "blue"], missing=0.05)
+    expected = divergence_metric(
+        datashape,
+        Dataset(pid=uuid.uuid4(), shape=datashape, data=reference),
+        Dataset(pid=uuid.uuid4(), shape=datashape, data=data),
+    )
+
+    measures = sketch_divergence_metric(
+        datashape,
+        datashape,
+        FrameSketch(datashape).update(reference),
+        FrameSketch(datashape).update(data),
+        data["date"].max(),
+    )
 
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        (m.name, m.feature_pid) for m in expected
+    ]
+    assert [m.score for m in measures] == pytest.approx([m.score for m in expected])
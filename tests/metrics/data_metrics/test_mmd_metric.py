@@ -0,0 +1,87 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics import mmd_metric as metric
+from a4s_eval.metrics.data_metrics.mmd_metric import mmd_metric, reference_features
+from a4s_eval.utils import mmd
+from a4s_eval.utils.mmd import RandomFourierFeatures
+from a4s_eval.utils.reference_profile import ReferenceProfile
+from tests.conftest import make_datashape, make_frame
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("z", FeatureType.FLOAT),
+        ("color", FeatureType.CATEGORICAL),
+    )
+
+
+def test_mmd_detects_a_correlation_shift(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(3000, 0, colors=["red", "green"], correlation=0.0),
+    )
+    same = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(1000, 1, colors=["red", "green"], correlation=0.0),
+    )
+    # Same marginals, correlated features
+    shifted = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(1000, 1, colors=["red", "green"], correlation=0.8),
+    )
+
+    same_measures = mmd_metric(datashape, reference, same)
+    shifted_measures = mmd_metric(datashape, reference, shifted)
+
+    assert [m.name for m in shifted_measures] == ["mmd", "mmd_p_value"]
+    assert shifted_measures[0].score > same_measures[0].score
+    assert shifted_measures[1].score < 0.01
+    assert same_measures[1].score > 0.05
+
+
+def test_reference_features_are_computed_once(datashape: DataShape) -> None:
+    data = make_frame(500, 0, colors=["red", "green"], correlation=0.0)
+    reference = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+    profile = ReferenceProfile.build(datashape, data)
+
+    features = reference_features(profile, reference)
+
+    assert reference_features(profile, reference) is features
+    assert features.features.shape == (500, mmd.MMD_FEATURES)
+
+
+def test_large_window_is_subsampled(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(2000, 0, colors=["red", "green"], correlation=0.0),
+    )
+    evaluated = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(5000, 1, colors=["red", "green"], correlation=0.8),
+    )
+
+    with (
+        patch.object(mmd, "MMD_MAX_ROWS", 1000),
+        patch.object(metric, "MMD_PERMUTATIONS", 0),
+        patch.object(
+            RandomFourierFeatures,
+            "transform",
+            autospec=True,
+            side_effect=RandomFourierFeatures.transform,
+        ) as transform,
+    ):
+        measures = mmd_metric(datashape, reference, evaluated)
+
+    assert [m.name for m in measures] == ["mmd"]
+    assert [len(call.args[1]) for call in transform.call_args_list] == [1000, 1000]
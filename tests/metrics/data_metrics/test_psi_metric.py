@@ -0,0 +1,96 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics.psi_metric import (
+    population_stability_index,
+    psi_metric,
+    quantile_bin_counts,
+)
+from a4s_eval.utils.reference_profile import ReferenceProfile
+from a4s_eval.utils.window_stats import WindowStats
+from tests.conftest import make_datashape, make_frame
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("n", FeatureType.INTEGER),
+        ("color", FeatureType.CATEGORICAL),
+    )
+
+
+def test_reference_quantile_bins(datashape: DataShape) -> None:
+    reference = make_frame(1000, 0, 0.0, ["red"], missing=0.05)
+    profile = ReferenceProfile.build(datashape, reference)
+
+    edges, counts = profile.quantile_bins(10)
+
+    assert edges.shape == (2, 9)
+    x = reference["x"]
+    # Bins of continuous values hold the same share of the reference
+    assert counts[0, :10].tolist() == pytest.approx([x.count() / 10] * 10, abs=2)
+    assert counts[0, 10] == x.isna().sum()
+    for j, name in enumerate(["x", "n"]):
+        values = reference[name].dropna().to_numpy(float)
+        bins = np.searchsorted(edges[j], values, side="right")
+        assert counts[j, :10].tolist() == np.bincount(bins, minlength=10).tolist()
+    assert profile.quantile_bins(10)[0] is edges
+
+
+def test_bin_counts_of_all_features_at_once() -> None:
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(500, 3))
+    values[::7, 1] = np.nan
+    edges = np.sort(rng.normal(size=(3, 4)), axis=1)
+
+    counts = quantile_bin_counts(values, edges)
+
+    for j in range(3):
+        column = values[:, j]
+        present = column[~np.isnan(column)]
+        bins = np.searchsorted(edges[j], present, side="right")
+        assert counts[j, :5].tolist() == np.bincount(bins, minlength=5).tolist()
+        assert counts[j, 5] == np.isnan(column).sum()
+
+
+def test_population_stability_index() -> None:
+    ref = np.array([[25, 25, 25, 25], [10, 20, 30, 40]])
+    new = np.array([[25, 25, 25, 25], [40, 30, 20, 10]])
+
+    psi = population_stability_index(ref, new)
+
+    assert psi[0] == pytest.approx(0.0)
+    p, q = ref[1] / 100, new[1] / 100
+    assert psi[1] == pytest.approx(((q - p) * np.log(q / p)).sum())
+
+
+def test_psi_metric(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(2000, 0, 0.0, ["red", "green", None], missing=0.05),
+    )
+    data = make_frame(500, 1, 1.0, ["red", "blue"], missing=0.05)
+    evaluated = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+
+    measures = psi_metric(datashape, reference, evaluated)
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        ("psi", feature.pid) for feature in datashape.features
+    ]
+    scores = [m.score for m in measures]
+    # Shifted feature and new categories drift, "n" has the same distribution
+    assert scores[0] > 0.25
+    assert scores[1] < 0.1
+    assert scores[2] > 0.25
+
+    profile = ReferenceProfile.build(datashape, reference.data)
+    stats = WindowStats(datashape, data, profile=profile).move(0, len(data))
+    with_stats = psi_metric(
+        datashape, reference, evaluated.model_copy(update={"stats": stats})
+    )
+    assert [m.score for m in with_stats] == pytest.approx(scores)
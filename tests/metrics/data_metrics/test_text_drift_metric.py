@@ -0,0 +1,85 @@
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics import text_drift_metric as text_drift
+from a4s_eval.metrics.data_metrics.drift_metric import data_drift_metric
+from a4s_eval.metrics.data_metrics.text_drift_metric import text_drift_metric
+from a4s_eval.utils import window_context
+from tests.conftest import make_datashape, make_frame
+
+WORDS = ["payment", "refund", "delivery", "late", "order", "thanks", "account"]
+OTHER_WORDS = ["password", "reset", "login", "locked", "email", "code", "account"]
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("comment", FeatureType.TEXT),
+    )
+
+
+def make_texts(n: int, seed: int, words: list[str]) -> pd.DataFrame:
+    df = make_frame(n, seed)
+    rng = np.random.default_rng(seed)
+    df["comment"] = [" ".join(rng.choice(words, 5)) for _ in range(n)]
+    return df
+
+
+def test_text_drift_metric(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(), shape=datashape, data=make_texts(1000, 10, WORDS)
+    )
+    same = Dataset(pid=uuid.uuid4(), shape=datashape, data=make_texts(300, 1, WORDS))
+    shifted = Dataset(
+        pid=uuid.uuid4(), shape=datashape, data=make_texts(300, 2, OTHER_WORDS)
+    )
+
+    with patch.object(
+        text_drift, "embed_text", wraps=text_drift.embed_text
+    ) as embed_reference:
+        same_measures = text_drift_metric(datashape, reference, same)
+        shifted_measures = text_drift_metric(datashape, reference, shifted)
+
+    assert [(m.name, m.feature_pid) for m in shifted_measures] == [
+        ("text_mmd", datashape.features[1].pid),
+        ("text_mmd_p_value", datashape.features[1].pid),
+    ]
+    assert shifted_measures[0].score > 10 * same_measures[0].score
+    assert shifted_measures[1].score < 0.01
+    assert same_measures[1].score > 0.05
+    # The reference texts are embedded once
+    assert embed_reference.call_count == 1
+
+
+def test_window_texts_are_embedded_once(datashape: DataShape) -> None:
+    data = make_texts(100, 0, WORDS)
+    context = window_context.WindowContext(datashape, data)
+
+    with patch.object(
+        window_context, "embed_text", wraps=window_context.embed_text
+    ) as embed:
+        first = context.text_embedding("comment")
+        assert context.text_embedding("comment") is first
+
+    assert embed.call_count == 1
+
+
+def test_data_drift_skips_text_features(datashape: DataShape) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(), shape=datashape, data=make_texts(200, 0, WORDS)
+    )
+    evaluated = Dataset(
+        pid=uuid.uuid4(), shape=datashape, data=make_texts(100, 1, WORDS)
+    )
+
+    measures = data_drift_metric(datashape, reference, evaluated)
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        ("wasserstein_distance", datashape.features[0].pid)
+    ]
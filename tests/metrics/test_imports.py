@@ -0,0 +1,26 @@
+import pkgutil
+import subprocess
+import sys
+
+import pytest
+
+import a4s_eval.metrics
+
+MODULES = [
+    module.name
+    for module in pkgutil.walk_packages(
+        a4s_eval.metrics.__path__, f"{a4s_eval.metrics.__name__}."
+    )
+    if not module.ispkg
+]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_metric_module_imports_alone(module: str) -> None:
+    # A fresh interpreter, so the modules already imported by the other tests
+    # do not hide an import cycle
+    result = subprocess.run(
+        [sys.executable, "-c", f"import {module}"], capture_output=True, text=True
+    )
+
+    assert result.returncode == 0, result.stderr
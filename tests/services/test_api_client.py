@@ -1,10 +1,30 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import pathlib
 import uuid
-from unittest.mock import MagicMock, Mock, patch
+from datetime import datetime
+from unittest.mock import Mock, patch
 
 import pandas as pd
 import pytest
+import requests
 
-from a4s_eval.service.api_client import get_dataset_data, get_evaluation
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.data_model.measure import Measure, measures_to_json
+from a4s_eval.service import api_client, http_client
+from a4s_eval.service.api_client import (
+    MeasureUploadError,
+    claim_evaluations,
+    get_dataset_columns,
+    get_dataset_data,
+    get_evaluation,
+    load_dataset_columns,
+    post_measures,
+)
+from a4s_eval.utils.cache import DiskCache
 
 TEST_UUIDS = {
     "project": uuid.UUID("afb49e3f-813d-8888-9919-ee179d1090e6"),
@@ -57,27 +77,403 @@ def test_get_evaluation(mock_evaluation_data: dict[str, any]) -> None:
     mock_response = Mock()
     mock_response.status_code = 200
     mock_response.json.return_value = mock_evaluation_data
-    with patch("requests.get", return_value=mock_response):
+    with patch("requests.Session.request", return_value=mock_response):
         evaluation = get_evaluation(TEST_UUIDS["evaluation"])
 
         # Now evaluation should be an EvaluationDto object built from mock_response
         assert evaluation.pid == TEST_UUIDS["evaluation"]
 
 
+def make_stream_response(body: bytes, headers: dict[str, str]) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers.update(headers)
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
 def test_get_dataset() -> None:
     with open("./tests/data/lcld_v2_train_800.csv", "r") as f:
         csv_data = f.read()
 
-    # Prepare mock response
-    mock_resp = MagicMock()
-    mock_resp.headers = {"Content-Type": "text/csv"}
-    mock_resp.status_code = 200
-    mock_resp.content = csv_data.encode("utf-8")
-    # mock_resp.raise_for_status = MagicMock()
-
-    # Set the mock return value
-    # mock_get.return_value = mock_resp
-    with patch("requests.get", return_value=mock_resp):
+    mock_resp = make_stream_response(
+        csv_data.encode("utf-8"), {"Content-Type": "text/csv"}
+    )
+    with patch("requests.Session.request", return_value=mock_resp):
         df = get_dataset_data(TEST_UUIDS["train_dataset"])
 
         assert len(df) == 800
+
+
+@pytest.fixture
+def small_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "amount": [1.5, 2.0, None, 4.25],
+            "count": [1, 2, 3, 4],
+            "grade": ["A", "B", "A", "C"],
+            "issue_d": ["2013-01-01", "2013-01-02", "2013-02-01", "2013-03-01"],
+        }
+    )
+
+
+def test_get_dataset_gzip_csv(small_frame: pd.DataFrame) -> None:
+    body = gzip.compress(small_frame.to_csv(index=False).encode("utf-8"))
+    mock_resp = make_stream_response(
+        body, {"Content-Type": "text/csv", "Content-Encoding": "gzip"}
+    )
+    with patch("requests.Session.request", return_value=mock_resp):
+        df = get_dataset_data(TEST_UUIDS["train_dataset"])
+
+    pd.testing.assert_frame_equal(df, small_frame)
+
+
+def test_get_dataset_parquet(small_frame: pd.DataFrame) -> None:
+    buffer = io.BytesIO()
+    small_frame.to_parquet(buffer)
+    mock_resp = make_stream_response(
+        buffer.getvalue(), {"Content-Type": "application/vnd.apache.parquet"}
+    )
+    with patch("requests.Session.request", return_value=mock_resp):
+        df = get_dataset_data(TEST_UUIDS["train_dataset"])
+
+    pd.testing.assert_frame_equal(df, small_frame)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_get_dataset_columns_projection(small_frame: pd.DataFrame, fmt: str) -> None:
+    buffer = io.BytesIO()
+    if fmt == "csv":
+        small_frame.to_csv(buffer, index=False)
+    else:
+        small_frame.to_parquet(buffer)
+    mock_resp = make_stream_response(buffer.getvalue(), {"Content-Type": f"x/{fmt}"})
+    datashape = DataShape.model_validate(
+        {
+            "features": [
+                {
+                    "pid": uuid.uuid4(),
+                    "name": "amount",
+                    "feature_type": "float",
+                    "min_value": 0,
+                    "max_value": 5,
+                }
+            ],
+            "date": {
+                "pid": uuid.uuid4(),
+                "name": "issue_d",
+                "feature_type": "date",
+                "min_value": 0,
+                "max_value": 0,
+            },
+        }
+    )
+    with patch("requests.Session.request", return_value=mock_resp):
+        df = get_dataset_columns(TEST_UUIDS["train_dataset"], datashape)
+
+    assert list(df.columns) == ["amount", "issue_d"]
+    pd.testing.assert_frame_equal(df, small_frame[["amount", "issue_d"]])
+
+
+def test_get_dataset_revalidates_cache(
+    small_frame: pd.DataFrame, tmp_path: pathlib.Path
+) -> None:
+    body = small_frame.to_csv(index=False).encode("utf-8")
+    first = make_stream_response(body, {"Content-Type": "text/csv", "ETag": '"v1"'})
+    not_modified = make_stream_response(b"", {})
+    not_modified.status_code = 304
+
+    cache = DiskCache(str(tmp_path), max_bytes=1 << 20)
+    with (
+        patch("a4s_eval.service.api_client.dataset_cache", cache),
+        patch(
+            "requests.Session.request", side_effect=[first, not_modified]
+        ) as mock_get,
+    ):
+        df_first = get_dataset_data(TEST_UUIDS["train_dataset"])
+        df_cached = get_dataset_data(TEST_UUIDS["train_dataset"], columns=["grade"])
+
+    assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+    pd.testing.assert_frame_equal(df_first, small_frame)
+    pd.testing.assert_frame_equal(df_cached, small_frame[["grade"]])
+
+
+def test_loaded_dataset_has_the_version_of_its_content(
+    small_frame: pd.DataFrame, tmp_path: pathlib.Path
+) -> None:
+    body = small_frame.to_csv(index=False).encode("utf-8")
+    responses = [
+        make_stream_response(body, {"Content-Type": "text/csv", "ETag": etag})
+        for etag in ('"v1"', '"v1"', '"v2"')
+    ]
+    datashape = Mock(column_names=Mock(return_value=["grade"]))
+
+    cache = DiskCache(str(tmp_path), max_bytes=1 << 20)
+    datasets = [
+        Dataset(pid=TEST_UUIDS["train_dataset"], shape=DataShape(features=[]))
+        for _ in responses
+    ]
+    with (
+        patch("a4s_eval.service.api_client.dataset_cache", cache),
+        patch("requests.Session.request", side_effect=responses),
+    ):
+        for dataset in datasets:
+            load_dataset_columns(dataset, datashape)
+
+    pd.testing.assert_frame_equal(datasets[0].data, small_frame[["grade"]])
+    assert datasets[0].version is not None
+    assert datasets[1].version == datasets[0].version
+    assert datasets[2].version != datasets[0].version
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    for key in ["a", "b", "c"]:
+        tmp = cache.new_file(".bin")
+        with open(tmp, "wb") as f:
+            f.write(b"12345")
+        cache.put(key, tmp, ".bin", etag=key, last_modified=None)
+        os.utime(cache.get(key).path, (0, {"a": 1, "b": 2, "c": 3}[key]))
+
+    cache.evict()
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.get("c") is not None
+
+
+def test_companion_files_are_removed_with_their_entry(
+    tmp_path: pathlib.Path,
+) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=12)
+
+    def put(key: str, etag: str) -> None:
+        with cache.temp_file(".bin") as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"12345")
+            entry = cache.put(key, tmp, ".bin", etag=etag, last_modified=None)
+        with open(cache.companion_path(entry, "derived"), "wb") as f:
+            f.write(b"12345")
+
+    put("a", "v1")
+    first = cache.get("a")
+    put("a", "v2")
+    assert not os.path.exists(cache.companion_path(first, "derived"))
+
+    # Companions count in the size of their entry
+    os.utime(cache.get("a").path, (0, 1))
+    second = cache.get("a")
+    put("b", "v1")
+    assert cache.get("a") is None
+    assert not os.path.exists(cache.companion_path(second, "derived"))
+    assert os.path.exists(cache.companion_path(cache.get("b"), "derived"))
+
+
+def test_failed_download_leaves_no_temporary_file(
+    small_frame: pd.DataFrame, tmp_path: pathlib.Path
+) -> None:
+    body = small_frame.to_csv(index=False).encode("utf-8")
+    resp = make_stream_response(body, {"Content-Type": "text/csv", "ETag": '"v1"'})
+
+    cache = DiskCache(str(tmp_path), max_bytes=1 << 20)
+    with (
+        patch("a4s_eval.service.api_client.dataset_cache", cache),
+        patch("requests.Session.request", return_value=resp),
+        patch(
+            "a4s_eval.service.api_client._write_dataset_file",
+            side_effect=OSError("disk full"),
+        ),
+        pytest.raises(OSError),
+    ):
+        get_dataset_data(TEST_UUIDS["train_dataset"])
+
+    assert not [p for p in os.listdir(tmp_path) if p.startswith(".tmp-")]
+
+
+def test_disk_cache_removes_stale_temporary_files(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=1 << 20)
+    stale, recent = cache.new_file(".bin"), cache.new_file(".bin")
+    os.utime(stale, (0, 0))
+
+    cache.evict()
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(recent)
+
+
+def test_disk_cache_skips_files_removed_meanwhile(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+
+    def put(key: str) -> None:
+        with cache.temp_file(".bin") as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"12345")
+            cache.put(key, tmp, ".bin", etag=key, last_modified=None)
+
+    put("a")
+    put("b")
+    get = cache.get
+
+    def get_then_replace(key: str):
+        # Entry replaced by another process, under its key lock only, right
+        # after it was looked up
+        entry = get(key)
+        if key == "a" and entry is not None:
+            os.remove(entry.path)
+        return entry
+
+    with patch.object(cache, "get", side_effect=get_then_replace):
+        put("c")
+    assert cache.get("c") is not None
+
+    entry = cache.get("b")
+    gone = str(tmp_path / "gone.bin")
+    with patch.object(cache, "_files", return_value=[entry.path, gone]):
+        assert cache._remove_if_unlocked("b")
+    assert cache.get("b") is None
+
+
+def test_claim_evaluations_concurrently() -> None:
+    pids = [uuid.uuid4() for _ in range(20)]
+    refused = set(pids[::3])
+
+    def claim(pid: uuid.UUID) -> bool:
+        return pid not in refused
+
+    with patch("a4s_eval.service.api_client.claim_evaluation", side_effect=claim):
+        claimed = claim_evaluations([str(pid) for pid in pids])
+
+    assert claimed == [pid for pid in pids if pid not in refused]
+
+
+def test_bulk_claim_falls_back_to_single_claims() -> None:
+    pids = [uuid.uuid4() for _ in range(3)]
+    unsupported = make_stream_response(b"", {})
+    unsupported.status_code = 404
+
+    with (
+        patch("a4s_eval.service.api_client.CLAIM_BULK", True),
+        patch("a4s_eval.service.api_client._bulk_claim_supported", True),
+        patch("requests.Session.request", return_value=unsupported),
+        patch(
+            "a4s_eval.service.api_client.claim_evaluation", return_value=True
+        ) as mock_claim,
+    ):
+        claimed = claim_evaluations(pids)
+
+    assert claimed == pids
+    assert mock_claim.call_count == 3
+
+
+@pytest.mark.parametrize(
+    "error", [requests.Timeout("timeout"), requests.HTTPError("500 Server Error")]
+)
+def test_failed_bulk_claim_is_not_claimed_again(error: Exception) -> None:
+    pids = [uuid.uuid4() for _ in range(3)]
+
+    with (
+        patch("a4s_eval.service.api_client.CLAIM_BULK", True),
+        patch("a4s_eval.service.api_client._bulk_claim_supported", True),
+        patch("a4s_eval.service.api_client.bulk_claim_evaluations", side_effect=error),
+        patch("a4s_eval.service.api_client.claim_evaluation") as mock_claim,
+    ):
+        claimed = claim_evaluations(pids)
+
+    assert claimed == []
+    assert mock_claim.call_count == 0
+
+
+@pytest.fixture
+def measures() -> list[Measure]:
+    feature_pid = uuid.uuid4()
+    return [
+        Measure(
+            name="wasserstein_distance",
+            score=i / 10,
+            time=datetime(2024, 1, 1 + i),
+            feature_pid=feature_pid if i % 2 else None,
+        )
+        for i in range(10)
+    ]
+
+
+def test_measures_to_json_matches_model_dump(measures: list[Measure]) -> None:
+    assert json.loads(measures_to_json(measures)) == [
+        json.loads(m.model_dump_json()) for m in measures
+    ]
+
+
+def make_status_response(status_code: int) -> requests.Response:
+    resp = make_stream_response(b"", {})
+    resp.status_code = status_code
+    return resp
+
+
+def test_post_measures_in_gzip_chunks(measures: list[Measure]) -> None:
+    with (
+        patch("a4s_eval.service.api_client.MEASURE_GZIP", True),
+        patch(
+            "requests.Session.request", return_value=make_status_response(201)
+        ) as mock_request,
+    ):
+        upload = post_measures(uuid.uuid4(), measures, batch_size=4)
+
+    assert (upload.n_measures, upload.n_chunks, upload.n_sent) == (10, 3, 3)
+    posted = []
+    for call in mock_request.call_args_list:
+        assert call.kwargs["headers"]["Content-Encoding"] == "gzip"
+        posted += json.loads(gzip.decompress(call.kwargs["data"]))
+    assert posted == json.loads(measures_to_json(measures))
+
+
+def test_post_measures_reports_refused_chunks(measures: list[Measure]) -> None:
+    statuses = iter([201, 500, 201])
+
+    with (
+        patch(
+            "requests.Session.request",
+            side_effect=lambda *a, **kw: make_status_response(next(statuses)),
+        ) as mock_request,
+        pytest.raises(MeasureUploadError) as exc_info,
+    ):
+        post_measures(uuid.uuid4(), measures, batch_size=4)
+
+    assert exc_info.value.failed_chunks == [1]
+    # Chunks are not idempotent by default, so the refused one is not resent
+    assert mock_request.call_count == 3
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_post_measures_resend_after_timeout_needs_dedup(
+    measures: list[Measure], monkeypatch: pytest.MonkeyPatch, dedup: bool
+) -> None:
+    monkeypatch.setattr(http_client.env, "HTTP_BACKOFF", 0.0)
+    monkeypatch.setattr(http_client.env, "HTTP_RETRIES", 2)
+    monkeypatch.setattr(api_client, "MEASURE_DEDUP", dedup)
+    responses = iter([requests.ReadTimeout("read timeout")])
+
+    def send(*args, **kwargs):
+        error = next(responses, None)
+        if error is not None:
+            raise error
+        return make_status_response(201)
+
+    with patch("requests.Session.request", side_effect=send) as mock_request:
+        if dedup:
+            upload = post_measures(uuid.uuid4(), measures, batch_size=4)
+            assert upload.n_sent == 3
+        else:
+            with pytest.raises(MeasureUploadError) as exc_info:
+                post_measures(uuid.uuid4(), measures, batch_size=4)
+            assert exc_info.value.failed_chunks == [0]
+
+    keys = [
+        call.kwargs["headers"]["Idempotency-Key"]
+        for call in mock_request.call_args_list
+    ]
+    first = hashlib.sha256(measures_to_json(measures[:4])).hexdigest()
+    # The timed out chunk is only resent, with the same key, if the API dedups
+    if dedup:
+        assert keys[:2] == [first, first] and len(keys) == 4
+    else:
+        assert keys[0] == first and len(keys) == 3
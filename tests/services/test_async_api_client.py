@@ -0,0 +1,67 @@
+import asyncio
+import io
+import uuid
+
+import httpx
+import pandas as pd
+import pytest
+
+from a4s_eval.service import async_api_client
+
+
+def make_client(transport: httpx.MockTransport) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=transport)
+
+
+@pytest.fixture
+def small_frame() -> pd.DataFrame:
+    return pd.DataFrame({"amount": [1.5, 2.0, 4.25], "grade": ["A", "B", "A"]})
+
+
+def test_get_dataset_data(
+    small_frame: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    buffer = io.BytesIO()
+    small_frame.to_parquet(buffer)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith("/data")
+        return httpx.Response(
+            200,
+            content=buffer.getvalue(),
+            headers={"Content-Type": "application/vnd.apache.parquet"},
+        )
+
+    async def run() -> pd.DataFrame:
+        monkeypatch.setattr(
+            async_api_client, "_client", make_client(httpx.MockTransport(handler))
+        )
+        try:
+            return await async_api_client.get_dataset_data(
+                uuid.uuid4(), columns=["grade"]
+            )
+        finally:
+            await async_api_client.aclose_async_client()
+
+    df = asyncio.run(run())
+    pd.testing.assert_frame_equal(df, small_frame[["grade"]])
+
+
+def test_idempotent_request_is_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(async_api_client.env, "HTTP_BACKOFF", 0.0)
+    statuses = iter([503, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={"features": []})
+
+    async def run() -> object:
+        monkeypatch.setattr(
+            async_api_client, "_client", make_client(httpx.MockTransport(handler))
+        )
+        try:
+            return await async_api_client.get_project_datashape(uuid.uuid4())
+        finally:
+            await async_api_client.aclose_async_client()
+
+    datashape = asyncio.run(run())
+    assert datashape.features == []
@@ -0,0 +1,133 @@
+import pathlib
+import uuid
+from unittest.mock import patch
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape
+from a4s_eval.service.evaluation_context import (
+    iter_context_data,
+    load_evaluation_context,
+    remove_evaluation_context,
+    save_evaluation_context,
+)
+
+EVALUATION_PID = uuid.uuid4()
+DATASET_PID = uuid.uuid4()
+REFERENCE_PID = uuid.uuid4()
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return DataShape.model_validate(
+        {
+            "features": [
+                {
+                    "pid": str(uuid.uuid4()),
+                    "name": "x",
+                    "feature_type": "float",
+                    "min_value": 0.0,
+                    "max_value": 1.0,
+                }
+            ],
+            "date": {
+                "pid": str(uuid.uuid4()),
+                "name": "date",
+                "feature_type": "date",
+                "min_value": 0,
+                "max_value": 0,
+            },
+        }
+    )
+
+
+@pytest.fixture
+def api(tmp_path: pathlib.Path, datashape: DataShape):
+    evaluation = {
+        "pid": str(EVALUATION_PID),
+        "dataset": {"pid": str(DATASET_PID), "shape": datashape.model_dump()},
+        "model": {
+            "pid": str(uuid.uuid4()),
+            "dataset": {"pid": str(REFERENCE_PID), "shape": datashape.model_dump()},
+        },
+        "project": {
+            "pid": str(uuid.uuid4()),
+            "name": "project",
+            "frequency": "1 D",
+            "window_size": "7 D",
+        },
+    }
+    frames = {
+        DATASET_PID: pd.DataFrame({"x": [0.1, 0.2], "date": ["2024-01-01"] * 2}),
+        REFERENCE_PID: pd.DataFrame({"x": [0.5], "date": ["2023-01-01"]}),
+    }
+
+    def load(dataset: Dataset, _) -> None:
+        dataset.data = frames[dataset.pid].copy()
+        dataset.version = f"version-{dataset.pid}"
+
+    module = "a4s_eval.service.evaluation_context"
+    with (
+        patch(f"{module}.CONTEXT_DIR", str(tmp_path)),
+        patch(f"{module}.get_evaluation_request", return_value=evaluation) as m_eval,
+        patch(f"{module}.get_project_datashape", return_value=datashape),
+        patch(f"{module}.load_dataset_columns", side_effect=load) as m_data,
+        patch(
+            f"{module}.open_dataset_columns",
+            side_effect=lambda pid, _: (
+                iter(pa.Table.from_pandas(frames[pid]).to_batches(max_chunksize=1)),
+                f"version-{pid}",
+            ),
+        ) as m_stream,
+    ):
+        yield frames, m_eval, m_data, m_stream
+
+
+def test_context_is_fetched_once(api) -> None:
+    frames, m_eval, m_data, m_stream = api
+    handle = save_evaluation_context(EVALUATION_PID)
+
+    for _ in range(2):
+        evaluation, datashape = load_evaluation_context(EVALUATION_PID, handle)
+        pd.testing.assert_frame_equal(evaluation.dataset.data, frames[DATASET_PID])
+        pd.testing.assert_frame_equal(
+            evaluation.model.dataset.data, frames[REFERENCE_PID]
+        )
+        assert datashape.date.name == "date"
+        assert evaluation.dataset.version == f"version-{DATASET_PID}"
+        assert evaluation.model.dataset.version == f"version-{REFERENCE_PID}"
+
+    assert m_eval.call_count == 1
+    assert m_stream.call_count == 2
+    assert m_data.call_count == 0
+
+
+def test_missing_context_is_fetched_again(api) -> None:
+    frames, m_eval, m_data, m_stream = api
+    handle = save_evaluation_context(EVALUATION_PID)
+    remove_evaluation_context(EVALUATION_PID)
+
+    evaluation, _ = load_evaluation_context(EVALUATION_PID, handle, reference=False)
+
+    pd.testing.assert_frame_equal(evaluation.dataset.data, frames[DATASET_PID])
+    assert evaluation.model.dataset.data is None
+    assert m_eval.call_count == 2
+    assert m_stream.call_count == 2
+    assert m_data.call_count == 1
+
+
+def test_context_data_is_read_by_batches(api) -> None:
+    frames, _, m_data, m_stream = api
+    handle = save_evaluation_context(EVALUATION_PID)
+
+    evaluation, datashape = load_evaluation_context(EVALUATION_PID, handle, data=False)
+    assert evaluation.dataset.data is None
+    batches = list(iter_context_data(evaluation, datashape, handle))
+
+    pd.testing.assert_frame_equal(
+        pd.concat(batches, ignore_index=True), frames[DATASET_PID]
+    )
+    assert m_stream.call_count == 2
+    assert m_data.call_count == 0
@@ -0,0 +1,97 @@
+import io
+from unittest.mock import patch
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from a4s_eval.service import http_client
+from a4s_eval.utils import env
+
+
+def make_response(status_code: int) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.raw = io.BytesIO(b"")
+    return resp
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(env, "HTTP_BACKOFF", 0.0)
+    monkeypatch.setattr(env, "HTTP_RETRIES", 2)
+    http_client.reset_endpoint_stats()
+
+
+def refused() -> requests.ConnectionError:
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "http://api/x", reason))
+
+
+def test_session_is_reused() -> None:
+    assert http_client.get_session() is http_client.get_session()
+
+
+def test_session_does_not_retry() -> None:
+    retries = http_client.get_session().get_adapter("http://api/x").max_retries
+
+    assert retries.connect == 0
+    assert retries.read == 0
+
+
+def test_idempotent_request_is_retried() -> None:
+    responses = [make_response(503), make_response(200)]
+    with patch("requests.Session.request", side_effect=responses) as mock_request:
+        resp = http_client.request("GET", "http://api/x", endpoint="GET /x")
+
+    assert resp.status_code == 200
+    assert mock_request.call_count == 2
+    assert mock_request.call_args.kwargs["timeout"] == (
+        env.HTTP_CONNECT_TIMEOUT,
+        env.HTTP_READ_TIMEOUT,
+    )
+    stats = http_client.get_endpoint_stats()["GET /x"]
+    assert stats.count == 2
+    assert stats.errors == 1
+
+
+def test_non_idempotent_request_is_not_retried() -> None:
+    with patch(
+        "requests.Session.request", return_value=make_response(503)
+    ) as mock_request:
+        resp = http_client.request("POST", "http://api/x", endpoint="POST /x")
+
+    assert resp.status_code == 503
+    assert mock_request.call_count == 1
+
+
+def test_connection_errors_are_raised_after_retries() -> None:
+    with patch(
+        "requests.Session.request", side_effect=requests.ConnectionError
+    ) as mock_request:
+        with pytest.raises(requests.ConnectionError):
+            http_client.request("GET", "http://api/x", endpoint="GET /x")
+
+    assert mock_request.call_count == 3
+
+
+def test_refused_connection_is_retried_for_every_method() -> None:
+    with patch(
+        "requests.Session.request", side_effect=[refused(), make_response(200)]
+    ) as mock_request:
+        resp = http_client.request("POST", "http://api/x", endpoint="POST /x")
+
+    assert resp.status_code == 200
+    assert mock_request.call_count == 2
+
+
+def test_non_idempotent_timeout_is_not_retried() -> None:
+    with patch(
+        "requests.Session.request", side_effect=requests.ReadTimeout
+    ) as mock_request:
+        with pytest.raises(requests.ReadTimeout):
+            http_client.request(
+                "PUT", "http://api/x", endpoint="PUT /x", idempotent=False
+            )
+
+    assert mock_request.call_count == 1
@@ -0,0 +1,71 @@
+import pathlib
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper
+
+from a4s_eval.service import onnx_sessions
+from a4s_eval.service.onnx_sessions import SessionCache
+
+
+def make_model(scale: float) -> bytes:
+    graph = helper.make_graph(
+        [helper.make_node("Mul", ["x", "scale"], ["y"])],
+        "scale",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [None, 2])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, [None, 2])],
+        initializer=[helper.make_tensor("scale", TensorProto.FLOAT, [], [scale])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    return onnx.ModelProto.SerializeToString(model)
+
+
+def test_session_is_reused(tmp_path: pathlib.Path) -> None:
+    cache = SessionCache(max_bytes=10**6)
+    model_pid = uuid.uuid4()
+    model = make_model(2.0)
+    optimized_path = str(tmp_path / "model.onnx-optimized.onnx")
+
+    session = cache.get(model_pid, model, optimized_path)
+    assert cache.get(model_pid, model, optimized_path) is session
+    x = np.ones((1, 2), dtype=np.float32)
+    assert session.run(None, {"x": x})[0].tolist() == [[2.0, 2.0]]
+    assert [p.name for p in tmp_path.iterdir()] == ["model.onnx-optimized.onnx"]
+
+    # A new worker loads the optimized model
+    with patch(
+        "a4s_eval.service.onnx_sessions.ort.InferenceSession",
+        wraps=onnx_sessions.ort.InferenceSession,
+    ) as create:
+        other = SessionCache(max_bytes=10**6).get(model_pid, model, optimized_path)
+    assert create.call_args.args[0] == optimized_path
+    assert other is not session
+    assert other.run(None, {"x": x})[0].tolist() == [[2.0, 2.0]]
+
+
+def test_session_of_new_model_version_replaces_old_one() -> None:
+    cache = SessionCache(max_bytes=10**6)
+    model_pid = uuid.uuid4()
+
+    cache.get(model_pid, make_model(2.0))
+    session = cache.get(model_pid, make_model(3.0))
+
+    x = np.ones((1, 2), dtype=np.float32)
+    assert session.run(None, {"x": x})[0].tolist() == [[3.0, 3.0]]
+    assert len(cache._sessions) == 1
+
+
+def test_sessions_evicted_least_recently_used() -> None:
+    models = {uuid.uuid4(): make_model(float(i)) for i in range(3)}
+    cache = SessionCache(max_bytes=2 * max(len(m) for m in models.values()))
+    a, b, c = models
+
+    cache.get(a, models[a])
+    cache.get(b, models[b])
+    cache.get(a, models[a])
+    cache.get(c, models[c])
+
+    assert {pid for pid, _ in cache._sessions} == {a, c}
@@ -0,0 +1,136 @@
+import pathlib
+import pickle
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from a4s_eval.data_model.evaluation import (
+    DataShape,
+    Dataset,
+    Evaluation,
+    Model,
+    Project,
+)
+from a4s_eval.data_model.measure import Measure
+from a4s_eval.metric_registries.data_metric_registry import data_metric_registry
+from a4s_eval.tasks import window_pool
+from a4s_eval.tasks.window_pool import evaluate_windows
+from a4s_eval.utils import reference_profile as profiles
+from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.reference_profile import ReferenceProfile, reference_profile
+from tests.conftest import make_frame
+
+
+@pytest.fixture
+def evaluation(datashape: DataShape) -> Evaluation:
+    return Evaluation(
+        pid=uuid.uuid4(),
+        dataset=Dataset(
+            pid=uuid.uuid4(), shape=datashape, data=make_frame(500, 1, periods=20)
+        ),
+        model=Model(
+            pid=uuid.uuid4(),
+            dataset=Dataset(
+                pid=uuid.uuid4(), shape=datashape, data=make_frame(200, 0, periods=20)
+            ),
+        ),
+        project=Project(
+            pid=uuid.uuid4(), name="test", frequency="1 D", window_size="5 D"
+        ),
+    )
+
+
+def run_windows(
+    datashape: DataShape, evaluation: Evaluation, kind: str, workers: int
+) -> list[tuple]:
+    iterator = DateIterator("1 D", "5 D", "1 D", evaluation.dataset.data, "date")
+    y_pred_proba = None
+    if kind == "prediction":
+        rng = np.random.default_rng(2)
+        y_pred_proba = rng.dirichlet([1, 1], len(evaluation.dataset.data))
+        y_pred_proba = y_pred_proba[iterator.order]
+    with patch("a4s_eval.tasks.window_pool.WINDOW_WORKERS", workers):
+        measures = evaluate_windows(
+            kind, datashape, evaluation, iterator, y_pred_proba=y_pred_proba
+        )
+    # Metrics are registered in import order, which workers may not share
+    return sorted(
+        [(m.name, m.time, m.feature_pid, m.score) for m in measures],
+        key=lambda m: (m[1], m[0], str(m[2])),
+    )
+
+
+@pytest.mark.parametrize("kind", ["data", "prediction"])
+def test_parallel_windows_match_sequential_windows(
+    datashape: DataShape, evaluation: Evaluation, kind: str
+) -> None:
+    sequential = run_windows(datashape, evaluation, kind, workers=1)
+    parallel = run_windows(datashape, evaluation, kind, workers=2)
+
+    assert len(sequential) > 0
+    assert [m[:3] for m in parallel] == [m[:3] for m in sequential]
+    np.testing.assert_allclose(
+        [m[3] for m in parallel], [m[3] for m in sequential], equal_nan=True
+    )
+
+
+def test_workers_share_the_reference_profile(
+    datashape: DataShape, evaluation: Evaluation, tmp_path: pathlib.Path
+) -> None:
+    with patch.object(profiles, "PROFILE_DIR", str(tmp_path)):
+        profile = reference_profile(datashape, evaluation.model.dataset)
+    # A saved profile is sent to the workers as its path
+    assert profile.path is not None
+    assert len(pickle.dumps(profile)) < 1000
+
+    paths = {
+        "df": str(tmp_path / "df.arrow"),
+        "reference": str(tmp_path / "reference.arrow"),
+    }
+    window_pool._write_frame(evaluation.dataset.data, paths["df"])
+    window_pool._write_frame(evaluation.model.dataset.data[["x"]], paths["reference"])
+    worker_evaluation = window_pool._without_data(evaluation)
+    with (
+        patch.dict(window_pool._worker),
+        patch.object(ReferenceProfile, "build", side_effect=AssertionError),
+    ):
+        window_pool._init_worker(
+            "data",
+            datashape,
+            worker_evaluation,
+            paths,
+            None,
+            pickle.loads(pickle.dumps(profile)),
+        )
+        reference = worker_evaluation.model.dataset
+        shared = reference_profile(datashape, reference)
+
+    assert list(reference.data.columns) == ["x"]
+    assert isinstance(shared.sorted_values, np.memmap)
+    assert shared.categories["color"].tolist() == profile.categories["color"].tolist()
+
+
+def test_failing_window_keeps_other_windows(
+    datashape: DataShape, evaluation: Evaluation
+) -> None:
+    iterator = DateIterator("1 D", "5 D", "1 D", evaluation.dataset.data, "date")
+    failing_end = iterator.batches[1][1]
+
+    def metric(
+        datashape: DataShape, reference: Dataset, evaluated: Dataset
+    ) -> list[Measure]:
+        if evaluated.context.end == failing_end:
+            raise ValueError("broken window")
+        return [
+            Measure(name="rows", score=len(evaluated.data), time=evaluated.context.time)
+        ]
+
+    with (
+        patch.dict(data_metric_registry._functions, {"Rows": metric}, clear=True),
+        patch("a4s_eval.tasks.window_pool.WINDOW_WORKERS", 1),
+    ):
+        measures = evaluate_windows("data", datashape, evaluation, iterator)
+
+    assert len(measures) == len(iterator.batches) - 1
@@ -0,0 +1,40 @@
+import io
+
+import pandas as pd
+import pyarrow.csv as pv
+
+from a4s_eval.utils.arrow import (
+    as_pandas_compatible,
+    csv_convert_options,
+    table_to_pandas,
+)
+
+CSV = b"""name,score,date
+alice,1.5,2024-01-01
+,NA,2024-01-02
+NA,,
+bob,null,2024-01-04
+"""
+
+
+def read_arrow(columns: list[str] | None = None) -> pd.DataFrame:
+    table = pv.read_csv(io.BytesIO(CSV), convert_options=csv_convert_options(columns))
+    return table_to_pandas(as_pandas_compatible(table))
+
+
+def test_csv_matches_read_csv() -> None:
+    expected = pd.read_csv(io.BytesIO(CSV))
+
+    df = read_arrow()
+
+    assert df["name"].isna().tolist() == [False, True, True, False]
+    assert df["date"].isna().tolist() == [False, False, True, False]
+    # Missing strings are None rather than NaN
+    pd.testing.assert_frame_equal(df.isna(), expected.isna())
+    pd.testing.assert_frame_equal(df.dropna(), expected.dropna())
+
+
+def test_csv_columns() -> None:
+    df = read_arrow(["score"])
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(CSV), usecols=["score"]))
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from a4s_eval.utils.dates import DateIterator
+
+
+def make_frame(n: int = 500) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+        rng.integers(0, 60, n), unit="D"
+    )
+    df = pd.DataFrame({"x": rng.normal(size=n), "date": dates.strftime("%Y-%m-%d")})
+    df.index = rng.permutation(n) + 1000
+    return df
+
+
+def test_windows_match_date_masks() -> None:
+    df = make_frame()
+    dates = pd.to_datetime(df["date"])
+    iterator = DateIterator("1 D", "7 D", "1 D", df, "date")
+
+    windows = list(iterator)
+
+    assert len(windows) == len(iterator.batches)
+    for (end, window), (start, batch_end) in zip(windows, iterator.batches):
+        assert end == batch_end
+        expected = df[(dates >= start) & (dates < batch_end)]
+        assert sorted(window.index) == sorted(expected.index)
+        pd.testing.assert_series_equal(
+            window["x"].sort_index(), expected["x"].sort_index()
+        )
+        assert window["date"].is_monotonic_increasing
+
+
+def test_input_frame_is_not_modified() -> None:
+    df = make_frame()
+    original = df.copy()
+
+    for _, window in DateIterator("1 D", "7 D", "1 D", df, "date"):
+        assert pd.api.types.is_datetime64_any_dtype(window["date"])
+
+    pd.testing.assert_frame_equal(df, original)
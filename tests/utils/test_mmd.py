@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from a4s_eval.utils.mmd import RandomFourierFeatures, mmd_statistics
+
+
+def test_random_features_approximate_the_kernel() -> None:
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(50, 3))
+    mapping = RandomFourierFeatures(
+        np.zeros(3), np.ones(3), bandwidth=2.0, n_features=4096, seed=0
+    )
+
+    features = mapping.transform(values).astype(float)
+
+    squared = ((values[:, None] - values[None]) ** 2).sum(axis=2)
+    kernel = np.exp(-squared / (2 * 2.0**2))
+    np.testing.assert_allclose(features @ features.T, kernel, atol=0.1)
+
+
+def test_mmd_statistics_of_a_split() -> None:
+    features = np.arange(12, dtype=np.float32).reshape(6, 2)
+    labels = np.array([[0, 0, 0, 0, 1, 1], [1, 0, 1, 0, 0, 0]], dtype=np.float32)
+
+    statistics = mmd_statistics(features, labels, 2)
+
+    for row, split in zip(statistics, labels.astype(bool)):
+        gap = features[~split].mean(axis=0) - features[split].mean(axis=0)
+        assert row == pytest.approx((gap**2).sum())
@@ -0,0 +1,147 @@
+import uuid
+from functools import partial
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial.distance import jensenshannon
+from scipy.stats import wasserstein_distance
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, Feature, FeatureType
+from a4s_eval.metrics.data_metrics.drift_metric import data_drift_metric
+from a4s_eval.utils import permutation
+from a4s_eval.utils.permutation import (
+    categorical_p_value,
+    jensenshannon_statistics,
+    numerical_p_value,
+    wasserstein_statistics,
+)
+
+
+def make_feature(name: str, feature_type: FeatureType) -> Feature:
+    return Feature(
+        pid=uuid.uuid4(),
+        name=name,
+        feature_type=feature_type,
+        min_value=0,
+        max_value=0,
+    )
+
+
+def test_batch_statistics_match_scipy() -> None:
+    rng = np.random.default_rng(0)
+    pooled = np.round(rng.normal(size=60), 1)
+    order = np.argsort(pooled, kind="stable")
+    labels = np.zeros((5, 60), dtype=np.int8)
+    labels[:, :25] = 1
+    labels = rng.permuted(labels, axis=1)
+
+    distances = wasserstein_statistics(np.diff(pooled[order]), labels, 25)
+
+    for row, distance in zip(labels, distances):
+        sorted_values = pooled[order]
+        expected = wasserstein_distance(
+            sorted_values[row == 0], sorted_values[row == 1]
+        )
+        assert distance == pytest.approx(expected)
+
+    ref_counts = rng.integers(0, 20, (5, 6))
+    new_counts = rng.integers(0, 20, (5, 6))
+    np.testing.assert_allclose(
+        jensenshannon_statistics(ref_counts, new_counts),
+        [jensenshannon(p, q) for p, q in zip(ref_counts, new_counts)],
+    )
+
+
+def test_p_values_separate_drift_from_noise() -> None:
+    rng = np.random.default_rng(0)
+    x_ref = rng.normal(size=300)
+
+    assert numerical_p_value(x_ref, rng.normal(size=50), 1000) > 0.05
+    assert numerical_p_value(x_ref, rng.normal(1.0, size=50), 1000) < 0.05
+    assert (
+        categorical_p_value(np.array([100, 100, 100]), np.array([10, 11, 9]), 1000)
+        > 0.05
+    )
+    assert (
+        categorical_p_value(np.array([100, 100, 100]), np.array([25, 3, 2]), 1000)
+        < 0.05
+    )
+
+
+def test_clear_results_stop_early() -> None:
+    rng = np.random.default_rng(0)
+    x_ref, x_new = rng.normal(size=300), rng.normal(2.0, size=50)
+
+    with patch.object(
+        permutation, "_run_batch", wraps=permutation._run_batch
+    ) as run_batch:
+        p_value = numerical_p_value(x_ref, x_new, 10_000)
+
+    assert p_value < 0.05
+    assert run_batch.call_count < 10_000 // permutation.DRIFT_PERMUTATION_BATCH
+
+
+def test_reference_is_subsampled() -> None:
+    rng = np.random.default_rng(0)
+    x_ref, x_new = rng.normal(size=5000), rng.normal(1.0, size=50)
+
+    with (
+        patch.object(permutation, "DRIFT_PERMUTATION_MAX_ROWS", 500),
+        patch.object(permutation, "permutation_p_value", return_value=0.5) as p_value,
+    ):
+        numerical_p_value(x_ref, x_new, 100)
+
+    batch = p_value.call_args.args[0]
+    assert batch.args[1:] == (500, 50)
+    assert len(batch.args[0]) == 549
+
+
+def test_p_value_does_not_depend_on_workers() -> None:
+    totals = np.array([60, 30, 10])
+    batch = partial(permutation._categorical_batch, totals, 20)
+    observed = jensenshannon_statistics(
+        np.array([[45, 25, 10]]), np.array([[15, 5, 0]])
+    )[0]
+
+    sequential = permutation.permutation_p_value(batch, observed, 2000, 100, workers=1)
+    parallel = permutation.permutation_p_value(batch, observed, 2000, 100, workers=2)
+
+    assert parallel == sequential
+
+
+def test_drift_metric_emits_p_values() -> None:
+    datashape = DataShape(
+        features=[
+            make_feature("x", FeatureType.FLOAT),
+            make_feature("color", FeatureType.CATEGORICAL),
+        ],
+        target=make_feature("y", FeatureType.INTEGER),
+        date=make_feature("date", FeatureType.DATE),
+    )
+    rng = np.random.default_rng(0)
+
+    def make_dataset(n: int, shift: float) -> Dataset:
+        data = pd.DataFrame(
+            {
+                "x": rng.normal(shift, size=n),
+                "color": rng.choice(["red", "green"], n),
+                "y": rng.integers(0, 2, n),
+                "date": pd.Timestamp("2024-01-01"),
+            }
+        )
+        return Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+
+    reference, evaluated = make_dataset(200, 0.0), make_dataset(50, 1.0)
+    with patch("a4s_eval.metrics.data_metrics.drift_metric.DRIFT_PERMUTATIONS", 500):
+        measures = data_drift_metric(datashape, reference, evaluated)
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        ("wasserstein_distance", datashape.features[0].pid),
+        ("p_value", datashape.features[0].pid),
+        ("jensenshannon", datashape.features[1].pid),
+        ("p_value", datashape.features[1].pid),
+    ]
+    assert measures[1].score < 0.05
+    assert 0 < measures[3].score <= 1
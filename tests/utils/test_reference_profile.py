@@ -0,0 +1,353 @@
+import json
+import os
+import pathlib
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, FeatureType
+from a4s_eval.metrics.data_metrics.drift_metric import (
+    categorical_drift_from_counts,
+    categorical_drift_test,
+    data_drift_metric,
+    numerical_drift_test,
+)
+from a4s_eval.utils import reference_profile as profiles
+from a4s_eval.utils.reference_profile import (
+    OTHER_CATEGORY,
+    ReferenceProfile,
+    category_counts,
+    encode_categories,
+    reference_profile,
+)
+from a4s_eval.utils.window_stats import WindowStats
+from tests.conftest import make_datashape, make_feature, make_frame
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return make_datashape(
+        ("x", FeatureType.FLOAT),
+        ("n", FeatureType.INTEGER),
+        ("color", FeatureType.CATEGORICAL),
+    )
+
+
+@pytest.fixture
+def profile_dir(tmp_path: pathlib.Path):
+    with patch.object(profiles, "PROFILE_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+def test_profile_statistics(datashape: DataShape) -> None:
+    data = make_frame(500, 0, colors=["red", "green", None], missing=0.05)
+    profile = ReferenceProfile.build(datashape, data, n_bins=10)
+
+    x = data["x"].dropna()
+    np.testing.assert_array_equal(
+        profile.bin_edges("x"), np.histogram_bin_edges(x, bins=10)
+    )
+    np.testing.assert_array_equal(
+        profile.bin_edges("x", 4), np.histogram_bin_edges(x, bins=4)
+    )
+    assert profile.histogram("x")[1:11].tolist() == np.histogram(x, bins=10)[0].tolist()
+    assert profile.histogram("x")[-1] == data["x"].isna().sum()
+    assert profile.count("x") == len(x)
+    assert profile.mean("x") == pytest.approx(x.mean())
+    assert profile.variance("x") == pytest.approx(x.var(ddof=0))
+
+    codes, uniques = pd.factorize(data["color"])
+    assert profile.categories["color"].tolist() == uniques.tolist()
+    assert profile.category_counts("color").tolist() == [
+        *np.bincount(codes[codes >= 0]).tolist(),
+        int((codes < 0).sum()),
+    ]
+
+
+def test_encode_matches_factorize_on_reference_then_window(
+    datashape: DataShape,
+) -> None:
+    reference = make_frame(300, 0, colors=["red", "green", None], missing=0.05)
+    window = make_frame(100, 1, colors=["blue", "red", None, "pink"], missing=0.05)
+    profile = ReferenceProfile.build(datashape, reference)
+
+    codes, categories, ref_counts = profile.encode("color", window["color"])
+
+    all_codes, uniques = pd.factorize(
+        pd.concat([reference["color"], window["color"]], ignore_index=True)
+    )
+    all_codes[all_codes < 0] = len(uniques)
+    assert categories.tolist() == uniques.tolist()
+    np.testing.assert_array_equal(codes, all_codes[len(reference) :])
+    np.testing.assert_array_equal(
+        ref_counts,
+        np.bincount(all_codes[: len(reference)], minlength=len(uniques) + 1),
+    )
+
+
+def test_frame_is_encoded_once_for_all_features(datashape: DataShape) -> None:
+    datashape.features.append(make_feature("shape", FeatureType.CATEGORICAL))
+    reference = make_frame(300, 0, colors=["red", "green", None], missing=0.05)
+    reference["shape"] = np.where(reference["n"] < 5, "square", "circle")
+    window = make_frame(100, 1, colors=["blue", "red", None], missing=0.05)
+    window["shape"] = np.where(window["n"] < 3, "star", "circle")
+    profile = ReferenceProfile.build(datashape, reference)
+
+    encoded = profile.encode_frame(window)
+    expected = encode_categories(["color", "shape"], window, reference)
+
+    assert encoded.codes.dtype == np.int32
+    np.testing.assert_array_equal(encoded.codes, expected.codes)
+    counts = encoded.counts(10, 60)
+    for name in ("color", "shape"):
+        codes, categories, ref_counts = profile.encode(name, window[name])
+        assert encoded.categories[name].tolist() == categories.tolist()
+        np.testing.assert_array_equal(encoded.reference_counts[name], ref_counts)
+        np.testing.assert_array_equal(
+            counts[encoded.slices[name]],
+            np.bincount(codes[10:60], minlength=len(categories) + 1),
+        )
+
+
+def test_category_counts_match_value_counts() -> None:
+    x_ref = pd.Series(["a", "b", None, "a", "c"])
+    x_new = pd.Series(["b", "d", "d", None])
+
+    ref_counts, new_counts = category_counts(x_ref, x_new)
+
+    categories = ["a", "b", "c", "d"]
+    assert ref_counts.tolist() == [x_ref.value_counts().get(c, 0) for c in categories]
+    assert new_counts.tolist() == [x_new.value_counts().get(c, 0) for c in categories]
+
+
+@pytest.fixture
+def sketched():
+    with (
+        patch.object(profiles, "CATEGORY_SKETCH_THRESHOLD", 20),
+        patch.object(profiles, "CATEGORY_HEAVY_HITTERS", 5),
+    ):
+        yield
+
+
+def make_ids(n: int, seed: int) -> pd.Series:
+    ids = np.random.default_rng(seed).zipf(1.5, n).astype(str).astype(object)
+    ids[::50] = None
+    return pd.Series(ids)
+
+
+def test_sketched_profile_keeps_heavy_hitters(datashape: DataShape, sketched) -> None:
+    data = make_frame(2000, 0, colors=["red", "green"], missing=0.05)
+    data["color"] = make_ids(2000, 1)
+    profile = ReferenceProfile.build(datashape, data)
+
+    counts = data["color"].value_counts()
+    assert list(profile.sketches) == ["color"]
+    assert profile.categories["color"].tolist() == [
+        *counts.index[:5].tolist(),
+        OTHER_CATEGORY,
+    ]
+    assert profile.category_counts("color").tolist() == [
+        *counts.iloc[:5].tolist(),
+        counts.iloc[5:].sum(),
+        data["color"].isna().sum(),
+    ]
+    assert profile.sketches["color"].n == counts.iloc[5:].sum()
+
+
+def test_sketched_encoding_is_bounded(
+    datashape: DataShape, profile_dir: pathlib.Path, sketched
+) -> None:
+    reference = make_frame(2000, 0, colors=["red", "green"], missing=0.05)
+    reference["color"] = make_ids(2000, 1)
+    window = make_frame(500, 2, colors=["red", "green"], missing=0.05)
+    window["color"] = make_ids(500, 3)
+    window.loc[:99, "color"] = "new"
+    profile = ReferenceProfile.build(datashape, reference)
+
+    codes, categories, ref_counts = profile.encode("color", window["color"])
+
+    # Heavy hitters, the 5 most frequent other values, then the remaining values
+    assert len(categories) == 11
+    assert categories[5] == "new"
+    assert categories[-1] == OTHER_CATEGORY
+    assert ref_counts.sum() == len(reference)
+    np.testing.assert_array_equal(ref_counts[:5], profile.category_counts("color")[:5])
+    exact = reference["color"].value_counts()
+    for category, count in zip(categories[5:10], ref_counts[5:10]):
+        assert count >= exact.get(category, 0)
+    window_counts = window["color"].value_counts()
+    new_counts = np.bincount(codes, minlength=len(categories) + 1)
+    assert new_counts[:10].tolist() == [window_counts[c] for c in categories[:10]]
+    assert new_counts[-1] == window["color"].isna().sum()
+    assert new_counts.sum() == len(window)
+
+    stats = WindowStats(datashape, window, profile=profile).move(0, len(window))
+    np.testing.assert_array_equal(stats.category_counts("color"), new_counts)
+
+    # Drift over the heavy hitters, the frequent other values and the others
+    measures = data_drift_metric(
+        datashape,
+        Dataset(pid=uuid.uuid4(), shape=datashape, data=reference),
+        Dataset(pid=uuid.uuid4(), shape=datashape, data=window),
+    )
+    (score,) = [m.score for m in measures if m.name == "jensenshannon"]
+    assert score == pytest.approx(
+        categorical_drift_from_counts(ref_counts[:-1], new_counts[:-1])
+    )
+
+
+def test_sketched_profile_is_saved(
+    datashape: DataShape, profile_dir: pathlib.Path, sketched
+) -> None:
+    data = make_frame(1000, 0, colors=["red"], missing=0.05)
+    data["color"] = make_ids(1000, 1)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+    built = reference_profile(datashape, dataset)
+
+    copy = dataset.model_copy(update={"data": data.copy()})
+    with patch.object(ReferenceProfile, "build", side_effect=AssertionError):
+        loaded = reference_profile(datashape, copy)
+
+    assert loaded.categories["color"].tolist() == built.categories["color"].tolist()
+    np.testing.assert_array_equal(
+        loaded.sketches["color"].table, built.sketches["color"].table
+    )
+    window = make_ids(300, 2)
+    for built_array, loaded_array in zip(
+        built.encode("color", window), loaded.encode("color", window)
+    ):
+        np.testing.assert_array_equal(built_array, loaded_array)
+
+
+def test_profile_is_saved_and_memory_mapped(
+    datashape: DataShape, profile_dir: pathlib.Path
+) -> None:
+    data = make_frame(300, 0, colors=["red", "green", None], missing=0.05)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+    built = reference_profile(datashape, dataset)
+    assert reference_profile(datashape, dataset) is built
+
+    # Another frame with the same content loads the saved profile
+    copy = dataset.model_copy(update={"data": data.copy()})
+    with patch.object(ReferenceProfile, "build", side_effect=AssertionError):
+        loaded = reference_profile(datashape, copy)
+
+    assert isinstance(loaded.sorted_values, np.memmap)
+    np.testing.assert_array_equal(loaded.sorted_values, built.sorted_values)
+    np.testing.assert_array_equal(loaded.integrals, built.integrals)
+    assert loaded.categories["color"].tolist() == built.categories["color"].tolist()
+    np.testing.assert_array_equal(
+        loaded.category_counts("color"), built.category_counts("color")
+    )
+    assert len(os.listdir(profile_dir)) == 1
+
+
+def test_profile_of_a_dataset_version_is_loaded_without_hashing(
+    datashape: DataShape, profile_dir: pathlib.Path
+) -> None:
+    data = make_frame(300, 0, colors=["red", "green"], missing=0.05)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data, version="v1")
+    built = reference_profile(datashape, dataset)
+
+    copy = dataset.model_copy(update={"data": data.copy()})
+    with (
+        patch.object(profiles, "profile_hash", side_effect=AssertionError),
+        patch.object(ReferenceProfile, "build", side_effect=AssertionError),
+    ):
+        loaded = reference_profile(datashape, copy)
+    np.testing.assert_array_equal(loaded.sorted_values, built.sorted_values)
+
+    # A new version replaces the profile of the previous one
+    changed = dataset.model_copy(
+        update={
+            "data": make_frame(200, 1, colors=["red"], missing=0.05),
+            "version": "v2",
+        }
+    )
+    assert reference_profile(datashape, changed).n_rows == 200
+    assert len(os.listdir(profile_dir)) == 1
+
+
+def test_profiles_of_other_datashapes_are_kept(
+    datashape: DataShape, profile_dir: pathlib.Path
+) -> None:
+    data = make_frame(300, 0, colors=["red", "green"], missing=0.05)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data, version="v1")
+    other = make_datashape(("x", FeatureType.FLOAT))
+    reference_profile(datashape, dataset)
+    reference_profile(other, dataset)
+    assert len(os.listdir(profile_dir)) == 2
+
+    # Each datashape loads its own profile
+    copy = dataset.model_copy(update={"data": data.copy()})
+    with patch.object(ReferenceProfile, "build", side_effect=AssertionError):
+        assert reference_profile(datashape, copy).categorical == ["color"]
+        assert reference_profile(other, copy).categorical == []
+
+
+def test_profile_of_another_version_is_rebuilt(
+    datashape: DataShape, profile_dir: pathlib.Path
+) -> None:
+    data = make_frame(300, 0, colors=["red", "green"], missing=0.05)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+    reference_profile(datashape, dataset)
+    (path,) = profile_dir.iterdir()
+    header = json.loads((path / profiles.HEADER_FILE).read_text())
+    header["version"] = 0
+    (path / profiles.HEADER_FILE).write_text(json.dumps(header))
+
+    copy = dataset.model_copy(update={"data": data.copy()})
+    with patch.object(ReferenceProfile, "build", wraps=ReferenceProfile.build) as build:
+        reference_profile(datashape, copy)
+    assert build.call_count == 1
+
+
+def test_window_stats_from_profile(datashape: DataShape) -> None:
+    reference = make_frame(300, 0, colors=["red", "green", None], missing=0.05)
+    df = make_frame(200, 1, colors=["blue", "red", None], missing=0.05)
+    profile = ReferenceProfile.build(datashape, reference, n_bins=8)
+
+    expected = WindowStats(datashape, df, reference=reference, n_bins=8).move(20, 150)
+    stats = WindowStats(datashape, df, n_bins=8, profile=profile).move(20, 150)
+
+    np.testing.assert_array_equal(stats.bin_edges["x"], expected.bin_edges["x"])
+    np.testing.assert_array_equal(stats.histogram("x"), expected.histogram("x"))
+    assert stats.categories["color"].tolist() == expected.categories["color"].tolist()
+    np.testing.assert_array_equal(
+        stats.reference_counts["color"], expected.reference_counts["color"]
+    )
+    np.testing.assert_array_equal(
+        stats.category_counts("color"), expected.category_counts("color")
+    )
+
+
+def test_drift_from_profile_matches_drift_tests(
+    datashape: DataShape, profile_dir: pathlib.Path
+) -> None:
+    reference = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(300, 0, colors=["red", "green", "blue"], missing=0.05),
+    )
+    evaluated = Dataset(
+        pid=uuid.uuid4(),
+        shape=datashape,
+        data=make_frame(100, 1, colors=["red", "pink"], missing=0.05).fillna(
+            {"x": 0.0}
+        ),
+    )
+    reference.data["x"] = reference.data["x"].fillna(0.0)
+
+    measures = data_drift_metric(datashape, reference, evaluated)
+
+    scores = {m.feature_pid: m.score for m in measures}
+    for feature in datashape.features:
+        x_ref, x_new = reference.data[feature.name], evaluated.data[feature.name]
+        if feature.feature_type == FeatureType.CATEGORICAL:
+            expected = categorical_drift_test(x_ref, x_new)
+        else:
+            expected = numerical_drift_test(x_ref, x_new)
+        assert scores[feature.pid] == pytest.approx(expected)
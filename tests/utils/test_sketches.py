@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import a4s_eval.utils.sketches as sketches
+
+from a4s_eval.data_model.evaluation import DataShape
+from a4s_eval.metrics.data_metrics.drift_metric import (
+    categorical_drift_test,
+    numerical_drift_test,
+    sketch_drift_metric,
+)
+from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.sketches import (
+    BucketSketches,
+    CategorySketch,
+    CountMinSketch,
+    FrameSketch,
+    KLLSketch,
+    value_hashes,
+)
+from tests.conftest import make_frame
+
+# Rows over 10 days, dated by the hour
+FRAME = {"periods": 240, "unit": "h"}
+
+
+def test_small_sketch_is_exact() -> None:
+    sketch = KLLSketch(k=50).update(np.arange(20.0))
+
+    assert sketch.quantiles([0.0, 0.5, 1.0]).tolist() == [0.0, 9.0, 19.0]
+    assert sketch.cdf([4.5]).tolist() == [0.25]
+
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_rank_error_is_bounded(merged: bool) -> None:
+    values = np.random.default_rng(0).lognormal(size=200_000)
+    if merged:
+        sketch = KLLSketch()
+        for part in np.array_split(values, 500):
+            sketch.merge(KLLSketch().update(part))
+    else:
+        sketch = KLLSketch().update(values)
+
+    q = np.linspace(0.01, 0.99, 99)
+    ranks = np.searchsorted(np.sort(values), sketch.quantiles(q)) / len(values)
+
+    assert sketch.n == len(values)
+    assert sum(len(level) for level in sketch.levels) < 1000
+    assert np.abs(ranks - q).max() < 0.02
+
+
+def test_missing_values_are_ignored() -> None:
+    sketch = KLLSketch().update(np.array([1.0, np.nan, 3.0]))
+
+    assert sketch.n == 2
+    assert np.isnan(KLLSketch().quantiles(0.5)).all()
+
+
+def test_count_min_error_is_bounded() -> None:
+    values = pd.Series(np.random.default_rng(0).zipf(1.3, 100_000).astype(str))
+    counts = values.value_counts()
+    sketch = CountMinSketch(width=2048, depth=4)
+    for part in np.array_split(values.to_numpy(), 10):
+        sketch.merge(CountMinSketch(width=2048, depth=4).update(value_hashes(part)))
+
+    estimates = sketch.query(value_hashes(counts.index))
+
+    assert sketch.n == len(values)
+    assert (estimates >= counts.to_numpy()).all()
+    assert (estimates - counts.to_numpy()).max() <= np.e / 2048 * len(values)
+    grouped = CountMinSketch(width=2048, depth=4).update(
+        value_hashes(counts.index), counts.to_numpy()
+    )
+    np.testing.assert_array_equal(grouped.table, sketch.table)
+
+
+def test_frame_sketch_merge_matches_update(datashape: DataShape) -> None:
+    df = make_frame(150, 0, **FRAME)
+    df.loc[::10, "x"] = np.nan
+    df.loc[::7, "color"] = None
+    whole = FrameSketch(datashape).update(df)
+    merged = FrameSketch(datashape).update(df.iloc[:60])
+    merged.merge(FrameSketch(datashape).update(df.iloc[60:]))
+
+    for sketch in (whole, merged):
+        assert sketch.n_rows == 150
+        assert sketch.missing == {"x": 15, "color": 22}
+        assert sketch.counts["color"].table() == df["color"].value_counts().to_dict()
+        np.testing.assert_array_equal(
+            np.sort(sketch.sketches["x"].weighted_items()[0]),
+            np.sort(df["x"].dropna().to_numpy()),
+        )
+
+
+def test_category_sketch_is_bounded_above_threshold() -> None:
+    rng = np.random.default_rng(0)
+    # 20 frequent values and 5000 rare ones
+    values = pd.Series(
+        np.concatenate(
+            [rng.integers(20, size=20_000), rng.integers(20, 5020, size=5_000)]
+        ).astype(str)
+    ).sample(frac=1, random_state=0)
+    counts = values.value_counts()
+    whole = CategorySketch(threshold=100, heavy_hitters=50, width=2048).update(values)
+    merged = CategorySketch(threshold=100, heavy_hitters=50, width=2048)
+    for lo in range(0, len(values), 1000):
+        part = CategorySketch(threshold=100, heavy_hitters=50, width=2048)
+        merged.merge(part.update(values.iloc[lo : lo + 1000]))
+
+    for sketch in (whole, merged):
+        assert sketch.sketched
+        assert sketch.n == len(values)
+        assert len(sketch.keys()) == 50
+        assert set(counts.index[:20]) <= set(sketch.keys())
+        estimates = sketch.counts(list(counts.index[:20]))
+        assert (estimates >= counts.iloc[:20].to_numpy()).all()
+        assert (estimates - counts.iloc[:20].to_numpy()).max() <= np.e / 2048 * len(
+            values
+        )
+
+
+def test_sketch_drift_is_exact_on_small_data(datashape: DataShape) -> None:
+    reference, df = make_frame(150, 0, **FRAME), make_frame(100, 1, shift=0.5, **FRAME)
+    date = df["date"].max()
+    measures = sketch_drift_metric(
+        datashape,
+        datashape,
+        FrameSketch(datashape).update(reference),
+        FrameSketch(datashape).update(df),
+        date,
+    )
+
+    assert [(m.name, m.feature_pid) for m in measures] == [
+        ("wasserstein_distance", datashape.features[0].pid),
+        ("jensenshannon", datashape.features[1].pid),
+    ]
+    assert measures[0].score == pytest.approx(
+        numerical_drift_test(reference["x"], df["x"])
+    )
+    assert measures[1].score == pytest.approx(
+        categorical_drift_test(reference["color"], df["color"])
+    )
+
+
+def test_sketch_drift_error_is_bounded(datashape: DataShape) -> None:
+    reference, df = (
+        make_frame(20_000, 0, **FRAME),
+        make_frame(20_000, 1, shift=0.3, **FRAME),
+    )
+    measures = sketch_drift_metric(
+        datashape,
+        datashape,
+        FrameSketch(datashape, k=200).update(reference),
+        FrameSketch(datashape, k=200).update(df),
+        df["date"].max(),
+    )
+
+    value_range = max(reference["x"].max(), df["x"].max()) - min(
+        reference["x"].min(), df["x"].min()
+    )
+    expected = numerical_drift_test(reference["x"], df["x"])
+    assert abs(measures[0].score - expected) <= 2 * (2 / 200) * value_range
+
+
+def test_sketch_drift_of_many_categories_is_bounded(
+    datashape: DataShape, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(sketches, "CATEGORY_SKETCH_THRESHOLD", 100)
+    monkeypatch.setattr(sketches, "CATEGORY_HEAVY_HITTERS", 50)
+    monkeypatch.setattr(sketches, "CATEGORY_SKETCH_WIDTH", 4096)
+    reference, df = make_frame(20_000, 0, **FRAME), make_frame(20_000, 1, **FRAME)
+    rng = np.random.default_rng(2)
+    # Frequent colors, with a shift, and a long tail of rare ones
+    reference["color"] = np.where(
+        rng.random(20_000) < 0.8,
+        rng.choice(["red", "green", "blue"], 20_000),
+        rng.integers(5_000, size=20_000).astype(str),
+    )
+    df["color"] = np.where(
+        rng.random(20_000) < 0.8,
+        rng.choice(["red", "green", "blue"], 20_000, p=[0.6, 0.2, 0.2]),
+        rng.integers(5_000, size=20_000).astype(str),
+    )
+    ref_sketch = FrameSketch(datashape).update(reference)
+    sketch = FrameSketch(datashape)
+    for lo in range(0, len(df), 2_000):
+        sketch.merge(FrameSketch(datashape).update(df.iloc[lo : lo + 2_000]))
+
+    measures = sketch_drift_metric(
+        datashape, datashape, ref_sketch, sketch, df["date"].max()
+    )
+
+    for summary in (ref_sketch, sketch):
+        assert summary.counts["color"].sketched
+        assert len(summary.counts["color"].keys()) == 50
+    # The rare colors are counted together
+    frequent = ["red", "green", "blue"]
+    expected = categorical_drift_test(
+        reference["color"].where(reference["color"].isin(frequent), "other"),
+        df["color"].where(df["color"].isin(frequent), "other"),
+    )
+    assert measures[1].score == pytest.approx(expected, abs=0.02)
+
+
+def test_bucket_windows_match_date_iterator(datashape: DataShape) -> None:
+    df = make_frame(2_000, 0, **FRAME)
+    buckets = BucketSketches(datashape, "1 D")
+    for lo in range(0, len(df), 300):
+        buckets.update(df.iloc[lo : lo + 300])
+    iterator = DateIterator("1 D", "3 D", "2 D", df, "date")
+
+    batches = buckets.batches("3 D", "2 D")
+
+    assert batches == iterator.batches
+    for (start, end), (lo, hi) in zip(batches, iterator.bounds):
+        window, date = buckets.window(start, end)
+        rows = iterator.df.iloc[lo:hi]
+        assert window.n_rows == len(rows)
+        assert date == rows["date"].max()
+        assert window.counts["color"].table() == rows["color"].value_counts().to_dict()
+
+
+def test_bucket_windows_must_be_whole_buckets(datashape: DataShape) -> None:
+    buckets = BucketSketches(datashape, "1 D").update(make_frame(100, 0, **FRAME))
+
+    with pytest.raises(ValueError):
+        buckets.batches("36 h", "1 D")
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from a4s_eval.utils import text_embedding
+from a4s_eval.utils.text_embedding import embed_text, projection
+
+
+def test_embeddings_keep_text_similarity() -> None:
+    texts = pd.Series(
+        ["the cat sat on the mat", "the cat sat on a mat", "quarterly revenue", None]
+    )
+
+    embeddings = embed_text(texts, n_features=2**16, n_components=256)
+
+    assert embeddings.shape == (4, 256)
+    assert embeddings.dtype == np.float32
+    similar = np.linalg.norm(embeddings[0] - embeddings[1])
+    different = np.linalg.norm(embeddings[0] - embeddings[2])
+    assert similar < different / 2
+    # Missing texts are empty texts
+    assert not embeddings[3].any()
+
+
+def test_embeddings_do_not_depend_on_chunks() -> None:
+    texts = [f"text number {i}" for i in range(50)]
+
+    with patch.object(text_embedding, "CHUNK_ROWS", 7):
+        chunked = embed_text(texts)
+
+    np.testing.assert_array_equal(chunked, embed_text(texts))
+    assert projection(2**10, 8, 0) is projection(2**10, 8, 0)
@@ -0,0 +1,90 @@
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from a4s_eval.data_model.evaluation import Dataset, DataShape, Feature, FeatureType
+from a4s_eval.metric_registries.prediction_metric_registry import (
+    prediction_metric_registry,
+)
+from a4s_eval.utils.window_context import WindowContext, window_context
+
+
+def make_feature(name: str, feature_type: FeatureType) -> Feature:
+    return Feature(
+        pid=uuid.uuid4(),
+        name=name,
+        feature_type=feature_type,
+        min_value=0,
+        max_value=0,
+    )
+
+
+@pytest.fixture
+def datashape() -> DataShape:
+    return DataShape(
+        features=[
+            make_feature("x", FeatureType.FLOAT),
+            make_feature("n", FeatureType.INTEGER),
+            make_feature("color", FeatureType.CATEGORICAL),
+        ],
+        target=make_feature("y", FeatureType.INTEGER),
+        date=make_feature("date", FeatureType.DATE),
+    )
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 200
+    return pd.DataFrame(
+        {
+            "x": rng.normal(size=n),
+            "n": rng.integers(0, 10, n),
+            "color": rng.choice(["red", "green"], n),
+            "y": rng.integers(0, 2, n),
+            "date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 5, n), unit="D"),
+        }
+    )
+
+
+def test_context_arrays(datashape: DataShape, data: pd.DataFrame) -> None:
+    y_pred_proba = np.random.default_rng(1).dirichlet([1, 1], len(data))
+    context = WindowContext(datashape, data, y_pred_proba)
+
+    assert context.date == data["date"].max()
+    assert context.start == data["date"].min()
+    np.testing.assert_array_equal(context.y_true, data["y"].to_numpy())
+    np.testing.assert_array_equal(context.y_pred, np.argmax(y_pred_proba, axis=1))
+    assert context.numerical_matrix.shape == (len(data), 2)
+    np.testing.assert_array_equal(context.column("n"), data["n"].to_numpy())
+    np.testing.assert_array_equal(context.column("color"), data["color"].to_numpy())
+    assert context.feature_pids["x"] == datashape.features[0].pid
+
+
+def test_context_is_shared_by_the_metrics(
+    datashape: DataShape, data: pd.DataFrame
+) -> None:
+    y_pred_proba = np.random.default_rng(1).dirichlet([1, 1], len(data))
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=data)
+    expected = [
+        m.score
+        for _, evaluator in prediction_metric_registry
+        for m in evaluator(datashape, None, dataset, y_pred_proba)
+    ]
+
+    context = WindowContext(datashape, data, y_pred_proba)
+    dataset = dataset.model_copy(update={"context": context})
+    assert window_context(datashape, dataset) is context
+    with patch("numpy.argmax", wraps=np.argmax) as argmax:
+        scores = [
+            m.score
+            for _, evaluator in prediction_metric_registry
+            for m in evaluator(datashape, None, dataset, y_pred_proba)
+        ]
+
+    assert scores == expected
+    assert argmax.call_count == 1
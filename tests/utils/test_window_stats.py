@@ -0,0 +1,275 @@
+import pathlib
+import pickle
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from sklearn.metrics import f1_score, matthews_corrcoef
+
+from a4s_eval.data_model.evaluation import DataShape, Dataset, FeatureType
+from a4s_eval.metrics.data_metrics.drift_metric import (
+    categorical_drift_from_counts,
+    categorical_drift_test,
+)
+from a4s_eval.metrics.prediction_metrics.perf_metric import (
+    classification_f1_score_metric,
+    matthews_corrcoef_from_confusion,
+)
+from a4s_eval.utils.dates import DateIterator
+from a4s_eval.utils.cache import DiskCache
+from a4s_eval.utils.window_stats import (
+    BucketSummaries,
+    WindowStats,
+    iter_window_stats,
+)
+from tests.conftest import make_datashape, make_frame
+
+# Rows over 40 days, with missing values
+FRAME = {"colors": ["red", "green", "blue", None], "missing": 0.05, "periods": 40}
+
+
+def test_incremental_stats_match_recomputed_stats(datashape: DataShape) -> None:
+    reference = make_frame(300, 0, **FRAME)
+    df = make_frame(1000, 1, **FRAME)
+    y_pred = np.random.default_rng(2).integers(0, 2, len(df))
+    iterator = DateIterator("1 D", "10 D", "1 D", df, "date")
+    stats = WindowStats(
+        datashape,
+        iterator.df,
+        reference=reference,
+        y_pred=y_pred[iterator.order],
+        n_bins=8,
+    )
+    edges = stats.bin_edges["x"]
+
+    for i, (_, window) in enumerate(iterator):
+        stats.move(*iterator.bounds[i])
+        x = window["x"].dropna()
+
+        histogram = stats.histogram("x")
+        inside = x[(x >= edges[0]) & (x <= edges[-1])]
+        assert histogram[1:-2].tolist() == np.histogram(inside, edges)[0].tolist()
+        assert histogram[0] == (x < edges[0]).sum()
+        assert histogram[-2] == (x > edges[-1]).sum()
+        assert histogram[-1] == window["x"].isna().sum()
+        assert stats.count("x") == len(x)
+        assert stats.mean("x") == pytest.approx(x.mean())
+        assert stats.variance("x") == pytest.approx(x.var(ddof=0))
+
+        counts = window["color"].value_counts()
+        categories = stats.categories["color"]
+        assert stats.category_counts("color")[:-1].tolist() == [
+            counts.get(c, 0) for c in categories
+        ]
+        if len(window):
+            assert categorical_drift_from_counts(
+                stats.reference_counts["color"][:-1],
+                stats.category_counts("color")[:-1],
+            ) == pytest.approx(
+                categorical_drift_test(reference["color"], window["color"])
+            )
+
+            window_pred = y_pred[iterator.order][slice(*iterator.bounds[i])]
+            assert matthews_corrcoef_from_confusion(stats.confusion) == pytest.approx(
+                matthews_corrcoef(window["y"], window_pred)
+            )
+
+
+def test_prediction_metrics_read_window_confusion(datashape: DataShape) -> None:
+    df = make_frame(200, 3, **FRAME)
+    y_pred_proba = np.random.default_rng(4).dirichlet([1, 1], len(df))
+    y_pred = np.argmax(y_pred_proba, axis=1)
+    dataset = Dataset(pid=uuid.uuid4(), shape=datashape, data=df)
+    expected = classification_f1_score_metric(datashape, None, dataset, y_pred_proba)
+
+    dataset.stats = WindowStats(datashape, df, y_pred=y_pred).move(0, len(df))
+    measures = classification_f1_score_metric(datashape, None, dataset, y_pred_proba)
+
+    assert measures[0].score == pytest.approx(expected[0].score)
+    assert measures[0].score == pytest.approx(f1_score(df["y"], y_pred))
+
+
+@pytest.mark.parametrize("step", ["1 D", "36h"])
+def test_confusion_only_stats_skip_features(datashape: DataShape, step: str) -> None:
+    df = make_frame(1000, 1, **FRAME)
+    y_pred = np.random.default_rng(2).integers(0, 2, len(df))
+    iterator = DateIterator("1 D", "10 D", step, df, "date")
+    kwargs = {"y_pred": y_pred[iterator.order]}
+
+    full = iter_window_stats(datashape, iterator, **kwargs)
+    only = iter_window_stats(datashape, iterator, confusion_only=True, **kwargs)
+
+    for expected, window in zip(full, only):
+        assert window._hist.size == 0 and window._cat_counts.size == 0
+        assert window.categories == {} and window._numerical == {}
+        assert window.labels.tolist() == expected.labels.tolist()
+        assert window.confusion.tolist() == expected.confusion.tolist()
+
+
+def test_mapped_rows_are_not_pickled(
+    datashape: DataShape, tmp_path: pathlib.Path
+) -> None:
+    df = make_frame(2000, 1, **FRAME)
+    y_pred = np.random.default_rng(2).integers(0, 2, len(df))
+    stats = WindowStats(datashape, df, y_pred=y_pred)
+    size = len(pickle.dumps(stats))
+
+    mapped = pickle.loads(pickle.dumps(stats.map_rows(str(tmp_path))))
+
+    assert len(pickle.dumps(stats)) < size / 10
+    assert isinstance(mapped._values, np.memmap)
+    fresh = WindowStats(datashape, df, y_pred=y_pred).move(100, 900)
+    mapped.move(100, 900)
+    np.testing.assert_array_equal(mapped.histogram("x"), fresh.histogram("x"))
+    np.testing.assert_array_equal(
+        mapped.category_counts("color"), fresh.category_counts("color")
+    )
+    np.testing.assert_array_equal(mapped.confusion, fresh.confusion)
+
+
+def test_bucket_summaries_match_incremental_stats(datashape: DataShape) -> None:
+    reference = make_frame(300, 0, **FRAME)
+    df = make_frame(1000, 1, **FRAME)
+    y_pred = np.random.default_rng(2).integers(0, 2, len(df))
+    iterator = DateIterator("1 D", "10 D", "2 D", df, "date")
+    stats = WindowStats(
+        datashape, iterator.df, reference=reference, y_pred=y_pred[iterator.order]
+    )
+    summaries = BucketSummaries(stats, iterator.df["date"], "1 D", sketch_k=50)
+
+    for (start, end), (lo, hi) in zip(iterator.batches, iterator.bounds):
+        window = summaries.window(start, end)
+        stats.move(lo, hi)
+        assert (window.lo, window.hi) == (lo, hi)
+        assert window.histogram("x").tolist() == stats.histogram("x").tolist()
+        assert window.count("x") == stats.count("x")
+        assert window.mean("x") == pytest.approx(stats.mean("x"))
+        assert window.variance("x") == pytest.approx(stats.variance("x"))
+        assert (
+            window.category_counts("color").tolist()
+            == stats.category_counts("color").tolist()
+        )
+        assert window.confusion.tolist() == stats.confusion.tolist()
+
+        x = iterator.df["x"].iloc[lo:hi].dropna()
+        if len(x):
+            ranks = (x.to_numpy()[:, None] <= window.quantiles("x", [0.25, 0.75])).mean(
+                axis=0
+            )
+            assert ranks == pytest.approx([0.25, 0.75], abs=0.05)
+
+
+def test_correlation_matches_dataframe_corr() -> None:
+    datashape = make_datashape(
+        ("a", FeatureType.FLOAT), ("b", FeatureType.FLOAT), ("n", FeatureType.INTEGER)
+    )
+    df = make_frame(1000, 5, **FRAME)
+    rng = np.random.default_rng(6)
+    # Large values with a small variance, as precision is lost without centering
+    df["a"] = 1e6 + rng.normal(size=len(df))
+    df["b"] = df["a"] + rng.normal(size=len(df))
+    df["n"] = rng.integers(0, 10, len(df))
+    iterator = DateIterator("1 D", "10 D", "3 D", df, "date")
+    stats = WindowStats(datashape, iterator.df)
+    summaries = BucketSummaries(stats, iterator.df["date"], "1 D", sketch_k=0)
+
+    for (start, end), (lo, hi) in zip(iterator.batches, iterator.bounds):
+        expected = iterator.df[["a", "b", "n"]].iloc[lo:hi].corr().to_numpy()
+        np.testing.assert_allclose(stats.move(lo, hi).correlation(), expected)
+        np.testing.assert_allclose(summaries.window(start, end).correlation(), expected)
+
+
+def test_variance_of_large_values(datashape: DataShape) -> None:
+    df = make_frame(1000, 5, **FRAME)
+    # Epoch-like values with a unit spread, which cancel in unshifted sums
+    df["x"] = 1.7e9 + np.random.default_rng(6).normal(size=len(df))
+    iterator = DateIterator("1 D", "10 D", "3 D", df, "date")
+    stats = WindowStats(datashape, iterator.df)
+    summaries = BucketSummaries(stats, iterator.df["date"], "1 D")
+
+    for (start, end), (lo, hi) in zip(iterator.batches, iterator.bounds):
+        x = iterator.df["x"].iloc[lo:hi]
+        for window in (stats.move(lo, hi), summaries.window(start, end)):
+            assert window.mean("x") == pytest.approx(x.mean(), rel=1e-12)
+            assert window.variance("x") == pytest.approx(x.var(ddof=0), rel=1e-6)
+
+
+def test_window_summaries_are_cached(
+    datashape: DataShape, tmp_path: pathlib.Path
+) -> None:
+    df = make_frame(500, 1, **FRAME)
+    iterator = DateIterator("1 D", "7 D", "1 D", df, "date")
+
+    with patch(
+        "a4s_eval.utils.window_stats.summary_cache",
+        DiskCache(str(tmp_path), 10**9),
+    ):
+        first = [
+            w.category_counts("color") for w in iter_window_stats(datashape, iterator)
+        ]
+        with patch(
+            "a4s_eval.utils.window_stats.WindowStats", side_effect=AssertionError
+        ):
+            second = [
+                w.category_counts("color")
+                for w in iter_window_stats(datashape, iterator)
+            ]
+
+    assert len(first) == len(iterator.batches)
+    assert [c.tolist() for c in first] == [c.tolist() for c in second]
+
+
+def test_window_summaries_of_a_version_are_not_hashed(
+    datashape: DataShape, tmp_path: pathlib.Path
+) -> None:
+    df = make_frame(500, 1, **FRAME)
+    iterator = DateIterator("1 D", "7 D", "1 D", df, "date")
+
+    with (
+        patch(
+            "a4s_eval.utils.window_stats.summary_cache",
+            DiskCache(str(tmp_path), 10**9),
+        ),
+        patch("pandas.util.hash_pandas_object", side_effect=AssertionError),
+    ):
+        first = list(iter_window_stats(datashape, iterator, version="v1"))
+        with patch(
+            "a4s_eval.utils.window_stats.WindowStats", side_effect=AssertionError
+        ):
+            second = list(iter_window_stats(datashape, iterator, version="v1"))
+
+    assert [w.category_counts("color").tolist() for w in first] == [
+        w.category_counts("color").tolist() for w in second
+    ]
+
+
+def test_summaries_are_saved_without_pickle(
+    datashape: DataShape, tmp_path: pathlib.Path
+) -> None:
+    df = make_frame(500, 1, **FRAME)
+    df.loc[::9, "x"] = np.nan
+    iterator = DateIterator("1 D", "7 D", "1 D", df, "date")
+    summaries = BucketSummaries(
+        WindowStats(datashape, iterator.df), iterator.df["date"], "1 D", sketch_k=50
+    )
+    path = str(tmp_path / "summaries.npz")
+
+    summaries.save(path)
+    with patch("pickle.loads", side_effect=AssertionError):
+        loaded = BucketSummaries.load(path)
+
+    for start, end in iterator.batches:
+        window, expected = loaded.window(start, end), summaries.window(start, end)
+        np.testing.assert_array_equal(window.histogram("x"), expected.histogram("x"))
+        assert window.mean("x") == expected.mean("x")
+        np.testing.assert_array_equal(
+            window.category_counts("color"), expected.category_counts("color")
+        )
+        assert window.categories["color"].tolist() == (
+            expected.categories["color"].tolist()
+        )
+        np.testing.assert_array_equal(
+            window.quantiles("x", [0.1, 0.5, 0.9]),
+            expected.quantiles("x", [0.1, 0.5, 0.9]),
+        )